@@ -15,5 +15,6 @@ setup(name="vlab-jumpbox-api",
       package_files={'vlab_jumpbox_api' : ['app.ini']},
       description="Create/delete a Jumpbox for connecting to your virtual lab",
       install_requires=['flask', 'ldap3', 'pyjwt', 'uwsgi', 'vlab-api-common',
-                        'ujson', 'cryptography', 'vlab-inf-common', 'celery']
+                        'ujson', 'cryptography', 'vlab-inf-common', 'celery',
+                        'redis', 'requests', 'prometheus_client']
       )
@@ -0,0 +1,338 @@
+# -*- coding: UTF-8 -*-
+"""
+Load test the jumpbox API and workers against a simulated vCenter.
+
+Every request goes through ``JumpboxView``, an in-memory Celery broker and a
+real Celery worker (running in this process), so the numbers include the
+caching, request coalescing, deploy slots and session pooling the service
+does. Only the calls to vCenter are faked, each with a configurable latency.
+
+Usage::
+
+    python benchmark.py --users 20 --concurrency 10 --deploy-latency 2
+
+The report is the throughput, and the p50/p99 latency, of each operation from
+the moment the API is called until the task's result is ready.
+"""
+import sys
+import time
+import logging
+import uuid
+import argparse
+import threading
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch, MagicMock
+
+from celery.contrib.testing.worker import start_worker
+from vlab_api_common.http_auth import generate_test_token
+
+from vlab_jumpbox_api import app as api
+from vlab_jumpbox_api.lib import cache
+from vlab_jumpbox_api.lib.worker import tasks, vmware, provision, networks
+
+
+class FakeTask(object):
+    """A vSphere task that's already done
+
+    :param result: What the task produced
+    :type result: Object
+    """
+    def __init__(self, result=None):
+        self.info = MagicMock()
+        self.info.error = None
+        self.info.result = result
+        self.info.completeTime = time.time()
+        self._moId = 'task-{}'.format(uuid.uuid4().hex[:8])
+
+
+class FakeVM(object):
+    """A booted jumpbox
+
+    :param vcenter: The simulated vCenter the VM lives in
+    :type vcenter: FakeVCenter
+
+    :param username: The user who owns the VM
+    :type username: String
+    """
+    def __init__(self, vcenter, username):
+        self._vcenter = vcenter
+        self._moId = 'vm-{}'.format(uuid.uuid4().hex[:8])
+        self.username = username
+        self.runtime = MagicMock()
+        self.runtime.powerState = 'poweredOn'
+        nic = MagicMock()
+        nic.connected = True
+        nic.ipAddress = ['10.1.1.2']
+        self.guest = MagicMock()
+        self.guest.net = [nic]
+
+    def ReconfigVM_Task(self, spec):
+        """Change the VM's config"""
+        self._vcenter.wait('reconfigure')
+        return FakeTask()
+
+    def CreateSnapshot_Task(self, name, description, memory, quiesce):
+        """Snapshot the VM"""
+        self._vcenter.wait('snapshot')
+        return FakeTask()
+
+    def PowerOffVM_Task(self):
+        """Hard power off the VM"""
+        self._vcenter.wait('power_off')
+        self.runtime.powerState = 'poweredOff'
+        return FakeTask()
+
+    def Destroy_Task(self):
+        """Delete the VM"""
+        self._vcenter.wait('destroy')
+        self._vcenter.remove(self)
+        return FakeTask()
+
+
+class FakeVCenter(object):
+    """Stands in for vCenter, with a configurable latency for each call
+
+    :param latencies: How many seconds each kind of call takes, like ``{'deploy': 2}``
+    :type latencies: Dictionary
+    """
+    DEFAULT_LATENCIES = {'login': 0.05,
+                         'find': 0.05,
+                         'deploy': 1.0,
+                         'reconfigure': 0.1,
+                         'run_command': 0.5,
+                         'get_info': 0.05,
+                         'power_off': 0.2,
+                         'snapshot': 0.3,
+                         'destroy': 0.3}
+
+    def __init__(self, latencies=None):
+        self.latencies = dict(self.DEFAULT_LATENCIES)
+        self.latencies.update(latencies or {})
+        self._vms = {}
+        self._lock = threading.Lock()
+
+    def wait(self, call):
+        """Block for as long as a call to vCenter takes
+
+        :Returns: None
+        """
+        time.sleep(self.latencies.get(call, 0))
+
+    def remove(self, the_vm):
+        """Forget a destroyed VM"""
+        with self._lock:
+            vms = self._vms.get(the_vm.username, [])
+            if the_vm in vms:
+                vms.remove(the_vm)
+
+    def get_user_vms(self, vcenter, username, name):
+        """Simulates ``inventory.get_user_vms``"""
+        self.wait('find')
+        with self._lock:
+            return list(self._vms.get(username, []))
+
+    def import_ova(self, vcenter, ova, network_map, folder, machine_name, shard, power_on=True):
+        """Simulates ``vmware._import_ova``"""
+        self.wait('deploy')
+        the_vm = FakeVM(self, folder)
+        with self._lock:
+            self._vms.setdefault(folder, []).append(the_vm)
+        return the_vm
+
+    def run_command(self, vcenter, the_vm, command, user, password, arguments='', init_timeout=600):
+        """Simulates ``virtual_machine.run_command``"""
+        self.wait('run_command')
+        result = MagicMock()
+        result.exitCode = 0
+        return result
+
+    def get_info(self, vcenter, the_vm):
+        """Simulates ``virtual_machine.get_info``"""
+        self.wait('get_info')
+        return {'state': the_vm.runtime.powerState, 'console': 'https://localhost/console',
+                'ips': ['10.1.1.2'], 'moid': the_vm._moId}
+
+    def install(self, stack):
+        """Replace every call to vCenter with this simulation until the stack is closed
+
+        :Returns: None
+
+        :param stack: What undoes the patches
+        :type stack: contextlib.ExitStack
+        """
+        fake_ova = MagicMock()
+        fake_ova.networks = ['vLabNetwork']
+        fake_ova.deploy_progress = 0
+        fake_ova.bytes_per_second = 0.0
+        pool = MagicMock()
+        pool.session.side_effect = lambda *args, **kwargs: self._session()
+        pool.stats = {}
+        stack.enter_context(patch.object(vmware.sessions, 'pool', pool))
+        stack.enter_context(patch.object(vmware.sessions, 'get_pool', return_value=pool))
+        stack.enter_context(patch.object(vmware.inventory, 'get_user_vms', self.get_user_vms))
+        stack.enter_context(patch.object(vmware.images.catalog, 'open', return_value=fake_ova))
+        stack.enter_context(patch.object(networks.index, 'get', return_value=networks.vim.Network('network-1')))
+        stack.enter_context(patch.object(vmware, '_import_ova', self.import_ova))
+        stack.enter_context(patch.object(vmware.virtual_machine, 'run_command', self.run_command))
+        stack.enter_context(patch.object(vmware.virtual_machine, 'get_info', self.get_info))
+        stack.enter_context(patch.object(provision, '_upload'))
+        stack.enter_context(patch.object(provision, '_download', return_value=''))
+        stack.enter_context(patch.object(vmware.scheduler.scheduler, 'retry_interval', 0.05))
+
+    def _session(self):
+        """A pooled vCenter session"""
+        session = MagicMock()
+        session.__enter__.side_effect = lambda: self.wait('login') or MagicMock()
+        return session
+
+
+def percentile(values, percent):
+    """Obtain the value that ``percent`` of the values are less than or equal to
+
+    :Returns: Float
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(percent / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class Benchmark(object):
+    """Drives the API at a fixed concurrency, and records how long each operation takes
+
+    :param users: How many different users make requests
+    :type users: Integer
+
+    :param concurrency: How many requests are in flight at once
+    :type concurrency: Integer
+
+    :param worker_concurrency: How many tasks the Celery worker runs at once
+    :type worker_concurrency: Integer
+
+    :param latencies: Overrides for how long each simulated vCenter call takes
+    :type latencies: Dictionary
+
+    :param timeout: The most seconds to wait for any one task
+    :type timeout: Integer
+    """
+    def __init__(self, users=10, concurrency=5, worker_concurrency=8, latencies=None, timeout=120):
+        self.users = ['bench{}'.format(x) for x in range(users)]
+        self.concurrency = concurrency
+        self.worker_concurrency = worker_concurrency
+        self.vcenter = FakeVCenter(latencies)
+        self.timeout = timeout
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def run(self, operations=('create', 'show', 'delete')):
+        """Run every operation, for every user, one operation at a time
+
+        :Returns: Dictionary - the report
+        """
+        with ExitStack() as stack:
+            self._setup(stack)
+            for operation in operations:
+                start = time.time()
+                with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                    list(executor.map(lambda x: self._request(operation, x), self.users))
+                with self._lock:
+                    self.samples.setdefault(operation, {'latencies': [], 'errors': 0})
+                    self.samples[operation]['elapsed'] = time.time() - start
+        return self.report()
+
+    def report(self):
+        """Summarize the throughput and latency of each operation
+
+        :Returns: Dictionary
+        """
+        summary = {}
+        for operation, sample in self.samples.items():
+            latencies = sample['latencies']
+            summary[operation] = {'requests': len(latencies),
+                                  'errors': sample['errors'],
+                                  'throughput': len(latencies) / sample['elapsed'] if sample['elapsed'] else 0.0,
+                                  'p50': percentile(latencies, 50),
+                                  'p99': percentile(latencies, 99)}
+        return summary
+
+    def _setup(self, stack):
+        """Start an in-memory broker & worker, and point the API at them"""
+        settings = {'broker_url': 'memory://',
+                    'broker_transport_options': {'polling_interval': 0.01},
+                    'result_backend': 'cache+memory://',
+                    'broker_heartbeat': None}
+        stack.callback(tasks.app.conf.update, {x: tasks.app.conf[x] for x in settings})
+        tasks.app.conf.update(settings)
+        stack.enter_context(patch.object(cache, 'backend', cache.MemoryBackend()))
+        stack.enter_context(patch.object(tasks.metrics, 'start_exporter'))
+        stack.enter_context(patch.object(tasks.images.catalog, 'index', return_value=[]))
+        stack.enter_context(patch.object(api.app, 'celery_app', tasks.app))
+        self.vcenter.install(stack)
+        stack.enter_context(start_worker(tasks.app,
+                                         concurrency=self.worker_concurrency,
+                                         pool='threads',
+                                         perform_ping_check=False,
+                                         queues=[x.name for x in tasks.app.conf.task_queues]))
+
+    def _request(self, operation, username):
+        """Make one API call, and wait for its task to finish
+
+        :Returns: None
+        """
+        token = generate_test_token(username=username)
+        client = api.app.test_client()
+        start = time.time()
+        error = False
+        if operation == 'create':
+            resp = client.post('/api/1/inf/jumpbox', headers={'X-Auth': token}, json={'network': 'vLabNetwork'})
+        elif operation == 'delete':
+            resp = client.delete('/api/1/inf/jumpbox', headers={'X-Auth': token})
+        else:
+            resp = client.get('/api/1/inf/jumpbox', headers={'X-Auth': token})
+        if resp.status_code == 202:
+            result = tasks.app.AsyncResult(resp.json['content']['task-id'])
+            try:
+                error = bool(result.get(timeout=self.timeout, interval=0.01)['error'])
+            except Exception:
+                error = True
+        elif resp.status_code != 200:
+            error = True
+        elapsed = time.time() - start
+        with self._lock:
+            sample = self.samples.setdefault(operation, {'latencies': [], 'errors': 0})
+            sample['latencies'].append(elapsed)
+            sample['errors'] += int(error)
+
+
+def main(argv=None):
+    """Run the benchmark from the command line
+
+    :Returns: Integer - the exit code
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=10, help='How many users make requests')
+    parser.add_argument('--concurrency', type=int, default=5, help='How many requests are in flight at once')
+    parser.add_argument('--worker-concurrency', type=int, default=8, help='How many tasks the worker runs at once')
+    for call, latency in sorted(FakeVCenter.DEFAULT_LATENCIES.items()):
+        parser.add_argument('--{}-latency'.format(call.replace('_', '-')), type=float, default=latency,
+                            help='Seconds a simulated {} takes'.format(call))
+    args = parser.parse_args(argv)
+    # The per-task log lines would drown out the report
+    logging.disable(logging.INFO)
+    latencies = {x: getattr(args, '{}_latency'.format(x)) for x in FakeVCenter.DEFAULT_LATENCIES}
+    benchmark = Benchmark(users=args.users,
+                          concurrency=args.concurrency,
+                          worker_concurrency=args.worker_concurrency,
+                          latencies=latencies)
+    report = benchmark.run()
+    print('{:<10}{:>10}{:>8}{:>14}{:>10}{:>10}'.format('operation', 'requests', 'errors', 'req/sec', 'p50', 'p99'))
+    for operation, stats in report.items():
+        print('{:<10}{:>10}{:>8}{:>14.2f}{:>10.3f}{:>10.3f}'.format(operation, stats['requests'], stats['errors'],
+                                                                  stats['throughput'], stats['p50'], stats['p99']))
+    return int(any(x['errors'] for x in report.values()))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+# -*- coding: UTF-8 -*-
+"""
+Measure how long the API takes to import, and how much memory it holds once
+it has, in a fresh interpreter like a newly (re)spawned uwsgi worker.
+
+The API only sends Celery tasks, so it must never load the worker code or the
+pyVmomi type system that comes with it. Any of ``FORBIDDEN_MODULES`` being
+imported, or going over the time or memory budget, fails the run.
+
+Usage::
+
+    python startup.py --max-seconds 3 --max-rss-mb 80
+
+The unit tests only check the budget when ``VLAB_JUMPBOX_STARTUP_BUDGET`` is
+set, since how long an import takes depends on the machine.
+"""
+import sys
+import json
+import argparse
+import subprocess
+
+
+# Only the backend workers talk to vCenter
+FORBIDDEN_MODULES = ('pyVmomi', 'pyVim', 'vlab_inf_common.vmware', 'vlab_jumpbox_api.lib.worker')
+MAX_IMPORT_SECONDS = 3.0
+MAX_RSS_MB = 80
+
+# The peak RSS from getrusage can include the parent's memory from before the
+# exec, so the current RSS is read from /proc when there is one
+_PROBE = """
+import sys, json, time, resource
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+try:
+    with open('/proc/self/status') as status:
+        rss_kb = [int(x.split()[1]) for x in status if x.startswith('VmRSS:')][0]
+except (OSError, IndexError):
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{'seconds': elapsed,
+                  'rss_mb': rss_kb / 1024.0,
+                  'modules': sorted(sys.modules)}}))
+"""
+
+
+def measure(module='vlab_jumpbox_api.app'):
+    """Import a module in a new Python process, and report what it cost
+
+    :Returns: Dictionary
+
+    :param module: The module to import
+    :type module: String
+    """
+    output = subprocess.check_output([sys.executable, '-c', _PROBE.format(module=module)])
+    # Whatever the module logs on import comes before the report
+    report = json.loads(output.decode().strip().split('\n')[-1])
+    report['forbidden'] = [x for x in report.pop('modules') if x.startswith(FORBIDDEN_MODULES)]
+    return report
+
+
+def check(report, max_seconds=MAX_IMPORT_SECONDS, max_rss_mb=MAX_RSS_MB):
+    """Find everything about a startup report that's over budget
+
+    :Returns: List of Strings
+
+    :param report: The output of ``measure``
+    :type report: Dictionary
+
+    :param max_seconds: The longest the import can take
+    :type max_seconds: Float
+
+    :param max_rss_mb: The most memory the process can hold after the import
+    :type max_rss_mb: Float
+    """
+    problems = []
+    if report['forbidden']:
+        problems.append('Imported {}'.format(', '.join(report['forbidden'])))
+    if report['seconds'] > max_seconds:
+        problems.append('Import took {:.2f}s, the budget is {:.2f}s'.format(report['seconds'], max_seconds))
+    if report['rss_mb'] > max_rss_mb:
+        problems.append('RSS is {:.1f}MB, the budget is {:.1f}MB'.format(report['rss_mb'], max_rss_mb))
+    return problems
+
+
+def main(argv=None):
+    """Run the startup benchmark from the command line
+
+    :Returns: Integer - the exit code
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--module', default='vlab_jumpbox_api.app', help='The module the web server loads')
+    parser.add_argument('--max-seconds', type=float, default=MAX_IMPORT_SECONDS, help='Import time budget')
+    parser.add_argument('--max-rss-mb', type=float, default=MAX_RSS_MB, help='Per-worker memory budget')
+    args = parser.parse_args(argv)
+    report = measure(args.module)
+    print('import: {:.3f}s  rss: {:.1f}MB'.format(report['seconds'], report['rss_mb']))
+    problems = check(report, args.max_seconds, args.max_rss_mb)
+    for problem in problems:
+        print(problem)
+    return int(bool(problems))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in aio.py, run against a fake vCenter
+"""
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_jumpbox_api.lib.worker import aio
+
+
+class FakeTask(object):
+    """A vSphere Task that completes after being checked a few times"""
+    def __init__(self, polls=2, error=None, result=None):
+        self._polls = polls
+        self._error = error
+        self._result = result
+
+    @property
+    def info(self):
+        info = MagicMock()
+        self._polls -= 1
+        info.completeTime = 'now' if self._polls <= 0 else None
+        info.error = self._error
+        info.result = self._result
+        return info
+
+
+class FakeVM(object):
+    """A VM that records the operations run against it"""
+    def __init__(self, name='jumpBox', power_state='poweredOn'):
+        self.name = name
+        self.runtime = MagicMock()
+        self.runtime.powerState = power_state
+        self.calls = []
+
+    def PowerOffVM_Task(self):
+        self.calls.append('power_off')
+        return FakeTask()
+
+    def Destroy_Task(self):
+        self.calls.append('destroy')
+        return FakeTask()
+
+
+class FakeVCenter(object):
+    """Just enough of vCenter to find a user's VMs"""
+    def __init__(self, labs):
+        self.labs = labs
+
+    def get_user_vms(self, vcenter, username, name):
+        if username not in self.labs:
+            raise ValueError('Unable to locate object named {}'.format(username))
+        return [x for x in self.labs[username] if x.name == name]
+
+
+class TestAio(unittest.TestCase):
+    """A set of test cases for the aio.py module"""
+    @classmethod
+    def setUpClass(cls):
+        aio.logger = MagicMock()
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.alice_vm = FakeVM()
+        self.sam_vm = FakeVM(power_state='poweredOff')
+        self.vcenter = FakeVCenter({'alice': [self.alice_vm, FakeVM(name='someOtherVM')],
+                                    'sam': [self.sam_vm]})
+        self.patcher = patch.object(aio.inventory, 'get_user_vms', self.vcenter.get_user_vms)
+        self.patcher.start()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        """Runs after every test case"""
+        self.patcher.stop()
+        self.loop.close()
+
+    def _run(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    @patch.object(aio.virtual_machine, 'get_info')
+    def test_show_jumpbox(self, fake_get_info):
+        """``show_jumpbox`` returns the info about the user's jumpbox"""
+        fake_get_info.return_value = {'worked': True}
+
+        output = self._run(aio.show_jumpbox(self.vcenter, 'alice'))
+
+        self.assertEqual(output, {'worked': True})
+
+    def test_show_jumpbox_nothing(self):
+        """``show_jumpbox`` returns an empty dictionary if the user has no jumpbox"""
+        self.vcenter.labs['alice'] = []
+
+        output = self._run(aio.show_jumpbox(self.vcenter, 'alice'))
+
+        self.assertEqual(output, {})
+
+    def test_consume_task(self):
+        """``consume_task`` returns the result of the task"""
+        task = FakeTask(polls=3, result='done')
+
+        output = self._run(aio.consume_task(task, interval=0))
+
+        self.assertEqual(output, 'done')
+
+    def test_consume_task_error(self):
+        """``consume_task`` raises RuntimeError if the task failed"""
+        error = MagicMock()
+        error.msg = 'testing'
+        task = FakeTask(polls=1, error=error)
+
+        with self.assertRaises(RuntimeError):
+            self._run(aio.consume_task(task, interval=0))
+
+    def test_consume_task_timeout(self):
+        """``consume_task`` raises RuntimeError if the task takes too long"""
+        task = FakeTask(polls=1000)
+
+        with self.assertRaises(RuntimeError):
+            self._run(aio.consume_task(task, timeout=0.01, interval=0.005))
+
+    @patch.object(aio, 'POLL_INTERVAL', 0)
+    def test_delete_jumpbox(self):
+        """``delete_jumpbox`` powers off the VM, then destroys it"""
+
+        self._run(aio.delete_jumpbox(self.vcenter, 'alice'))
+
+        self.assertEqual(self.alice_vm.calls, ['power_off', 'destroy'])
+
+    @patch.object(aio, 'POLL_INTERVAL', 0)
+    @patch.object(aio, 'placement')
+    def test_delete_jumpbox_release(self, fake_placement):
+        """``delete_jumpbox`` frees the user's spot on their shard off the event loop"""
+        threads = []
+        fake_placement.ring.release.side_effect = lambda username: threads.append(threading.get_ident())
+
+        self._run(aio.delete_jumpbox(self.vcenter, 'alice'))
+
+        fake_placement.ring.release.assert_called_with('alice')
+        self.assertNotEqual(threads, [threading.get_ident()])
+
+    @patch.object(aio, 'POLL_INTERVAL', 0)
+    def test_delete_jumpbox_powered_off(self):
+        """``delete_jumpbox`` skips the power off if the VM is already off"""
+
+        self._run(aio.delete_jumpbox(self.vcenter, 'sam'))
+
+        self.assertEqual(self.sam_vm.calls, ['destroy'])
+
+    @patch.object(aio, 'POLL_INTERVAL', 0)
+    def test_bulk_delete(self):
+        """``bulk_delete`` deletes every user's jumpbox, recording errors per user"""
+
+        output = self._run(aio.bulk_delete(self.vcenter, ['alice', 'sam', 'pat']))
+
+        self.assertEqual(output['alice'], {'content': None, 'error': None})
+        self.assertEqual(output['sam'], {'content': None, 'error': None})
+        self.assertEqual(output['pat']['error'], 'Unable to locate object named pat')
+
+    @patch.object(aio, 'cache')
+    @patch.object(aio, 'POLL_INTERVAL', 0)
+    def test_bulk_delete_locks(self, fake_cache):
+        """``bulk_delete`` holds each user's lock while deleting their jumpbox"""
+        fake_cache.acquire_user_lock.return_value = 'token'
+
+        self._run(aio.bulk_delete(self.vcenter, ['alice']))
+
+        fake_cache.acquire_user_lock.assert_called_with('alice')
+        fake_cache.release_user_lock.assert_called_with('alice', 'token')
+
+    @patch.object(aio, 'sessions')
+    def test_run(self, fake_sessions):
+        """``run`` supplies a pooled session to the coroutine"""
+        fake_vcenter = fake_sessions.get_pool.return_value.session.return_value.__enter__.return_value
+
+        async def echo(vcenter, value):
+            return vcenter, value
+
+        output = aio.run(echo, 'foo')
+
+        self.assertEqual(output, (fake_vcenter, 'foo'))
+
+
+if __name__ == '__main__':
+    unittest.main()
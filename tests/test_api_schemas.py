@@ -63,6 +63,37 @@ class TestJumpboxViewSchema(unittest.TestCase):
 
         self.assertTrue(network_required)
 
+    def test_bulk_post_schema(self):
+        """The schema defined for POST on /bulk is valid"""
+        try:
+            Draft4Validator.check_schema(jumpbox.JumpboxView.BULK_POST_SCHEMA)
+            schema_valid = True
+        except RuntimeError:
+            schema_valid = False
+
+        self.assertTrue(schema_valid)
+
+    def test_bulk_delete_schema(self):
+        """The schema defined for DELETE on /bulk is valid"""
+        try:
+            Draft4Validator.check_schema(jumpbox.JumpboxView.BULK_DELETE_SCHEMA)
+            schema_valid = True
+        except RuntimeError:
+            schema_valid = False
+
+        self.assertTrue(schema_valid)
+
+    def test_bulk_post_network_required(self):
+        """POST on /bulk requires a network for every jumpbox"""
+        body = {'jumpboxes': [{'username': 'alice'}]}
+        try:
+            validate(body, jumpbox.JumpboxView.BULK_POST_SCHEMA)
+            network_required = False
+        except ValidationError:
+            network_required = True
+
+        self.assertTrue(network_required)
+
 
 if __name__ == '__main__':
     unittest.main()
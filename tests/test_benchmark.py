@@ -0,0 +1,36 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of unit tests for the benchmark harness
+"""
+import unittest
+
+import benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+    """A set of test cases for the Benchmark object"""
+
+    def test_run(self):
+        """``Benchmark.run`` reports the throughput and latency of every operation"""
+        latencies = {x: 0 for x in benchmark.FakeVCenter.DEFAULT_LATENCIES}
+        bench = benchmark.Benchmark(users=2, concurrency=2, worker_concurrency=2, latencies=latencies, timeout=30)
+
+        report = bench.run()
+
+        self.assertEqual(set(report.keys()), {'create', 'show', 'delete'})
+        for stats in report.values():
+            self.assertEqual(stats['requests'], 2)
+            self.assertEqual(stats['errors'], 0)
+            self.assertTrue(stats['p99'] >= stats['p50'])
+
+    def test_percentile(self):
+        """``percentile`` picks the value at the supplied percent"""
+        values = list(range(1, 101))
+
+        self.assertEqual(benchmark.percentile(values, 50), 50)
+        self.assertEqual(benchmark.percentile(values, 99), 99)
+        self.assertEqual(benchmark.percentile([], 99), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,316 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in cache.py
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_jumpbox_api.lib import cache
+
+
+class TestMemoryBackend(unittest.TestCase):
+    """A set of test cases for the MemoryBackend object"""
+    def setUp(self):
+        """Runs before every test case"""
+        self.backend = cache.MemoryBackend()
+
+    def test_get(self):
+        """``MemoryBackend.get`` returns what was set"""
+        self.backend.set('foo', 'bar', ttl=30)
+
+        self.assertEqual(self.backend.get('foo'), 'bar')
+
+    def test_get_missing(self):
+        """``MemoryBackend.get`` returns None for unknown keys"""
+        self.assertTrue(self.backend.get('foo') is None)
+
+    def test_get_expired(self):
+        """``MemoryBackend.get`` returns None for expired keys"""
+        self.backend.set('foo', 'bar', ttl=-1)
+
+        self.assertTrue(self.backend.get('foo') is None)
+
+    def test_add(self):
+        """``MemoryBackend.add`` only sets keys that do not exist"""
+        first = self.backend.add('foo', 'bar', ttl=30)
+        second = self.backend.add('foo', 'baz', ttl=30)
+
+        self.assertTrue(first)
+        self.assertFalse(second)
+        self.assertEqual(self.backend.get('foo'), 'bar')
+
+    def test_add_expired(self):
+        """``MemoryBackend.add`` replaces expired keys"""
+        self.backend.set('foo', 'bar', ttl=-1)
+
+        self.assertTrue(self.backend.add('foo', 'baz', ttl=30))
+
+    def test_incr(self):
+        """``MemoryBackend.incr`` returns the new value of the counter"""
+        self.backend.incr('foo', 1, ttl=30)
+        output = self.backend.incr('foo', 2, ttl=30)
+
+        self.assertEqual(output, 3)
+
+    def test_incr_expired(self):
+        """``MemoryBackend.incr`` restarts expired counters from zero"""
+        self.backend.incr('foo', 5, ttl=-1)
+        output = self.backend.incr('foo', 1, ttl=30)
+
+        self.assertEqual(output, 1)
+
+    def test_delete(self):
+        """``MemoryBackend.delete`` removes the key"""
+        self.backend.set('foo', 'bar', ttl=30)
+        self.backend.delete('foo')
+
+        self.assertTrue(self.backend.get('foo') is None)
+
+    def test_delete_if(self):
+        """``MemoryBackend.delete_if`` removes the key when the value matches"""
+        self.backend.set('foo', 'bar', ttl=30)
+
+        self.assertTrue(self.backend.delete_if('foo', 'bar'))
+        self.assertTrue(self.backend.get('foo') is None)
+
+    def test_delete_if_changed(self):
+        """``MemoryBackend.delete_if`` leaves the key alone when the value changed"""
+        self.backend.set('foo', 'baz', ttl=30)
+
+        self.assertFalse(self.backend.delete_if('foo', 'bar'))
+        self.assertEqual(self.backend.get('foo'), 'baz')
+
+
+class TestCache(unittest.TestCase):
+    """A set of test cases for the cache.py module"""
+    def test_get_backend_memory(self):
+        """``get_backend`` uses memory when no URL is supplied"""
+        output = cache.get_backend('')
+
+        self.assertTrue(isinstance(output, cache.MemoryBackend))
+
+    @patch.object(cache, 'RedisBackend')
+    def test_get_backend_redis(self, fake_RedisBackend):
+        """``get_backend`` uses Redis for redis:// URLs"""
+        output = cache.get_backend('redis://localhost')
+
+        self.assertTrue(output is fake_RedisBackend.return_value)
+
+    @patch.object(cache, 'RedisBackend')
+    def test_get_backend_no_redis(self, fake_RedisBackend):
+        """``get_backend`` falls back to memory if the redis library is not installed"""
+        fake_RedisBackend.side_effect = ImportError('testing')
+
+        output = cache.get_backend('redis://localhost')
+
+        self.assertTrue(isinstance(output, cache.MemoryBackend))
+
+    @patch.object(cache, 'backend', new_callable=cache.MemoryBackend)
+    def test_show(self, fake_backend):
+        """``get_show`` returns what ``set_show`` stored"""
+        cache.set_show('bob', {'state': 'poweredOn'})
+
+        self.assertEqual(cache.get_show('bob'), {'state': 'poweredOn'})
+
+    @patch.object(cache, 'backend', new_callable=cache.MemoryBackend)
+    def test_invalidate_show(self, fake_backend):
+        """``invalidate_show`` discards the cached entry"""
+        cache.set_show('bob', {'state': 'poweredOn'})
+        cache.invalidate_show('bob')
+
+        self.assertTrue(cache.get_show('bob') is None)
+
+    @patch.object(cache, 'backend', new_callable=cache.MemoryBackend)
+    def test_networks(self, fake_backend):
+        """``get_networks`` returns the names ``set_networks`` published"""
+        cache.set_networks(['someNetwork', 'otherNetwork'])
+
+        self.assertEqual(cache.get_networks(), {'someNetwork', 'otherNetwork'})
+
+    @patch.object(cache, 'backend', new_callable=cache.MemoryBackend)
+    def test_networks_per_server(self, fake_backend):
+        """``get_networks`` only returns the names published for that vCenter"""
+        cache.set_networks(['someNetwork'], 'vc-east')
+
+        self.assertTrue(cache.get_networks('vc-west') is None)
+
+    @patch.object(cache, 'backend', new_callable=cache.MemoryBackend)
+    def test_networks_unknown(self, fake_backend):
+        """``get_networks`` returns None when no worker has published the names"""
+        self.assertTrue(cache.get_networks() is None)
+
+    @patch.object(cache, 'backend', new_callable=cache.MemoryBackend)
+    def test_idle_policy(self, fake_backend):
+        """``get_idle_policy`` returns what ``set_idle_policy`` stored"""
+        cache.set_idle_policy('bob', 600)
+
+        self.assertEqual(cache.get_idle_policy('bob'), 600)
+
+    @patch.object(cache, 'backend', new_callable=cache.MemoryBackend)
+    def test_idle_policy_unset(self, fake_backend):
+        """``get_idle_policy`` returns None when the user hasn't chosen a policy"""
+        self.assertEqual(cache.get_idle_policy('bob'), None)
+
+    @patch.object(cache, 'backend', new_callable=cache.MemoryBackend)
+    def test_mark_idle(self, fake_backend):
+        """``mark_idle`` keeps when the jumpbox was first seen idle"""
+        cache.mark_idle('bob', 100.0)
+
+        self.assertEqual(cache.mark_idle('bob', 200.0), 100.0)
+
+    @patch.object(cache, 'backend', new_callable=cache.MemoryBackend)
+    def test_clear_idle(self, fake_backend):
+        """``clear_idle`` starts the idle clock over"""
+        cache.mark_idle('bob', 100.0)
+        cache.clear_idle('bob')
+
+        self.assertEqual(cache.mark_idle('bob', 200.0), 200.0)
+
+    def test_take_slots(self):
+        """``MemoryBackend.take_slots`` takes a slot under every limit, or none of them"""
+        backend = cache.MemoryBackend()
+        backend.take_slots('bob', [('b', 1)], 60, 60)
+
+        output = backend.take_slots('alice', [('a', 1), ('b', 1)], 60, 60)
+
+        self.assertFalse(output)
+        self.assertEqual(backend.count_slots('a'), 0)
+
+    @patch.object(cache.time, 'time')
+    def test_take_slots_expire(self, fake_time):
+        """``MemoryBackend.take_slots`` frees each holder's slot when it expires"""
+        backend = cache.MemoryBackend()
+        fake_time.return_value = 0
+        backend.take_slots('bob', [('a', 1)], 60, 60)
+        backend.take_slots('sam', [('a', 2)], 600, 60)
+        fake_time.return_value = 100
+
+        self.assertEqual(backend.count_slots('a'), 1)
+
+    def test_take_slots_queue(self):
+        """``MemoryBackend.take_slots`` doesn't let a holder take a slot ahead of one that's waiting"""
+        backend = cache.MemoryBackend()
+        backend.take_slots('bob', [('a', 1)], 60, 60)
+        backend.take_slots('alice', [('a', 1)], 60, 60)
+        backend.release_slots('bob', ['a'])
+
+        self.assertFalse(backend.take_slots('sam', [('a', 1)], 60, 60))
+        self.assertTrue(backend.take_slots('alice', [('a', 1)], 60, 60))
+
+    def test_take_slots_no_queue(self):
+        """``MemoryBackend.take_slots`` doesn't hold a place in line with ``queue=False``"""
+        backend = cache.MemoryBackend()
+        backend.take_slots('bob', [('a', 1)], 60, 60)
+        backend.take_slots('alice', [('a', 1)], 60, 60, queue=False)
+        backend.release_slots('bob', ['a'])
+
+        self.assertTrue(backend.take_slots('sam', [('a', 1)], 60, 60))
+
+    def test_take_slots_no_queue_waiting(self):
+        """``MemoryBackend.take_slots`` with ``queue=False`` doesn't take a slot someone is waiting for"""
+        backend = cache.MemoryBackend()
+        backend.take_slots('bob', [('a', 1)], 60, 60)
+        backend.take_slots('alice', [('a', 1)], 60, 60)
+        backend.release_slots('bob', ['a'])
+
+        self.assertFalse(backend.take_slots('sam', [('a', 1)], 60, 60, queue=False))
+
+    def test_redis_take_slots_down(self):
+        """``RedisBackend.take_slots`` gives out no slots while Redis is down"""
+        backend = cache.RedisBackend.__new__(cache.RedisBackend)
+        backend._errors = (RuntimeError,)
+        backend._client = MagicMock()
+        backend._client.eval.side_effect = RuntimeError('testing')
+
+        self.assertFalse(backend.take_slots('alice', [('a', 1)], 60, 60))
+
+    @patch.object(cache, 'backend', new_callable=cache.MemoryBackend)
+    def test_vcenter_status(self, fake_backend):
+        """``get_vcenter_status`` returns what ``set_vcenter_status`` published"""
+        cache.set_vcenter_status('vc1', {'ok': True}, 30)
+
+        self.assertEqual(cache.get_vcenter_status('vc1'), {'ok': True})
+        self.assertEqual(cache.get_vcenter_status('vc2'), None)
+
+    @patch.object(cache, 'backend', new_callable=cache.MemoryBackend)
+    def test_claim_task(self, fake_backend):
+        """``claim_task`` returns None when no equivalent task is in flight"""
+        self.assertTrue(cache.claim_task('bob', 'create', 'task-1') is None)
+
+    @patch.object(cache, 'backend', new_callable=cache.MemoryBackend)
+    def test_claim_task_duplicate(self, fake_backend):
+        """``claim_task`` returns the id of the task already in flight"""
+        cache.claim_task('bob', 'create', 'task-1')
+
+        self.assertEqual(cache.claim_task('bob', 'create', 'task-2'), 'task-1')
+
+    @patch.object(cache, 'backend', new_callable=cache.MemoryBackend)
+    def test_claim_task_finished(self, fake_backend):
+        """``claim_task`` replaces an in flight task that's already done"""
+        cache.claim_task('bob', 'create', 'task-1')
+
+        output = cache.claim_task('bob', 'create', 'task-2', finished=lambda x: x == 'task-1')
+
+        self.assertEqual(output, None)
+        self.assertEqual(cache.claim_task('bob', 'create', 'task-3'), 'task-2')
+
+    @patch.object(cache, 'backend', new_callable=cache.MemoryBackend)
+    def test_claim_task_released(self, fake_backend):
+        """``claim_task`` records a new task once the last one was released"""
+        cache.claim_task('bob', 'create', 'task-1')
+        cache.release_task('bob', 'create')
+
+        self.assertTrue(cache.claim_task('bob', 'create', 'task-2') is None)
+
+    @patch.object(cache, 'backend', new_callable=cache.MemoryBackend)
+    def test_claim_task_idempotency_key(self, fake_backend):
+        """``claim_task`` maps a reused Idempotency-Key to the original task, even after it finished"""
+        cache.claim_task('bob', 'create', 'task-1', idempotency_key='abc')
+        cache.release_task('bob', 'create')
+
+        self.assertEqual(cache.claim_task('bob', 'create', 'task-2', idempotency_key='abc'), 'task-1')
+
+    @patch.object(cache, 'backend', new_callable=cache.MemoryBackend)
+    def test_user_lock(self, fake_backend):
+        """``user_lock`` releases the lock when the block exits"""
+        with cache.user_lock('bob'):
+            pass
+
+        self.assertTrue(fake_backend.add('jumpbox:lock:bob', 'locked', 10))
+
+    @patch.object(cache, 'backend', new_callable=cache.MemoryBackend)
+    def test_user_lock_expired(self, fake_backend):
+        """``user_lock`` doesn't release another worker's lock when its own expired"""
+        with cache.user_lock('bob'):
+            # The lock's TTL ran out, and another worker took it
+            fake_backend.set('jumpbox:lock:bob', 'other-token', 10)
+
+        self.assertEqual(fake_backend.get('jumpbox:lock:bob'), 'other-token')
+
+    @patch.object(cache, 'backend', new_callable=cache.MemoryBackend)
+    def test_user_lock_timeout(self, fake_backend):
+        """``user_lock`` raises ValueError if another worker holds the lock too long"""
+        fake_backend.add('jumpbox:lock:bob', 'locked', 10)
+
+        with self.assertRaises(ValueError):
+            with cache.user_lock('bob', timeout=0, poll_interval=0):
+                pass
+
+
+    @patch.object(cache, 'backend', new_callable=cache.MemoryBackend)
+    def test_try_user_lock(self, fake_backend):
+        """``try_user_lock`` returns a token that releases the lock"""
+        token = cache.try_user_lock('bob')
+        cache.release_user_lock('bob', token)
+
+        self.assertTrue(fake_backend.add('jumpbox:lock:bob', 'locked', 10))
+
+    @patch.object(cache, 'backend', new_callable=cache.MemoryBackend)
+    def test_try_user_lock_held(self, fake_backend):
+        """``try_user_lock`` returns None without waiting when another worker holds the lock"""
+        fake_backend.add('jumpbox:lock:bob', 'locked', 10)
+
+        self.assertTrue(cache.try_user_lock('bob') is None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of unit tests for the celery_config.py module
+"""
+import shutil
+import tempfile
+import unittest
+
+from celery import Celery
+
+from vlab_jumpbox_api.lib import celery_config
+
+
+class TestCeleryConfig(unittest.TestCase):
+    """A set of test cases for the shared Celery settings"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.results_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.results_dir)
+
+    def _make_app(self):
+        """Create a Celery app like the API and worker do, but with a file result backend"""
+        app = Celery('jumpbox')
+        app.config_from_object(celery_config)
+        app.conf.result_backend = 'file://{}'.format(self.results_dir)
+        return app
+
+    def test_settings(self):
+        """``celery_config`` sets the broker, result backend and result expiry"""
+        app = Celery('jumpbox')
+        app.config_from_object(celery_config)
+
+        self.assertEqual(app.conf.broker_url, celery_config.broker_url)
+        self.assertEqual(app.conf.result_backend, celery_config.result_backend)
+        self.assertEqual(app.conf.result_expires, celery_config.result_expires)
+
+    def test_routes(self):
+        """``celery_config`` routes show, create and delete to their own queues"""
+        app = self._make_app()
+
+        queues = {x: app.amqp.router.route({}, x)['queue'].name for x in ('jumpbox.show', 'jumpbox.create', 'jumpbox.delete')}
+        expected = {'jumpbox.show': 'jumpbox-show', 'jumpbox.create': 'jumpbox-create', 'jumpbox.delete': 'jumpbox-delete'}
+
+        self.assertEqual(queues, expected)
+
+    def test_show_priority(self):
+        """``celery_config`` gives jumpbox.show the highest priority"""
+        app = self._make_app()
+
+        route = app.amqp.router.route({}, 'jumpbox.show')
+
+        self.assertEqual(route['priority'], celery_config.MAX_PRIORITY)
+
+    def test_every_task_routed(self):
+        """``celery_config`` has a route for every task the worker defines"""
+        from vlab_jumpbox_api.lib.worker import tasks
+        names = {x for x in tasks.app.tasks if x.startswith('jumpbox.')}
+
+        self.assertEqual(names - set(celery_config.task_routes), set())
+
+    def test_priority_queues(self):
+        """``celery_config`` declares every queue with a max priority"""
+        for queue in celery_config.task_queues:
+            self.assertEqual(queue.queue_arguments['x-max-priority'], celery_config.MAX_PRIORITY)
+
+    def test_shared_results(self):
+        """``celery_config`` lets one process read the result of a task another process ran"""
+        worker = self._make_app()
+        api = self._make_app()
+        worker.backend.store_result('some-task-id', {'content': {}, 'error': None, 'params': {}}, 'SUCCESS')
+
+        result = api.AsyncResult('some-task-id')
+
+        self.assertEqual(result.status, 'SUCCESS')
+        self.assertEqual(result.result['error'], None)
+
+    def test_pending(self):
+        """``celery_config`` reports an unknown task as PENDING without blocking"""
+        api = self._make_app()
+
+        result = api.AsyncResult('not-a-task-id')
+
+        self.assertEqual(result.status, 'PENDING')
+
+
+if __name__ == '__main__':
+    unittest.main()
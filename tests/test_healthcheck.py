@@ -21,7 +21,17 @@ class TestHealthView(unittest.TestCase):
         app = Flask(__name__)
         healthcheck.HealthView.register(app)
         app.config['TESTING'] = True
+        app.celery_app = MagicMock()
         cls.app = app.test_client()
+        # Never start probing the real dependencies
+        cls.monitor_patcher = patch.object(healthcheck.readiness, 'get_monitor')
+        cls.fake_get_monitor = cls.monitor_patcher.start()
+        cls.fake_get_monitor.return_value.status.return_value = (True, {'broker': {'ok': True}})
+
+    @classmethod
+    def tearDown(cls):
+        """Runs after every test case"""
+        cls.monitor_patcher.stop()
 
     def test_get(self):
         """HealthView for /api/1/inf/vlan/heathcheck supports GET"""
@@ -31,6 +41,36 @@ class TestHealthView(unittest.TestCase):
 
         self.assertEqual(resp.status_code, expected)
 
+    def test_get_version(self):
+        """HealthView - GET on /api/1/inf/jumpbox/healthcheck returns the version looked up at startup"""
+        resp = self.app.get('/api/1/inf/jumpbox/healthcheck')
+
+        self.assertEqual(resp.json['version'], healthcheck.readiness.VERSION)
+
+    def test_get_not_ready(self):
+        """HealthView - GET on /api/1/inf/jumpbox/healthcheck is 200 even when a dependency is down"""
+        self.fake_get_monitor.return_value.status.return_value = (False, {'broker': {'ok': False}})
+
+        resp = self.app.get('/api/1/inf/jumpbox/healthcheck')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(resp.json['ready'])
+
+    def test_ready(self):
+        """HealthView - GET on /api/1/inf/jumpbox/healthcheck/ready returns the cached dependency results"""
+        resp = self.app.get('/api/1/inf/jumpbox/healthcheck/ready')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json['dependencies'], {'broker': {'ok': True}})
+
+    def test_ready_not_ready(self):
+        """HealthView - GET on /api/1/inf/jumpbox/healthcheck/ready is 503 when a dependency is down"""
+        self.fake_get_monitor.return_value.status.return_value = (False, {'broker': {'ok': False}})
+
+        resp = self.app.get('/api/1/inf/jumpbox/healthcheck/ready')
+
+        self.assertEqual(resp.status_code, 503)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,186 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of unit tests for the images.py module
+"""
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_jumpbox_api.lib.worker import images
+
+
+OVF = '<Envelope><NetworkSection><Network ovf:name="vLabNetwork"></Network></NetworkSection></Envelope>'
+DISK = b'0123456789' * 100
+
+
+def _make_ova(path, disk=DISK):
+    """Write a tiny OVA file"""
+    with tarfile.open(path, 'w') as the_tar:
+        for name, data in (('jumpBox.ovf', OVF.encode()), ('jumpBox-disk1.vmdk', disk)):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            the_tar.addfile(info, io.BytesIO(data))
+
+
+class TestImageCatalog(unittest.TestCase):
+    """A set of test cases for the ImageCatalog object"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.images_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.images_dir, 'jumpBox.ova')
+        _make_ova(self.path)
+        self.catalog = images.ImageCatalog(self.images_dir)
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.images_dir)
+
+    def test_index(self):
+        """``ImageCatalog.index`` returns the names of every OVA"""
+        with open(os.path.join(self.images_dir, 'README'), 'w') as the_file:
+            the_file.write('not an image')
+
+        self.assertEqual(self.catalog.index(), ['jumpBox.ova'])
+
+    def test_open(self):
+        """``ImageCatalog.open`` returns an Ova with the networks and disks of the image"""
+        ova = self.catalog.open('jumpBox.ova')
+
+        self.assertEqual(ova.networks, ['vLabNetwork'])
+        self.assertEqual(ova.vmdks, ['jumpBox-disk1.vmdk'])
+
+    def test_open_reuses_index(self):
+        """``ImageCatalog.open`` doesn't reparse an image that hasn't changed"""
+        self.catalog.open('jumpBox.ova')
+        with patch.object(images, '_Image') as fake_Image:
+            self.catalog.open('jumpBox.ova')
+
+        self.assertFalse(fake_Image.called)
+
+    def test_open_reindexes(self):
+        """``ImageCatalog.open`` reparses an image when the file changes"""
+        self.catalog.open('jumpBox.ova')
+        _make_ova(self.path, disk=b'new disk')
+        os.utime(self.path, (0, 0))
+
+        ova = self.catalog.open('jumpBox.ova')
+        disk = ova._disks['jumpBox-disk1.vmdk']
+
+        self.assertEqual(bytes(disk.read()), b'new disk')
+
+    def test_open_missing(self):
+        """``ImageCatalog.open`` raises ValueError if there's no such image"""
+        with self.assertRaises(ValueError):
+            self.catalog.open('nope.ova')
+
+    def test_disk_read(self):
+        """``CachedOva`` disks read the bytes of the disk within the tarball"""
+        ova = self.catalog.open('jumpBox.ova')
+        disk = ova._disks['jumpBox-disk1.vmdk']
+
+        data = b''.join(bytes(x) for x in iter(lambda: disk.read(64), b''))
+
+        self.assertEqual(data, DISK)
+
+    def test_disk_size(self):
+        """``CachedOva`` disks report their size, for the Content-Length header"""
+        ova = self.catalog.open('jumpBox.ova')
+
+        size = ova._get_tarfile_size(ova._disks['jumpBox-disk1.vmdk'])
+
+        self.assertEqual(size, len(DISK))
+
+    def test_independent_cursors(self):
+        """``CachedOva`` objects for the same image don't share a file position"""
+        ova1 = self.catalog.open('jumpBox.ova')
+        ova2 = self.catalog.open('jumpBox.ova')
+        ova1._disks['jumpBox-disk1.vmdk'].read(100)
+
+        self.assertEqual(ova2._disks['jumpBox-disk1.vmdk'].tell(), 0)
+
+    def test_progress(self):
+        """``CachedOva`` reports how much of the image has been read"""
+        ova = self.catalog.open('jumpBox.ova')
+        ova._disks['jumpBox-disk1.vmdk'].read()
+
+        self.assertTrue(ova._handle.progress() > 0)
+
+    def test_reset(self):
+        """``CachedOva._reset`` rewinds every disk"""
+        ova = self.catalog.open('jumpBox.ova')
+        disk = ova._disks['jumpBox-disk1.vmdk']
+        disk.read(10)
+
+        ova._reset()
+
+        self.assertEqual(disk.tell(), 0)
+        self.assertEqual(ova._handle.progress(), 0)
+
+    def test_close(self):
+        """``CachedOva.close`` leaves the shared image usable by other deploys"""
+        self.catalog.open('jumpBox.ova').close()
+
+        ova = self.catalog.open('jumpBox.ova')
+
+        self.assertEqual(bytes(ova._disks['jumpBox-disk1.vmdk'].read(10)), DISK[:10])
+
+
+    def _deploy_args(self):
+        """Make a deploy spec & lease for the test image"""
+        file_item = MagicMock(path='jumpBox-disk1.vmdk', deviceId='disk-0')
+        spec = MagicMock(fileItem=[file_item])
+        lease = MagicMock()
+        lease.info.deviceUrl = [MagicMock(importKey='disk-0', url='https://*/nfc/disk-0.vmdk')]
+        return spec, lease
+
+    @patch.object(images.Ova, '_chime_progress')
+    @patch.object(images.upload, 'DiskUploader')
+    def test_deploy(self, fake_DiskUploader, fake_chime_progress):
+        """``CachedOva.deploy`` uploads every disk at once, then completes the lease"""
+        ova = self.catalog.open('jumpBox.ova')
+        spec, lease = self._deploy_args()
+
+        ova.deploy(spec, lease, 'esxi01')
+        the_args, the_kwargs = fake_DiskUploader.return_value.upload.call_args
+        url, reader, size = the_args[0][0]
+
+        self.assertEqual(url, 'https://*/nfc/disk-0.vmdk')
+        self.assertEqual(size, len(DISK))
+        self.assertEqual(the_kwargs['host'], 'esxi01')
+        self.assertTrue(lease.Complete.called)
+
+    @patch.object(images.Ova, '_chime_progress')
+    @patch.object(images.upload, 'DiskUploader')
+    def test_deploy_failure(self, fake_DiskUploader, fake_chime_progress):
+        """``CachedOva.deploy`` aborts the lease if an upload fails"""
+        fake_DiskUploader.return_value.upload.side_effect = RuntimeError('testing')
+        ova = self.catalog.open('jumpBox.ova')
+        spec, lease = self._deploy_args()
+
+        with self.assertRaises(RuntimeError):
+            ova.deploy(spec, lease, 'esxi01')
+
+        self.assertTrue(lease.Abort.called)
+        self.assertFalse(lease.Complete.called)
+
+    @patch.object(images.Ova, '_chime_progress')
+    @patch.object(images.upload, 'DiskUploader')
+    def test_deploy_rate(self, fake_DiskUploader, fake_chime_progress):
+        """``CachedOva.deploy`` remembers how fast the disks were uploaded"""
+        def fake_upload(disks, host=None, callback=None):
+            callback({'sent': 10, 'total': 10, 'percent': 100, 'bytes_per_second': 2048.0})
+        fake_DiskUploader.return_value.upload.side_effect = fake_upload
+        ova = self.catalog.open('jumpBox.ova')
+
+        ova.deploy(*self._deploy_args(), host='esxi01')
+
+        self.assertEqual(ova.bytes_per_second, 2048.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in inventory.py
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_jumpbox_api.lib.worker import inventory
+
+
+def _make_object(obj, **props):
+    """Create a fake PropertyCollector ObjectContent"""
+    content = MagicMock()
+    content.obj = obj
+    content.propSet = []
+    for name, val in props.items():
+        prop = MagicMock()
+        prop.name = name
+        prop.val = val
+        content.propSet.append(prop)
+    return content
+
+
+class TestInventory(unittest.TestCase):
+    """A set of test cases for the inventory.py module"""
+
+    @patch.object(inventory, 'vmodl')
+    def test_retrieve(self, fake_vmodl):
+        """``retrieve`` returns the objects and requested properties"""
+        fake_vcenter = MagicMock()
+        fake_result = MagicMock()
+        fake_result.objects = [_make_object('vm-1', name='jumpBox')]
+        fake_result.token = None
+        collector = fake_vcenter.content.propertyCollector
+        collector.RetrievePropertiesEx.return_value = fake_result
+
+        output = inventory.retrieve(fake_vcenter, 'someFolder', inventory.vim.VirtualMachine, ['name'])
+        expected = [('vm-1', {'name': 'jumpBox'})]
+
+        self.assertEqual(output, expected)
+
+    @patch.object(inventory, 'vmodl')
+    def test_retrieve_pages(self, fake_vmodl):
+        """``retrieve`` follows the continuation token for large results"""
+        fake_vcenter = MagicMock()
+        page1 = MagicMock()
+        page1.objects = [_make_object('vm-1', name='jumpBox')]
+        page1.token = 'moar'
+        page2 = MagicMock()
+        page2.objects = [_make_object('vm-2', name='other')]
+        page2.token = None
+        collector = fake_vcenter.content.propertyCollector
+        collector.RetrievePropertiesEx.return_value = page1
+        collector.ContinueRetrievePropertiesEx.return_value = page2
+
+        output = inventory.retrieve(fake_vcenter, 'someFolder', inventory.vim.VirtualMachine, ['name'])
+
+        self.assertEqual(len(output), 2)
+
+    @patch.object(inventory, 'vmodl')
+    def test_retrieve_destroys_view(self, fake_vmodl):
+        """``retrieve`` always destroys the ContainerView it creates"""
+        fake_vcenter = MagicMock()
+        collector = fake_vcenter.content.propertyCollector
+        collector.RetrievePropertiesEx.side_effect = [RuntimeError('testing')]
+
+        with self.assertRaises(RuntimeError):
+            inventory.retrieve(fake_vcenter, 'someFolder', inventory.vim.VirtualMachine, ['name'])
+        view = fake_vcenter.content.viewManager.CreateContainerView.return_value
+
+        self.assertTrue(view.DestroyView.called)
+
+    @patch.object(inventory, 'retrieve')
+    def test_get_user_folder(self, fake_retrieve):
+        """``get_user_folder`` returns the folder named after the user under the base dir"""
+        fake_retrieve.return_value = [('group-1', {'name': 'vm', 'parent': 'datacenter-1'}),
+                                      ('group-2', {'name': 'vlab', 'parent': 'group-1'}),
+                                      ('group-3', {'name': 'bob', 'parent': 'group-1'}),
+                                      ('group-4', {'name': 'bob', 'parent': 'group-2'})]
+
+        output = inventory.get_user_folder(MagicMock(), 'bob')
+        expected = 'group-4'
+
+        self.assertEqual(output, expected)
+
+    @patch.object(inventory, 'retrieve')
+    def test_get_user_folder_missing(self, fake_retrieve):
+        """``get_user_folder`` raises ValueError if the user has no folder"""
+        fake_retrieve.return_value = [('group-1', {'name': 'vm', 'parent': 'datacenter-1'}),
+                                      ('group-2', {'name': 'vlab', 'parent': 'group-1'})]
+
+        with self.assertRaises(ValueError):
+            inventory.get_user_folder(MagicMock(), 'bob')
+
+    @patch.object(inventory, 'get_user_folder')
+    @patch.object(inventory, 'retrieve')
+    def test_get_user_vms(self, fake_retrieve, fake_get_user_folder):
+        """``get_user_vms`` only returns VMs with the supplied name"""
+        fake_retrieve.return_value = [('vm-1', {'name': 'jumpBox'}),
+                                      ('vm-2', {'name': 'someOtherVM'})]
+
+        output = inventory.get_user_vms(MagicMock(), 'bob', 'jumpBox')
+        expected = ['vm-1']
+
+        self.assertEqual(output, expected)
+
+    @patch.object(inventory, 'retrieve')
+    def test_get_jumpboxes(self, fake_retrieve):
+        """``get_jumpboxes`` returns the jumpbox in each user's folder, and who owns it"""
+        folders = [('group-1', {'name': 'vm', 'parent': 'datacenter-1'}),
+                   ('group-2', {'name': 'vlab', 'parent': 'group-1'}),
+                   ('group-3', {'name': 'bob', 'parent': 'group-2'}),
+                   ('group-4', {'name': 'jumpboxWarmPool', 'parent': 'group-1'})]
+        vms = [('vm-1', {'name': 'jumpBox', 'parent': 'group-3'}),
+               ('vm-2', {'name': 'someOtherVM', 'parent': 'group-3'}),
+               ('vm-3', {'name': 'jumpBox', 'parent': 'group-4'})]
+        fake_retrieve.side_effect = [folders, vms]
+
+        output = inventory.get_jumpboxes(MagicMock(), 'jumpBox', ['runtime.powerState'])
+        expected = [('bob', 'vm-1', {'name': 'jumpBox', 'parent': 'group-3'})]
+
+        self.assertEqual(output, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
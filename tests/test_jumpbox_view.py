@@ -20,6 +20,7 @@ class TestJumpboxView(unittest.TestCase):
     def setUpClass(cls):
         """Runs once for the whole test suite"""
         cls.token = generate_test_token(username='bob')
+        cls.admin_token = generate_test_token(username='bob', memberOf=[jumpbox.const.VLAB_JUMPBOX_ADMIN_GROUP])
 
     @classmethod
     def setUp(cls):
@@ -33,6 +34,16 @@ class TestJumpboxView(unittest.TestCase):
         cls.fake_task = MagicMock()
         cls.fake_task.id = 'asdf-asdf-asdf'
         app.celery_app.send_task.return_value = cls.fake_task
+        app.celery_app.AsyncResult.return_value.ready.return_value = False
+        app.celery_app.conf.result_backend = 'redis://localhost:6379/1'
+        # Every test gets an empty cache, so no request looks like a duplicate
+        cls.backend_patcher = patch.object(jumpbox.cache, 'backend', jumpbox.cache.MemoryBackend())
+        cls.backend_patcher.start()
+
+    @classmethod
+    def tearDown(cls):
+        """Runs after every test case"""
+        cls.backend_patcher.stop()
 
     def test_get_task(self):
         """JumpboxView - GET on /api/1/inf/jumpbox returns a task-id"""
@@ -54,6 +65,20 @@ class TestJumpboxView(unittest.TestCase):
 
         self.assertEqual(task_id, expected)
 
+    @patch.object(jumpbox.cache, 'get_show')
+    def test_get_cached(self, fake_get_show):
+        """JumpboxView - GET on /api/1/inf/jumpbox returns cached info without sending a task"""
+        fake_get_show.return_value = {'worked': True}
+        resp = self.app.get('/api/1/inf/jumpbox',
+                            headers={'X-Auth': self.token})
+
+        content = resp.json['content']
+        expected = {'worked': True}
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(content, expected)
+        self.assertFalse(self.app.application.celery_app.send_task.called)
+
     def test_post_task(self):
         """JumpboxView - POST on /api/1/inf/jumpbox returns a task-id"""
         resp = self.app.post('/api/1/inf/jumpbox',
@@ -76,6 +101,105 @@ class TestJumpboxView(unittest.TestCase):
 
         self.assertEqual(task_id, expected)
 
+    def test_post_unknown_network(self):
+        """JumpboxView - POST on /api/1/inf/jumpbox returns 400 for a network that doesn't exist"""
+        jumpbox.cache.set_networks(['otherNetwork'])
+        resp = self.app.post('/api/1/inf/jumpbox',
+                             headers={'X-Auth': self.token},
+                             json={"network": "someNetwork"})
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(self.app.application.celery_app.send_task.called)
+
+    def test_post_network_elsewhere(self):
+        """JumpboxView - POST on /api/1/inf/jumpbox allows a network another shard the user can be placed on has"""
+        shards = [MagicMock(server='vc1'), MagicMock(server='vc2')]
+        jumpbox.cache.set_networks(['otherNetwork'], server='vc1')
+        jumpbox.cache.set_networks(['someNetwork'], server='vc2')
+        with patch.object(jumpbox.placement.ring, 'candidates', return_value=shards):
+            resp = self.app.post('/api/1/inf/jumpbox',
+                                 headers={'X-Auth': self.token},
+                                 json={"network": "someNetwork"})
+
+        self.assertEqual(resp.status_code, 202)
+
+    def test_post_known_network(self):
+        """JumpboxView - POST on /api/1/inf/jumpbox sends the task for a network that exists"""
+        jumpbox.cache.set_networks(['someNetwork'])
+        resp = self.app.post('/api/1/inf/jumpbox',
+                             headers={'X-Auth': self.token},
+                             json={"network": "someNetwork"})
+
+        self.assertEqual(resp.status_code, 202)
+
+    def test_post_coalesced(self):
+        """JumpboxView - POST on /api/1/inf/jumpbox returns the in flight task instead of sending another"""
+        self.app.application.celery_app.send_task.side_effect = lambda name, args, task_id: MagicMock(id=task_id)
+        first = self.app.post('/api/1/inf/jumpbox',
+                              headers={'X-Auth': self.token},
+                              json={"network": "someNetwork"})
+        second = self.app.post('/api/1/inf/jumpbox',
+                               headers={'X-Auth': self.token},
+                               json={"network": "someNetwork"})
+
+        self.assertEqual(self.app.application.celery_app.send_task.call_count, 1)
+        self.assertEqual(first.json['content']['task-id'], second.json['content']['task-id'])
+        self.assertEqual(second.status_code, 202)
+
+    def test_post_after_finished(self):
+        """JumpboxView - POST on /api/1/inf/jumpbox sends a new task when the in flight one is done, even if the worker couldn't forget it"""
+        celery_app = self.app.application.celery_app
+        celery_app.send_task.side_effect = lambda name, args, task_id: MagicMock(id=task_id)
+        first = self.app.post('/api/1/inf/jumpbox',
+                              headers={'X-Auth': self.token},
+                              json={"network": "someNetwork"})
+        self.app.delete('/api/1/inf/jumpbox',
+                        headers={'X-Auth': self.token})
+        # The worker ran both, and released them in its own cache, not this one
+        celery_app.AsyncResult.return_value.ready.return_value = True
+        second = self.app.post('/api/1/inf/jumpbox',
+                               headers={'X-Auth': self.token},
+                               json={"network": "someNetwork"})
+
+        self.assertEqual(celery_app.send_task.call_count, 3)
+        self.assertNotEqual(first.json['content']['task-id'], second.json['content']['task-id'])
+
+    def test_post_after_release(self):
+        """JumpboxView - POST on /api/1/inf/jumpbox sends a new task once the last one finished"""
+        self.app.post('/api/1/inf/jumpbox',
+                      headers={'X-Auth': self.token},
+                      json={"network": "someNetwork"})
+        jumpbox.cache.release_task('bob', 'create')
+        self.app.post('/api/1/inf/jumpbox',
+                      headers={'X-Auth': self.token},
+                      json={"network": "someNetwork"})
+
+        self.assertEqual(self.app.application.celery_app.send_task.call_count, 2)
+
+    def test_post_idempotency_key(self):
+        """JumpboxView - POST on /api/1/inf/jumpbox with a reused Idempotency-Key returns the original task"""
+        self.app.post('/api/1/inf/jumpbox',
+                      headers={'X-Auth': self.token, 'Idempotency-Key': 'abc'},
+                      json={"network": "someNetwork"})
+        _, the_kwargs = self.app.application.celery_app.send_task.call_args
+        jumpbox.cache.release_task('bob', 'create')
+        resp = self.app.post('/api/1/inf/jumpbox',
+                             headers={'X-Auth': self.token, 'Idempotency-Key': 'abc'},
+                             json={"network": "someNetwork"})
+
+        self.assertEqual(self.app.application.celery_app.send_task.call_count, 1)
+        self.assertEqual(resp.json['content']['task-id'], the_kwargs['task_id'])
+
+    def test_delete_not_coalesced_with_create(self):
+        """JumpboxView - DELETE on /api/1/inf/jumpbox isn't mistaken for a duplicate create"""
+        self.app.post('/api/1/inf/jumpbox',
+                      headers={'X-Auth': self.token},
+                      json={"network": "someNetwork"})
+        self.app.delete('/api/1/inf/jumpbox',
+                        headers={'X-Auth': self.token})
+
+        self.assertEqual(self.app.application.celery_app.send_task.call_count, 2)
+
     def test_delete_task(self):
         """JumpboxView - DELETE on /api/1/inf/jumpbox returns a task-id"""
         resp = self.app.delete('/api/1/inf/jumpbox',
@@ -95,7 +219,180 @@ class TestJumpboxView(unittest.TestCase):
         expected = '<https://localhost/api/1/inf/jumpbox/task/asdf-asdf-asdf>; rel=status'
 
         self.assertEqual(task_id, expected)
-        
+
+    def test_reset_task(self):
+        """JumpboxView - POST on /api/1/inf/jumpbox/reset returns a task-id"""
+        resp = self.app.post('/api/1/inf/jumpbox/reset',
+                             headers={'X-Auth': self.token})
+
+        task_id = resp.json['content']['task-id']
+        the_args, _ = self.app.application.celery_app.send_task.call_args
+
+        self.assertEqual(task_id, 'asdf-asdf-asdf')
+        self.assertEqual(the_args[0], 'jumpbox.reset')
+
+    def test_connect_task(self):
+        """JumpboxView - POST on /api/1/inf/jumpbox/connect sends a resume task"""
+        resp = self.app.post('/api/1/inf/jumpbox/connect',
+                             headers={'X-Auth': self.token})
+
+        task_id = resp.json['content']['task-id']
+        the_args, _ = self.app.application.celery_app.send_task.call_args
+
+        self.assertEqual(task_id, 'asdf-asdf-asdf')
+        self.assertEqual(the_args[0], 'jumpbox.resume')
+
+    def test_get_idle_default(self):
+        """JumpboxView - GET on /api/1/inf/jumpbox/idle returns the default policy when the user hasn't chosen one"""
+        resp = self.app.get('/api/1/inf/jumpbox/idle',
+                            headers={'X-Auth': self.token})
+
+        self.assertEqual(resp.json['content']['timeout'], jumpbox.const.VLAB_JUMPBOX_IDLE_TIMEOUT)
+
+    def test_put_idle(self):
+        """JumpboxView - PUT on /api/1/inf/jumpbox/idle sets the user's idle policy"""
+        self.app.put('/api/1/inf/jumpbox/idle',
+                     headers={'X-Auth': self.token},
+                     json={'timeout': 0})
+        resp = self.app.get('/api/1/inf/jumpbox/idle',
+                            headers={'X-Auth': self.token})
+
+        self.assertEqual(resp.json['content']['timeout'], 0)
+
+    def test_put_idle_invalid(self):
+        """JumpboxView - PUT on /api/1/inf/jumpbox/idle rejects a negative timeout"""
+        resp = self.app.put('/api/1/inf/jumpbox/idle',
+                            headers={'X-Auth': self.token},
+                            json={'timeout': -1})
+
+        self.assertEqual(resp.status_code, 400)
+
+    def test_post_events_link(self):
+        """JumpboxView - POST on /api/1/inf/jumpbox links to the stream of progress events"""
+        resp = self.app.post('/api/1/inf/jumpbox',
+                             headers={'X-Auth': self.token},
+                             json={"network": "someNetwork"})
+
+        links = resp.headers.getlist('Link')
+        expected = '<https://localhost/api/1/inf/jumpbox/task/asdf-asdf-asdf/events>; rel=events'
+
+        self.assertIn(expected, links)
+
+    def test_post_events_link_rpc(self):
+        """JumpboxView - POST on /api/1/inf/jumpbox doesn't link to events that can't be streamed"""
+        self.app.application.celery_app.conf.result_backend = 'rpc://'
+        resp = self.app.post('/api/1/inf/jumpbox',
+                             headers={'X-Auth': self.token},
+                             json={"network": "someNetwork"})
+
+        links = resp.headers.getlist('Link')
+        unexpected = '<https://localhost/api/1/inf/jumpbox/task/asdf-asdf-asdf/events>; rel=events'
+
+        self.assertNotIn(unexpected, links)
+
+    def test_task_events_rpc(self):
+        """JumpboxView - GET on /api/1/inf/jumpbox/task/<id>/events is refused without a shared result backend"""
+        self.app.application.celery_app.conf.result_backend = 'rpc://'
+
+        resp = self.app.get('/api/1/inf/jumpbox/task/asdf-asdf-asdf/events',
+                            headers={'X-Auth': self.token})
+
+        self.assertEqual(resp.status_code, 501)
+        self.assertFalse(self.app.application.celery_app.AsyncResult.called)
+
+    @patch.object(jumpbox.time, 'sleep')
+    def test_task_events(self, fake_sleep):
+        """JumpboxView - GET on /api/1/inf/jumpbox/task/<id>/events streams progress, then the result"""
+        pending = MagicMock(status='PENDING', info=None)
+        deploying = MagicMock(status='PROGRESS', info={'content': {'stage': 'deploying', 'percent': 10}})
+        done = MagicMock(status='SUCCESS', result={'content': {'worked': True}, 'error': None, 'params': {}})
+        self.app.application.celery_app.AsyncResult.side_effect = [pending, pending, deploying, done]
+
+        resp = self.app.get('/api/1/inf/jumpbox/task/asdf-asdf-asdf/events',
+                            headers={'X-Auth': self.token})
+        events = resp.get_data(as_text=True).strip().split('\n\n')
+        expected = ['event: progress\ndata: {"status":"PENDING","progress":null}',
+                    'event: progress\ndata: {"status":"PROGRESS","progress":{"content":{"stage":"deploying","percent":10}}}',
+                    'event: done\ndata: {"status":"SUCCESS","result":{"content":{"worked":true},"error":null,"params":{}}}']
+
+        self.assertEqual(resp.mimetype, 'text/event-stream')
+        self.assertEqual(events, expected)
+
+    @patch.object(jumpbox.time, 'sleep')
+    def test_task_events_failure(self, fake_sleep):
+        """JumpboxView - The event stream ends with the error when a task fails"""
+        failed = MagicMock(status='FAILURE', result=RuntimeError('testing'))
+        self.app.application.celery_app.AsyncResult.return_value = failed
+
+        resp = self.app.get('/api/1/inf/jumpbox/task/asdf-asdf-asdf/events',
+                            headers={'X-Auth': self.token})
+        event = resp.get_data(as_text=True)
+        expected = 'event: done\ndata: {"status":"FAILURE","result":{"content":{},"error":"testing","params":{}}}\n\n'
+
+        self.assertEqual(event, expected)
+
+    @patch.object(jumpbox, 'time')
+    def test_task_events_timeout(self, fake_time):
+        """JumpboxView - The event stream ends with a timeout event if the task takes too long"""
+        fake_time.time.side_effect = [0, 0, jumpbox.const.VLAB_JUMPBOX_EVENTS_TIMEOUT + 1]
+        self.app.application.celery_app.AsyncResult.return_value = MagicMock(status='STARTED', info=None)
+
+        resp = self.app.get('/api/1/inf/jumpbox/task/asdf-asdf-asdf/events',
+                            headers={'X-Auth': self.token})
+        events = resp.get_data(as_text=True).strip().split('\n\n')
+
+        self.assertEqual(events[-1], 'event: timeout\ndata: {"status":"STARTED"}')
+        self.assertEqual(len(events), 2)
+
+    def test_bulk_create(self):
+        """JumpboxView - POST on /api/1/inf/jumpbox/bulk returns a task-id"""
+        resp = self.app.post('/api/1/inf/jumpbox/bulk',
+                             headers={'X-Auth': self.admin_token},
+                             json={"jumpboxes": [{"username": "alice", "network": "someNetwork"}]})
+
+        task_id = resp.json['content']['task-id']
+        expected = 'asdf-asdf-asdf'
+
+        self.assertEqual(task_id, expected)
+
+    def test_bulk_create_task(self):
+        """JumpboxView - POST on /api/1/inf/jumpbox/bulk sends the jumpbox.bulk_create task"""
+        self.app.post('/api/1/inf/jumpbox/bulk',
+                      headers={'X-Auth': self.admin_token},
+                      json={"jumpboxes": [{"username": "alice", "network": "someNetwork"}]})
+
+        the_args, _ = self.app.application.celery_app.send_task.call_args
+        expected = ('jumpbox.bulk_create', [[{"username": "alice", "network": "someNetwork"}]])
+
+        self.assertEqual(the_args, expected)
+
+    def test_bulk_create_admin_only(self):
+        """JumpboxView - POST on /api/1/inf/jumpbox/bulk requires an admin"""
+        resp = self.app.post('/api/1/inf/jumpbox/bulk',
+                             headers={'X-Auth': self.token},
+                             json={"jumpboxes": [{"username": "alice", "network": "someNetwork"}]})
+
+        self.assertEqual(resp.status_code, 403)
+
+    def test_bulk_delete(self):
+        """JumpboxView - DELETE on /api/1/inf/jumpbox/bulk returns a task-id"""
+        resp = self.app.delete('/api/1/inf/jumpbox/bulk',
+                               headers={'X-Auth': self.admin_token},
+                               json={"usernames": ["alice", "sam"]})
+
+        task_id = resp.json['content']['task-id']
+        expected = 'asdf-asdf-asdf'
+
+        self.assertEqual(task_id, expected)
+
+    def test_bulk_delete_admin_only(self):
+        """JumpboxView - DELETE on /api/1/inf/jumpbox/bulk requires an admin"""
+        resp = self.app.delete('/api/1/inf/jumpbox/bulk',
+                               headers={'X-Auth': self.token},
+                               json={"usernames": ["alice", "sam"]})
+
+        self.assertEqual(resp.status_code, 403)
+
 
 if __name__ == '__main__':
     unittest.main()
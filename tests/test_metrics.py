@@ -0,0 +1,114 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of unit tests for the metrics.py module
+"""
+import unittest
+from unittest.mock import patch
+
+from vlab_jumpbox_api.lib import metrics
+
+
+def _sample(task, step, outcome):
+    """Obtain how many times a step was recorded"""
+    value = metrics.REGISTRY.get_sample_value('vlab_jumpbox_step_seconds_count',
+                                              {'task': task, 'step': step, 'outcome': outcome})
+    return value or 0
+
+
+class TestTimed(unittest.TestCase):
+    """A set of test cases for the ``timed`` and ``task`` context managers"""
+
+    def test_timed(self):
+        """``timed`` records a successful step"""
+        before = _sample('unittest', 'step', 'success')
+        with metrics.timed('step', task_name='unittest'):
+            pass
+
+        self.assertEqual(_sample('unittest', 'step', 'success'), before + 1)
+
+    def test_timed_error(self):
+        """``timed`` records the step as an error when the block raises"""
+        before = _sample('unittest', 'step', 'error')
+        with self.assertRaises(RuntimeError):
+            with metrics.timed('step', task_name='unittest'):
+                raise RuntimeError('testing')
+
+        self.assertEqual(_sample('unittest', 'step', 'error'), before + 1)
+
+    def test_task(self):
+        """``task`` labels the steps timed within it, and records a total"""
+        before_step = _sample('unittest-task', 'inner', 'success')
+        before_total = _sample('unittest-task', 'total', 'success')
+        with metrics.task('unittest-task'):
+            with metrics.timed('inner'):
+                pass
+
+        self.assertEqual(_sample('unittest-task', 'inner', 'success'), before_step + 1)
+        self.assertEqual(_sample('unittest-task', 'total', 'success'), before_total + 1)
+
+    def test_task_restores(self):
+        """``task`` restores the previous task name when it exits"""
+        with metrics.task('outer'):
+            with metrics.task('inner'):
+                pass
+            with metrics.timed('after'):
+                pass
+
+        self.assertEqual(_sample('outer', 'after', 'success'), 1)
+
+
+class TestExport(unittest.TestCase):
+    """A set of test cases for exporting the metrics"""
+
+    def test_record_stats(self):
+        """``record_stats`` publishes every counter as a gauge"""
+        metrics.record_stats('unittest', {'hits': 3, 'misses': 1})
+
+        value = metrics.REGISTRY.get_sample_value('vlab_jumpbox_worker_stat', {'source': 'unittest', 'stat': 'hits', 'shard': ''})
+
+        self.assertEqual(value, 3)
+
+    def test_record_stats_shard(self):
+        """``record_stats`` labels the counters with the shard they're for"""
+        metrics.record_stats('unittest', {'hits': 5}, shard='east')
+
+        value = metrics.REGISTRY.get_sample_value('vlab_jumpbox_worker_stat',
+                                                  {'source': 'unittest', 'stat': 'hits', 'shard': 'east'})
+
+        self.assertEqual(value, 5)
+
+    def test_render(self):
+        """``render`` returns the metrics in the Prometheus text format"""
+        body, content_type = metrics.render()
+
+        self.assertTrue(b'vlab_jumpbox_step_seconds' in body)
+        self.assertTrue(content_type.startswith('text/plain'))
+
+    @patch.object(metrics, 'start_http_server')
+    def test_start_exporter(self, fake_start_http_server):
+        """``start_exporter`` serves the metrics on the supplied port"""
+        metrics.start_exporter(9100)
+
+        self.assertEqual(fake_start_http_server.call_args[0], (9100,))
+
+    @patch.object(metrics, 'start_http_server')
+    def test_start_exporter_disabled(self, fake_start_http_server):
+        """``start_exporter`` does nothing when the port is zero"""
+        metrics.start_exporter(0)
+
+        self.assertFalse(fake_start_http_server.called)
+
+    @patch.object(metrics, '_multiprocess_dir')
+    @patch.object(metrics.multiprocess, 'MultiProcessCollector')
+    def test_registry_multiprocess(self, fake_MultiProcessCollector, fake_multiprocess_dir):
+        """``registry`` combines the metrics of every process when PROMETHEUS_MULTIPROC_DIR is set"""
+        fake_multiprocess_dir.return_value = '/tmp/metrics'
+
+        the_registry = metrics.registry()
+
+        self.assertFalse(the_registry is metrics.REGISTRY)
+        self.assertTrue(fake_MultiProcessCollector.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
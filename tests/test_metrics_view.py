@@ -0,0 +1,38 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of unit tests for the MetricsView object
+"""
+import unittest
+
+from flask import Flask
+
+from vlab_jumpbox_api.lib.views import metrics
+
+
+class TestMetricsView(unittest.TestCase):
+    """A suite of test cases for the MetricsView object"""
+
+    @classmethod
+    def setUp(cls):
+        """Runs before every test case"""
+        app = Flask(__name__)
+        metrics.MetricsView.register(app)
+        app.config['TESTING'] = True
+        cls.app = app.test_client()
+
+    def test_get(self):
+        """MetricsView for /api/1/inf/jumpbox/metrics supports GET"""
+        resp = self.app.get('/api/1/inf/jumpbox/metrics')
+
+        self.assertEqual(resp.status_code, 200)
+
+    def test_get_format(self):
+        """MetricsView returns metrics in the Prometheus text format"""
+        resp = self.app.get('/api/1/inf/jumpbox/metrics')
+
+        self.assertTrue(resp.headers['Content-Type'].startswith('text/plain'))
+        self.assertTrue(b'vlab_jumpbox_step_seconds' in resp.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
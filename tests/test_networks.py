@@ -0,0 +1,89 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of unit tests for the networks.py module
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_jumpbox_api.lib.worker import networks
+
+
+@patch.object(networks, 'cache')
+@patch.object(networks.inventory, 'retrieve')
+class TestNetworkIndex(unittest.TestCase):
+    """A set of test cases for the NetworkIndex object"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.index = networks.NetworkIndex(ttl=60)
+        self.fake_vcenter = MagicMock()
+
+    def test_get(self, fake_retrieve, fake_cache):
+        """``NetworkIndex.get`` returns the network with the supplied name"""
+        fake_retrieve.return_value = [(networks.vim.Network('network-1'), {'name': 'someNetwork'})]
+
+        output = self.index.get(self.fake_vcenter, 'someNetwork')
+
+        self.assertTrue(isinstance(output, networks.vim.Network))
+        self.assertEqual(output._moId, 'network-1')
+
+    def test_get_cached(self, fake_retrieve, fake_cache):
+        """``NetworkIndex.get`` doesn't reread vCenter while the index is fresh"""
+        fake_retrieve.return_value = [(networks.vim.Network('network-1'), {'name': 'someNetwork'})]
+
+        self.index.get(self.fake_vcenter, 'someNetwork')
+        self.index.get(self.fake_vcenter, 'someNetwork')
+
+        self.assertEqual(fake_retrieve.call_count, 1)
+
+    @patch.object(networks, 'time')
+    def test_get_stale(self, fake_time, fake_retrieve, fake_cache):
+        """``NetworkIndex.get`` rereads vCenter once the TTL is exceeded"""
+        fake_retrieve.return_value = [(networks.vim.Network('network-1'), {'name': 'someNetwork'})]
+        fake_time.time.side_effect = [1000, 1000, 1061, 1061]
+
+        self.index.get(self.fake_vcenter, 'someNetwork')
+        self.index.get(self.fake_vcenter, 'someNetwork')
+
+        self.assertEqual(fake_retrieve.call_count, 2)
+
+    @patch.object(networks, 'time')
+    def test_get_new_network(self, fake_time, fake_retrieve, fake_cache):
+        """``NetworkIndex.get`` refreshes early to find a network created after the last refresh"""
+        fake_retrieve.side_effect = [[],
+                                     [(networks.vim.Network('network-1'), {'name': 'someNetwork'})]]
+        fake_time.time.side_effect = [1000, 1010, 1010]
+        self.index.refresh(self.fake_vcenter)
+
+        output = self.index.get(self.fake_vcenter, 'someNetwork')
+
+        self.assertEqual(output._moId, 'network-1')
+
+    def test_get_missing(self, fake_retrieve, fake_cache):
+        """``NetworkIndex.get`` raises ValueError if there's no such network"""
+        fake_retrieve.return_value = [(networks.vim.Network('network-1'), {'name': 'someNetwork'})]
+
+        with self.assertRaises(ValueError):
+            self.index.get(self.fake_vcenter, 'otherNetwork')
+
+    def test_refresh_publishes(self, fake_retrieve, fake_cache):
+        """``NetworkIndex.refresh`` publishes the network names for the API"""
+        fake_retrieve.return_value = [(networks.vim.Network('network-1'), {'name': 'someNetwork'})]
+
+        output = self.index.refresh(self.fake_vcenter)
+
+        self.assertEqual(output, ['someNetwork'])
+        self.assertEqual(list(fake_cache.set_networks.call_args[0][0]), ['someNetwork'])
+
+    def test_get_index(self, fake_retrieve, fake_cache):
+        """``get_index`` keeps a separate index for every vCenter"""
+        default = networks.get_index(MagicMock(server=networks.const.INF_VCENTER_SERVER))
+        other = networks.get_index(MagicMock(server='vc-other'))
+
+        self.assertTrue(default is networks.index)
+        self.assertTrue(other is networks.get_index(MagicMock(server='vc-other')))
+        self.assertEqual(other.server, 'vc-other')
+
+
+if __name__ == '__main__':
+    unittest.main()
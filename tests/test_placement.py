@@ -0,0 +1,262 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in placement.py
+"""
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from vlab_jumpbox_api.lib import cache, placement
+
+
+class TestLoadShards(unittest.TestCase):
+    """A set of test cases for the ``load_shards`` function"""
+    def test_default(self):
+        """``load_shards`` makes one shard from the INF_VCENTER settings when none are defined"""
+        shards = placement.load_shards('')
+
+        self.assertEqual(len(shards), 1)
+        self.assertEqual(shards[0].server, placement.const.INF_VCENTER_SERVER)
+        self.assertEqual(shards[0].datastore, placement.const.INF_VCENTER_DATASTORE)
+
+    def test_defined(self):
+        """``load_shards`` parses the JSON shard definitions"""
+        spec = '[{"name": "east", "server": "vc-east", "datastore": "SSD", "capacity": 10, "weight": 2}]'
+
+        shard = placement.load_shards(spec)[0]
+
+        self.assertEqual((shard.name, shard.server, shard.datastore), ('east', 'vc-east', 'SSD'))
+        self.assertEqual((shard.capacity, shard.weight), (10, 2))
+        self.assertEqual(shard.resource_pool, placement.const.INF_VCENTER_RESORUCE_POOL)
+
+    def test_missing_server(self):
+        """``load_shards`` raises ValueError when a shard has no server"""
+        with self.assertRaises(ValueError):
+            placement.load_shards('[{"name": "east"}]')
+
+    def test_duplicate_names(self):
+        """``load_shards`` raises ValueError when two shards have the same name"""
+        spec = '[{"name": "east", "server": "vc1"}, {"name": "east", "server": "vc2"}]'
+
+        with self.assertRaises(ValueError):
+            placement.load_shards(spec)
+
+
+def _shared_backend():
+    """A MemoryBackend that stands in for Redis"""
+    backend = cache.MemoryBackend()
+    backend.shared = True
+    return backend
+
+
+class TestPlacement(unittest.TestCase):
+    """A set of test cases for the Placement object"""
+    @classmethod
+    def setUpClass(cls):
+        placement.logger = MagicMock()
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.backend = _shared_backend()
+        self.shards = [placement.Shard('east', 'vc-east', 'SSD', 'Resources'),
+                       placement.Shard('west', 'vc-west', 'SSD', 'Resources'),
+                       placement.Shard('north', 'vc-east', 'HDD', 'Resources')]
+        self.ring = placement.Placement(self.shards, self.backend, ttl=60)
+
+    def test_lookup_consistent(self):
+        """``Placement.lookup`` always puts a user on the same shard"""
+        first = self.ring.lookup('alice')
+        second = placement.Placement(self.shards, _shared_backend(), ttl=60).lookup('alice')
+
+        self.assertEqual(first.name, second.name)
+
+    def test_lookup_spread(self):
+        """``Placement.lookup`` spreads users over every shard"""
+        found = set(self.ring.lookup('user{}'.format(x)).name for x in range(300))
+
+        self.assertEqual(found, {'east', 'west', 'north'})
+
+    def test_adding_shard_moves_few_users(self):
+        """Adding a shard only moves the users that now hash to it"""
+        users = ['user{}'.format(x) for x in range(300)]
+        before = {x: self.ring.lookup(x).name for x in users}
+        bigger = placement.Placement(self.shards + [placement.Shard('south', 'vc-south', 'SSD', 'Resources')],
+                                     _shared_backend(), ttl=60)
+
+        moved = [x for x in users if bigger.lookup(x).name != before[x]]
+
+        self.assertTrue(all(bigger.lookup(x).name == 'south' for x in moved))
+        self.assertTrue(len(moved) < len(users) / 2)
+
+    def test_place(self):
+        """``Placement.place`` puts a new jumpbox on the user's shard, and counts it"""
+        shard = self.ring.place('alice')
+
+        self.assertEqual(shard.name, self.ring.lookup('alice').name)
+        self.assertEqual(self.ring.stats[shard.name], 1)
+
+    def test_place_full(self):
+        """``Placement.place`` spills over to another shard when the user's shard is full"""
+        home = self.ring.lookup('alice')
+        home.capacity = 1
+        self.backend.incr('jumpbox:placement:count:{}'.format(home.name), 1, 60)
+
+        shard = self.ring.place('alice')
+
+        self.assertNotEqual(shard.name, home.name)
+        self.assertEqual(self.ring.lookup('alice').name, shard.name)
+        self.assertEqual(self.ring.stats[home.name], 1)
+
+    def test_place_all_full(self):
+        """``Placement.place`` raises ValueError when every shard is full"""
+        for shard in self.shards:
+            shard.capacity = 1
+            self.backend.incr('jumpbox:placement:count:{}'.format(shard.name), 1, 60)
+
+        with self.assertRaises(ValueError):
+            self.ring.place('alice')
+
+    def test_assign(self):
+        """``Placement.assign`` pins a user to a shard"""
+        self.ring.assign('alice', 'west')
+
+        self.assertEqual(self.ring.lookup('alice').name, 'west')
+
+    def test_assign_unknown(self):
+        """``Placement.assign`` raises ValueError for a shard that doesn't exist"""
+        with self.assertRaises(ValueError):
+            self.ring.assign('alice', 'nowhere')
+
+    def test_release(self):
+        """``Placement.release`` uncounts the jumpbox, and forgets the override"""
+        self.ring.assign('alice', 'west')
+        self.ring.place('alice')
+
+        self.ring.release('alice')
+
+        self.assertEqual(self.ring.stats['west'], 0)
+        self.assertEqual(self.ring.backend.get('jumpbox:placement:user:alice'), None)
+
+    def test_release_never_negative(self):
+        """``Placement.release`` doesn't count below zero for jumpboxes made before counting"""
+        self.ring.release('alice')
+
+        self.assertEqual(self.ring.stats[self.ring.lookup('alice').name], 0)
+
+    def test_place_records(self):
+        """``Placement.place`` records the shard, even when it's the one the user hashes to"""
+        shard = self.ring.place('alice')
+
+        self.assertEqual(self.backend.get('jumpbox:placement:user:alice'), shard.name)
+
+    def test_lookup_refreshes(self):
+        """``Placement.lookup`` keeps the record of a jumpbox that's in use from expiring"""
+        self.ring.assign('alice', 'west')
+        self.backend.set('jumpbox:placement:user:alice', 'west', 1)
+
+        self.ring.lookup('alice')
+        _, expires = self.backend._data['jumpbox:placement:user:alice']
+
+        self.assertTrue(expires > time.time() + 30)
+
+    def test_lookup_search(self):
+        """``Placement.lookup`` searches every shard when there's no record, and records what it finds"""
+        search = MagicMock(side_effect=lambda shard, username: shard.name == 'west')
+
+        shard = self.ring.lookup('alice', search=search)
+
+        self.assertEqual(shard.name, 'west')
+        self.assertEqual(self.backend.get('jumpbox:placement:user:alice'), 'west')
+
+    def test_lookup_search_recorded(self):
+        """``Placement.lookup`` doesn't search vCenter when there's a record"""
+        self.ring.assign('alice', 'north')
+        search = MagicMock()
+
+        shard = self.ring.lookup('alice', search=search)
+
+        self.assertEqual(shard.name, 'north')
+        self.assertFalse(search.called)
+
+    def test_lookup_search_nothing(self):
+        """``Placement.lookup`` falls back to the hashed shard when no shard has the jumpbox"""
+        search = MagicMock(return_value=False)
+
+        shard = self.ring.lookup('alice', search=search)
+
+        self.assertEqual(shard.name, self.ring.lookup('alice').name)
+        self.assertEqual(self.backend.get('jumpbox:placement:user:alice'), None)
+
+    def test_lookup_search_miss_remembered(self):
+        """``Placement.lookup`` doesn't search every shard again right after finding nothing"""
+        search = MagicMock(return_value=False)
+        self.ring.lookup('alice', search=search)
+        search.reset_mock()
+
+        self.ring.lookup('alice', search=search)
+
+        self.assertFalse(search.called)
+
+    def test_assign_forgets_miss(self):
+        """``Placement.assign`` drops the memory of not finding a user's jumpbox"""
+        self.ring.lookup('alice', search=MagicMock(return_value=False))
+        self.ring.assign('alice', 'west')
+        self.ring.release('alice')
+        search = MagicMock(return_value=False)
+
+        self.ring.lookup('alice', search=search)
+
+        self.assertTrue(search.called)
+
+    def test_candidates(self):
+        """``Placement.candidates`` is every shard, starting with the user's, when there's no record"""
+        names = [x.name for x in self.ring.candidates('alice')]
+
+        self.assertEqual(names[0], self.ring.lookup('alice').name)
+        self.assertEqual(sorted(names), ['east', 'north', 'west'])
+
+    def test_candidates_recorded(self):
+        """``Placement.candidates`` is only the recorded shard, when there is one"""
+        self.ring.assign('alice', 'west')
+
+        names = [x.name for x in self.ring.candidates('alice')]
+
+        self.assertEqual(names, ['west'])
+
+    def test_capacity_needs_shared_cache(self):
+        """``Placement`` raises ValueError for a shard capacity, without a shared cache"""
+        self.shards[0].capacity = 10
+
+        with self.assertRaises(ValueError):
+            placement.Placement(self.shards, cache.MemoryBackend(), ttl=60)
+
+    def test_shards_need_shared_cache(self):
+        """``Placement`` raises ValueError for more than one shard, without a shared cache"""
+        with self.assertRaises(ValueError):
+            placement.Placement(self.shards, cache.MemoryBackend(), ttl=60)
+
+    def test_one_shard_memory(self):
+        """``Placement`` works with one shard and an unshared cache"""
+        ring = placement.Placement(self.shards[:1], cache.MemoryBackend(), ttl=60)
+
+        self.assertEqual(ring.lookup('alice').name, 'east')
+
+    def test_servers(self):
+        """``Placement.servers`` returns one shard per vCenter"""
+        servers = sorted(x.server for x in self.ring.servers())
+
+        self.assertEqual(servers, ['vc-east', 'vc-west'])
+
+    def test_group(self):
+        """``Placement.group`` sorts users by their shard"""
+        self.ring.assign('alice', 'west')
+        self.ring.assign('bob', 'west')
+        self.ring.assign('sam', 'east')
+
+        groups = {x.name: y for x, y in self.ring.group(['alice', 'bob', 'sam'])}
+
+        self.assertEqual(groups, {'west': ['alice', 'bob'], 'east': ['sam']})
+
+
+if __name__ == '__main__':
+    unittest.main()
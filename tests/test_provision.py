@@ -0,0 +1,97 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in provision.py
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_jumpbox_api.lib.worker import provision
+
+
+class TestProvision(unittest.TestCase):
+    """A set of test cases for the provision.py module"""
+    @classmethod
+    def setUpClass(cls):
+        provision.logger = MagicMock()
+
+    def test_render(self):
+        """``render`` includes every step, and exits with the step number on failure"""
+        output = provision.render('alice')
+
+        self.assertTrue('--home-dir /home/alice alice' in output)
+        self.assertTrue('/home/alice/.xsessionrc' in output)
+        self.assertTrue('exit 1' in output)
+        self.assertTrue('exit 2' in output)
+
+    def test_render_password(self):
+        """``render`` quotes the password hash so the shell doesn't expand it"""
+        output = provision.render('alice')
+
+        self.assertTrue("'{}'".format(provision.PASSWORD_HASH) in output)
+
+    @patch.object(provision, '_download')
+    @patch.object(provision, '_upload')
+    @patch.object(provision.virtual_machine, 'run_command')
+    def test_run(self, fake_run_command, fake_upload, fake_download):
+        """``run`` reports the exit code and duration of each step"""
+        fake_run_command.return_value.exitCode = 0
+        fake_download.return_value = 'useradd 0 10.0 10.5\nxsessionrc 0 10.5 10.75\n'
+
+        output = provision.run(MagicMock(), MagicMock(), 'alice', user='administrator', password='a')
+        expected = [{'name': 'useradd', 'exit_code': 0, 'seconds': 0.5},
+                    {'name': 'xsessionrc', 'exit_code': 0, 'seconds': 0.25}]
+
+        self.assertEqual(output['steps'], expected)
+        self.assertEqual(fake_run_command.call_count, 1)
+
+    @patch.object(provision, '_download')
+    @patch.object(provision, '_upload')
+    @patch.object(provision.virtual_machine, 'run_command')
+    def test_run_failure(self, fake_run_command, fake_upload, fake_download):
+        """``run`` raises RuntimeError describing the step that failed"""
+        fake_run_command.return_value.exitCode = 2
+        fake_download.return_value = 'useradd 0 10.0 10.5\nxsessionrc 1 10.5 10.75\n'
+
+        with self.assertRaises(RuntimeError) as err:
+            provision.run(MagicMock(), MagicMock(), 'alice', user='administrator', password='a')
+
+        self.assertTrue('.xsessionrc' in str(err.exception))
+
+    @patch.object(provision, '_download')
+    @patch.object(provision, '_upload')
+    @patch.object(provision.virtual_machine, 'run_command')
+    def test_run_no_report(self, fake_run_command, fake_upload, fake_download):
+        """``run`` still works if the report cannot be downloaded"""
+        fake_run_command.return_value.exitCode = 0
+        fake_download.side_effect = [RuntimeError('testing')]
+
+        output = provision.run(MagicMock(), MagicMock(), 'alice', user='administrator', password='a')
+
+        self.assertEqual(output['steps'], [])
+
+    @patch.object(provision, 'requests')
+    @patch.object(provision, 'time')
+    def test_upload_retries(self, fake_time, fake_requests):
+        """``_upload`` waits for VMware Tools to become available"""
+        fake_vcenter = MagicMock()
+        file_manager = fake_vcenter.content.guestOperationsManager.fileManager
+        file_manager.InitiateFileTransferToGuest.side_effect = [provision.vim.fault.GuestOperationsUnavailable(),
+                                                                 'https://some-url']
+
+        provision._upload(fake_vcenter, MagicMock(), MagicMock(), '/tmp/foo', b'data', init_timeout=5)
+
+        fake_requests.put.assert_called_with('https://some-url', data=b'data', verify=False)
+
+    @patch.object(provision, 'time')
+    def test_upload_timeout(self, fake_time):
+        """``_upload`` raises RuntimeError if VMware Tools never become available"""
+        fake_vcenter = MagicMock()
+        file_manager = fake_vcenter.content.guestOperationsManager.fileManager
+        file_manager.InitiateFileTransferToGuest.side_effect = provision.vim.fault.GuestOperationsUnavailable()
+
+        with self.assertRaises(RuntimeError):
+            provision._upload(fake_vcenter, MagicMock(), MagicMock(), '/tmp/foo', b'data', init_timeout=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in readiness.py
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_jumpbox_api.lib import readiness
+
+
+class TestReadiness(unittest.TestCase):
+    """A set of test cases for the Readiness object"""
+    @classmethod
+    def setUpClass(cls):
+        readiness.logger = MagicMock()
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.broken = MagicMock(side_effect=RuntimeError('testing'))
+        self.monitor = readiness.Readiness({'good': lambda: {'workers': 2}, 'bad': self.broken}, interval=10)
+        # Tests run the probes themselves, instead of in the background
+        self.monitor.start = MagicMock()
+
+    def test_status_not_checked(self):
+        """``Readiness.status`` isn't ready before the first round of probes"""
+        ready, dependencies = self.monitor.status()
+
+        self.assertFalse(ready)
+        self.assertEqual(dependencies['good']['error'], 'Not checked yet')
+
+    def test_status(self):
+        """``Readiness.status`` reports how each probe went, and how long it took"""
+        self.monitor.run_once()
+
+        ready, dependencies = self.monitor.status()
+
+        self.assertFalse(ready)
+        self.assertTrue(dependencies['good']['ok'])
+        self.assertEqual(dependencies['good']['workers'], 2)
+        self.assertFalse(dependencies['bad']['ok'])
+        self.assertEqual(dependencies['bad']['error'], 'testing')
+        self.assertTrue('latency_ms' in dependencies['bad'])
+
+    def test_status_ready(self):
+        """``Readiness.status`` is ready once every probe works"""
+        self.broken.side_effect = None
+        self.broken.return_value = None
+        self.monitor.run_once()
+
+        ready, _ = self.monitor.status()
+
+        self.assertTrue(ready)
+
+    @patch.object(readiness.time, 'time')
+    def test_status_stale(self, fake_time):
+        """``Readiness.status`` fails a dependency whose result is too old to trust"""
+        fake_time.return_value = 100.0
+        self.monitor.run_once()
+        fake_time.return_value = 100.0 + 10 * readiness.STALE_ROUNDS + 1
+
+        _, dependencies = self.monitor.status()
+
+        self.assertFalse(dependencies['good']['ok'])
+
+    def test_status_cached(self):
+        """``Readiness.status`` doesn't run any probes itself"""
+        self.monitor.status()
+
+        self.assertFalse(self.broken.called)
+
+    def test_start_once(self):
+        """``Readiness.start`` only starts one background thread per process"""
+        monitor = readiness.Readiness({}, interval=10)
+        monitor.start()
+        first = monitor._thread
+
+        monitor.start()
+        monitor.stop()
+
+        self.assertTrue(monitor._thread is first)
+
+
+class TestProbes(unittest.TestCase):
+    """A set of test cases for the readiness probes"""
+    def test_probe_workers(self):
+        """``probe_workers`` reports how many workers replied"""
+        fake_app = MagicMock()
+        fake_app.control.ping.return_value = [{'w1': 'pong'}, {'w2': 'pong'}]
+
+        output = readiness.probe_workers(fake_app)
+
+        self.assertEqual(output, {'workers': 2})
+
+    def test_probe_workers_none(self):
+        """``probe_workers`` raises RuntimeError when no worker replies"""
+        fake_app = MagicMock()
+        fake_app.control.ping.return_value = []
+
+        with self.assertRaises(RuntimeError):
+            readiness.probe_workers(fake_app)
+
+    def test_probe_broker(self):
+        """``probe_broker`` connects to the broker"""
+        fake_app = MagicMock()
+
+        readiness.probe_broker(fake_app)
+        conn = fake_app.connection_for_write.return_value.__enter__.return_value
+
+        self.assertTrue(conn.ensure_connection.called)
+
+    @patch.object(readiness.cache, 'shared', return_value=True)
+    def test_default_probes(self, fake_shared):
+        """``default_probes`` checks the broker, the workers and vCenter"""
+        probes = readiness.default_probes(MagicMock())
+
+        self.assertEqual(set(probes.keys()), {'broker', 'workers', 'vcenter'})
+
+    @patch.object(readiness.cache, 'shared', return_value=False)
+    def test_default_probes_private_cache(self, fake_shared):
+        """``default_probes`` can't see what the workers publish about vCenter without a shared cache"""
+        probes = readiness.default_probes(MagicMock())
+
+        self.assertEqual(set(probes.keys()), {'broker', 'workers'})
+
+    @patch.object(readiness.cache, 'get_vcenter_status')
+    def test_probe_vcenter(self, fake_get_vcenter_status):
+        """``probe_vcenter`` reports how long the workers' last login took"""
+        fake_get_vcenter_status.return_value = {'ok': True, 'error': None, 'latency_ms': 12.5}
+
+        output = readiness.probe_vcenter(readiness.placement.ring.primary)
+
+        self.assertEqual(output, {'login_ms': 12.5})
+
+    @patch.object(readiness.cache, 'get_vcenter_status')
+    def test_probe_vcenter_failed(self, fake_get_vcenter_status):
+        """``probe_vcenter`` raises RuntimeError when the workers' last login failed"""
+        fake_get_vcenter_status.return_value = {'ok': False, 'error': 'bad password', 'latency_ms': 1}
+
+        with self.assertRaises(RuntimeError):
+            readiness.probe_vcenter(readiness.placement.ring.primary)
+
+    @patch.object(readiness.cache, 'get_vcenter_status')
+    def test_probe_vcenter_unchecked(self, fake_get_vcenter_status):
+        """``probe_vcenter`` raises RuntimeError when no worker has checked vCenter recently"""
+        fake_get_vcenter_status.return_value = None
+
+        with self.assertRaises(RuntimeError):
+            readiness.probe_vcenter(readiness.placement.ring.primary)
+
+    def test_version(self):
+        """The version is looked up when the module is imported"""
+        self.assertTrue(isinstance(readiness.VERSION, str))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in scheduler.py
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_jumpbox_api.lib import cache
+from vlab_jumpbox_api.lib.worker import scheduler
+
+
+class TestDeployScheduler(unittest.TestCase):
+    """A set of test cases for the DeployScheduler object"""
+    @classmethod
+    def setUpClass(cls):
+        scheduler.logger = MagicMock()
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.backend = cache.MemoryBackend()
+        self.scheduler = scheduler.DeployScheduler(backend=self.backend,
+                                                   per_datastore=2,
+                                                   from_images=2,
+                                                   per_user=1,
+                                                   per_host=1,
+                                                   timeout=10)
+
+    def test_slot(self):
+        """``DeployScheduler.slot`` holds a slot while deploying, and releases it after"""
+        with self.scheduler.slot('alice', 'jumpBox', 'VM-Storage'):
+            in_flight = self.backend.count_slots('jumpbox:deploy:datastore:VM-Storage')
+        after = self.backend.count_slots('jumpbox:deploy:datastore:VM-Storage')
+
+        self.assertEqual(in_flight, 1)
+        self.assertEqual(after, 0)
+
+    def test_slot_error(self):
+        """``DeployScheduler.slot`` releases the slot if the deploy fails"""
+        try:
+            with self.scheduler.slot('alice', 'jumpBox', 'VM-Storage'):
+                raise RuntimeError('testing')
+        except RuntimeError:
+            pass
+
+        self.assertEqual(self.backend.count_slots('jumpbox:deploy:user:alice'), 0)
+
+    def test_slot_no_images(self):
+        """``DeployScheduler.slot`` does not take an images slot for linked clones"""
+        with self.scheduler.slot('alice', 'jumpBox', 'VM-Storage', uses_images=False):
+            in_flight = self.backend.count_slots('jumpbox:deploy:images')
+
+        self.assertEqual(in_flight, 0)
+
+    def test_slot_busy(self):
+        """``DeployScheduler.slot`` raises Busy instead of waiting, while the user has another deploy in flight"""
+        with self.scheduler.slot('alice', 'jumpBox', 'VM-Storage'):
+            with self.assertRaises(scheduler.Busy):
+                with self.scheduler.slot('alice', 'jumpBox2', 'VM-Storage'):
+                    pass
+
+            self.assertEqual(self.scheduler.stats['waiting'], 1)
+
+    def test_slot_no_queue(self):
+        """``DeployScheduler.slot`` with ``queue=False`` doesn't stand in line, nor take a slot someone is waiting for"""
+        limit = [('jumpbox:deploy:images', 2)]
+        self.backend.take_slots('bob/jumpBox', limit, 60, 60)
+        self.backend.take_slots('sam/jumpBox', limit, 60, 60)
+        with self.assertRaises(scheduler.Busy):
+            with self.scheduler.slot('alice', 'jumpBox', 'VM-Storage'):
+                pass
+        self.backend.release_slots('bob/jumpBox', ['jumpbox:deploy:images'])
+
+        with self.assertRaises(scheduler.Busy):
+            with self.scheduler.slot('warm', 'jumpBox-warm-1', 'VM-Storage', queue=False):
+                pass
+
+        self.assertEqual(self.scheduler.stats['waiting'], 1)
+        self.assertEqual(self.backend.get('jumpbox:deploy:since:warm/jumpBox-warm-1'), None)
+        with self.scheduler.slot('alice', 'jumpBox', 'VM-Storage'):
+            pass
+
+    def test_slot_all_or_nothing(self):
+        """``DeployScheduler.slot`` takes none of the shared slots when any of them is full"""
+        self.backend.take_slots('bob/jumpBox', [('jumpbox:deploy:images', 2)], 60, 60)
+        self.backend.take_slots('sam/jumpBox', [('jumpbox:deploy:images', 2)], 60, 60)
+
+        with self.assertRaises(scheduler.Busy):
+            with self.scheduler.slot('alice', 'jumpBox', 'VM-Storage'):
+                pass
+
+        self.assertEqual(self.backend.count_slots('jumpbox:deploy:datastore:VM-Storage'), 0)
+
+    def test_slot_first_come_first_served(self):
+        """``DeployScheduler.slot`` gives a freed slot to the deploy that's waited longest"""
+        limit = [('jumpbox:deploy:images', 2)]
+        self.backend.take_slots('bob/jumpBox', limit, 60, 60)
+        self.backend.take_slots('sam/jumpBox', limit, 60, 60)
+        for username in ('alice', 'dan'):
+            with self.assertRaises(scheduler.Busy):
+                with self.scheduler.slot(username, 'jumpBox', 'VM-Storage'):
+                    pass
+        self.backend.release_slots('bob/jumpBox', ['jumpbox:deploy:images'])
+
+        # Dan asked second, so Alice gets the free slot
+        with self.assertRaises(scheduler.Busy):
+            with self.scheduler.slot('dan', 'jumpBox', 'VM-Storage'):
+                pass
+        with self.scheduler.slot('alice', 'jumpBox', 'VM-Storage'):
+            pass
+
+    def test_slot_stats(self):
+        """``DeployScheduler.slot`` records how long a deploy waited once it gets a slot"""
+        self.backend.take_slots('bob/jumpBox', [('jumpbox:deploy:datastore:VM-Storage', 1)], 60, 60)
+        self.scheduler.per_datastore = 1
+        with self.assertRaises(scheduler.Busy):
+            with self.scheduler.slot('alice', 'jumpBox', 'VM-Storage'):
+                pass
+        self.backend.release_slots('bob/jumpBox', ['jumpbox:deploy:datastore:VM-Storage'])
+
+        with self.scheduler.slot('alice', 'jumpBox', 'VM-Storage'):
+            pass
+
+        self.assertEqual(self.scheduler.stats['acquired'], 1)
+        self.assertEqual(self.scheduler.stats['waiting'], 0)
+
+    @patch.object(scheduler, 'time')
+    def test_slot_timeout(self, fake_time):
+        """``DeployScheduler.slot`` raises RuntimeError if no slot frees up in time"""
+        fake_time.time.side_effect = [0, 11]
+        self.backend.take_slots('bob/jumpBox', [('jumpbox:deploy:datastore:VM-Storage', 2)], 60, 60)
+        self.backend.take_slots('sam/jumpBox', [('jumpbox:deploy:datastore:VM-Storage', 2)], 60, 60)
+
+        with self.assertRaises(scheduler.Busy):
+            with self.scheduler.slot('alice', 'jumpBox', 'VM-Storage'):
+                pass
+        with self.assertRaises(RuntimeError):
+            with self.scheduler.slot('alice', 'jumpBox', 'VM-Storage'):
+                pass
+
+        self.assertEqual(self.scheduler.stats['timeouts'], 1)
+        self.assertEqual(self.scheduler.stats['waiting'], 0)
+
+    def test_host(self):
+        """``DeployScheduler.host`` picks a host that isn't at its limit"""
+        busy = MagicMock()
+        busy.name = 'esxi-1'
+        free = MagicMock()
+        free.name = 'esxi-2'
+        self.backend.take_slots('bob/jumpBox', [('jumpbox:deploy:host:esxi-1', 1)], 60, 60)
+
+        with self.scheduler.host('alice', 'jumpBox', [busy, free]) as host:
+            in_flight = self.backend.count_slots('jumpbox:deploy:host:esxi-2')
+
+        self.assertTrue(host is free)
+        self.assertEqual(in_flight, 1)
+        self.assertEqual(self.backend.count_slots('jumpbox:deploy:host:esxi-2'), 0)
+
+    def test_host_busy(self):
+        """``DeployScheduler.host`` raises Busy when every host is at its limit"""
+        busy = MagicMock()
+        busy.name = 'esxi-1'
+        self.backend.take_slots('bob/jumpBox', [('jumpbox:deploy:host:esxi-1', 1)], 60, 60)
+
+        with self.assertRaises(scheduler.Busy):
+            with self.scheduler.host('alice', 'jumpBox', [busy]):
+                pass
+
+
+class TestWait(unittest.TestCase):
+    """A set of test cases for the ``wait`` function"""
+    @patch.object(scheduler.time, 'sleep')
+    def test_wait(self, fake_sleep):
+        """``wait`` sleeps, then calls the function again, when it raises Busy"""
+        func = MagicMock(side_effect=[scheduler.Busy(3), 'done'])
+
+        output = scheduler.wait(func, 'alice')
+
+        self.assertEqual(output, 'done')
+        fake_sleep.assert_called_with(3)
+
+
+if __name__ == '__main__':
+    unittest.main()
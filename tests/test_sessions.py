@@ -0,0 +1,131 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in sessions.py
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_jumpbox_api.lib.worker import sessions
+
+
+class TestSessionPool(unittest.TestCase):
+    """A set of test cases for the SessionPool object"""
+    @classmethod
+    def setUpClass(cls):
+        sessions.logger = MagicMock()
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.pool = sessions.SessionPool(host='vcenter', user='bob', password='a', max_size=2)
+
+    @patch.object(sessions, 'vCenter')
+    def test_session(self, fake_vCenter):
+        """``SessionPool.session`` yields a vCenter object"""
+        with self.pool.session() as vcenter:
+            pass
+
+        self.assertTrue(vcenter is fake_vCenter.return_value)
+
+    @patch.object(sessions, 'vCenter')
+    def test_session_reused(self, fake_vCenter):
+        """``SessionPool.session`` reuses idle sessions instead of logging in again"""
+        with self.pool.session():
+            pass
+        with self.pool.session():
+            pass
+
+        self.assertEqual(fake_vCenter.call_count, 1)
+
+    @patch.object(sessions, 'vCenter')
+    def test_stats(self, fake_vCenter):
+        """``SessionPool.stats`` counts hits and misses"""
+        with self.pool.session():
+            pass
+        with self.pool.session():
+            pass
+
+        stats = self.pool.stats
+
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    @patch.object(sessions, 'vCenter')
+    def test_session_expired(self, fake_vCenter):
+        """``SessionPool.session`` reconnects when vCenter expired the session"""
+        self.pool.check_interval = -1
+        with self.pool.session() as vcenter:
+            vcenter.content.sessionManager.currentSession = None
+        with self.pool.session():
+            pass
+
+        self.assertEqual(fake_vCenter.call_count, 2)
+        self.assertEqual(self.pool.stats['reconnects'], 1)
+
+    @patch.object(sessions, 'vCenter')
+    def test_session_max_idle(self, fake_vCenter):
+        """``SessionPool.session`` closes sessions that have been idle too long"""
+        self.pool.max_idle = -1
+        with self.pool.session() as vcenter:
+            pass
+        with self.pool.session():
+            pass
+
+        self.assertTrue(vcenter.close.called)
+        self.assertEqual(fake_vCenter.call_count, 2)
+
+    @patch.object(sessions, 'vCenter')
+    def test_session_error(self, fake_vCenter):
+        """``SessionPool.session`` health checks a session that was used when an error occurred"""
+        try:
+            with self.pool.session():
+                raise ValueError('testing')
+        except ValueError:
+            pass
+        with self.pool.session() as vcenter:
+            pass
+
+        self.assertTrue(vcenter.content.sessionManager.currentSession is not None)
+        self.assertEqual(fake_vCenter.call_count, 1)
+
+    @patch.object(sessions, 'vCenter')
+    def test_session_max_size(self, fake_vCenter):
+        """``SessionPool.session`` raises RuntimeError if the pool is exhausted"""
+        with self.pool.session():
+            with self.pool.session():
+                with self.assertRaises(RuntimeError):
+                    with self.pool.session(timeout=0):
+                        pass
+
+    @patch.object(sessions, 'vCenter')
+    def test_clear(self, fake_vCenter):
+        """``SessionPool.clear`` logs out of idle sessions"""
+        with self.pool.session() as vcenter:
+            pass
+
+        self.pool.clear()
+
+        self.assertTrue(vcenter.close.called)
+        self.assertEqual(self.pool.stats['idle'], 0)
+
+
+class TestGetPool(unittest.TestCase):
+    """A set of test cases for the ``get_pool`` function"""
+    def test_default(self):
+        """``get_pool`` returns the default pool for a shard on the default vCenter"""
+        shard = MagicMock(server=sessions.const.INF_VCENTER_SERVER, port=sessions.const.INF_VCENTER_PORT)
+
+        self.assertTrue(sessions.get_pool(shard) is sessions.pool)
+
+    def test_other_server(self):
+        """``get_pool`` makes one pool per vCenter server"""
+        shard = MagicMock(server='vc-other', port=443)
+
+        first = sessions.get_pool(shard)
+        second = sessions.get_pool(shard)
+
+        self.assertTrue(first is second)
+        self.assertEqual(first.host, 'vc-other')
+
+
+if __name__ == '__main__':
+    unittest.main()
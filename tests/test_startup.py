@@ -0,0 +1,38 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of unit tests for the startup cost of the API
+"""
+import os
+import unittest
+
+import startup
+
+
+class TestStartup(unittest.TestCase):
+    """A set of test cases for importing the API in a fresh process"""
+    @classmethod
+    def setUpClass(cls):
+        """Runs once for the whole test suite"""
+        cls.report = startup.measure()
+
+    def test_no_worker_modules(self):
+        """Importing the API doesn't load pyVmomi, or any of the worker code"""
+        self.assertEqual(self.report['forbidden'], [])
+
+    # Timing and memory depend on the machine, so only check them when asked
+    @unittest.skipUnless(os.environ.get('VLAB_JUMPBOX_STARTUP_BUDGET'), 'set VLAB_JUMPBOX_STARTUP_BUDGET to check')
+    def test_within_budget(self):
+        """Importing the API stays within the time and memory budget"""
+        self.assertEqual(startup.check(self.report), [])
+
+    def test_check(self):
+        """``check`` reports every budget that's exceeded"""
+        report = {'seconds': 10.0, 'rss_mb': 500.0, 'forbidden': ['pyVmomi']}
+
+        problems = startup.check(report, max_seconds=1, max_rss_mb=1)
+
+        self.assertEqual(len(problems), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
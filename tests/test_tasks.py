@@ -8,10 +8,11 @@ from unittest.mock import patch, MagicMock
 from vlab_jumpbox_api.lib.worker import tasks
 
 
+@patch.object(tasks, 'cache')
 class TestTasks(unittest.TestCase):
     """A set of test cases for tasks.py"""
     @patch.object(tasks, 'vmware')
-    def test_show_ok(self, fake_vmware):
+    def test_show_ok(self, fake_vmware, fake_cache):
         """``show`` returns a dictionary when everything works as expected"""
         fake_vmware.show_jumpbox.return_value = {'worked': True}
 
@@ -21,7 +22,7 @@ class TestTasks(unittest.TestCase):
         self.assertEqual(output, expected)
 
     @patch.object(tasks, 'vmware')
-    def test_show_value_error(self, fake_vmware):
+    def test_show_value_error(self, fake_vmware, fake_cache):
         """``show`` sets the error in the dictionary to the ValueError message"""
         fake_vmware.show_jumpbox.side_effect = [ValueError("testing")]
 
@@ -31,7 +32,7 @@ class TestTasks(unittest.TestCase):
         self.assertEqual(output, expected)
 
     @patch.object(tasks, 'vmware')
-    def test_create_ok(self, fake_vmware):
+    def test_create_ok(self, fake_vmware, fake_cache):
         """``create`` returns a dictionary when everything works as expected"""
         fake_vmware.create_jumpbox.return_value = {'worked': True}
 
@@ -41,7 +42,7 @@ class TestTasks(unittest.TestCase):
         self.assertEqual(output, expected)
 
     @patch.object(tasks, 'vmware')
-    def test_create_value_error(self, fake_vmware):
+    def test_create_value_error(self, fake_vmware, fake_cache):
         """``create`` sets the error in the dictionary to the ValueError message"""
         fake_vmware.create_jumpbox.side_effect = [ValueError("testing")]
 
@@ -51,7 +52,7 @@ class TestTasks(unittest.TestCase):
         self.assertEqual(output, expected)
 
     @patch.object(tasks, 'vmware')
-    def test_delete_ok(self, fake_vmware):
+    def test_delete_ok(self, fake_vmware, fake_cache):
         """``delete`` returns a dictionary when everything works as expected"""
         fake_vmware.delete_jumpbox.return_value = {'worked': True}
 
@@ -61,7 +62,7 @@ class TestTasks(unittest.TestCase):
         self.assertEqual(output, expected)
 
     @patch.object(tasks, 'vmware')
-    def test_delete_value_error(self, fake_vmware):
+    def test_delete_value_error(self, fake_vmware, fake_cache):
         """``delete`` sets the error in the dictionary to the ValueError message"""
         fake_vmware.delete_jumpbox.side_effect = [ValueError("testing")]
 
@@ -70,6 +71,382 @@ class TestTasks(unittest.TestCase):
 
         self.assertEqual(output, expected)
 
+    @patch.object(tasks, 'vmware')
+    def test_show_caches(self, fake_vmware, fake_cache):
+        """``show`` caches the info about the jumpbox"""
+        fake_vmware.show_jumpbox.return_value = {'worked': True}
+
+        tasks.show(username='bob')
+
+        fake_cache.set_show.assert_called_with('bob', {'worked': True})
+
+    @patch.object(tasks, 'vmware')
+    def test_create_invalidates(self, fake_vmware, fake_cache):
+        """``create`` invalidates the cached info about the jumpbox"""
+        fake_vmware.create_jumpbox.return_value = {'worked': True}
+
+        tasks.create(username='bob', network='someNetwork')
+
+        fake_cache.invalidate_show.assert_called_with('bob')
+
+    @patch.object(tasks, 'vmware')
+    def test_create_busy(self, fake_vmware, fake_cache):
+        """``create`` retries later when the deploy slots are busy, and keeps the request in flight"""
+        fake_vmware.create_jumpbox.side_effect = tasks.scheduler.Busy(5)
+
+        with patch.object(tasks.create, 'retry', side_effect=RuntimeError('retry')) as fake_retry:
+            with self.assertRaises(RuntimeError):
+                tasks.create(username='bob', network='someLAN')
+
+        fake_retry.assert_called_with(countdown=5, max_retries=None)
+        self.assertFalse(fake_cache.release_task.called)
+
+    @patch.object(tasks, 'vmware')
+    def test_create_releases(self, fake_vmware, fake_cache):
+        """``create`` forgets the in flight task, so the user can send another"""
+        tasks.create(username='bob', network='someLAN')
+
+        fake_cache.release_task.assert_called_with('bob', 'create')
+
+    @patch.object(tasks, 'vmware')
+    def test_create_locked(self, fake_vmware, fake_cache):
+        """``create`` sets the error when another change to the user's jumpbox is still running"""
+        fake_cache.user_lock.side_effect = ValueError('testing')
+
+        output = tasks.create(username='bob', network='someLAN')
+
+        self.assertEqual(output['error'], 'testing')
+        self.assertFalse(fake_vmware.create_jumpbox.called)
+
+    @patch.object(tasks, 'vmware')
+    def test_create_progress(self, fake_vmware, fake_cache):
+        """``create`` publishes the stage of the create as task progress"""
+        fake_task = MagicMock()
+        fake_task.request.id = 'some-task-id'
+        callback = tasks._create_progress(fake_task)
+
+        callback('deploying', 42)
+
+        _, the_kwargs = fake_task.update_state.call_args
+        expected = {'content': {'stage': 'deploying', 'percent': 42}, 'error': None, 'params': {}}
+
+        self.assertEqual(the_kwargs['state'], 'PROGRESS')
+        self.assertEqual(the_kwargs['meta'], expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_create_progress_no_task(self, fake_vmware, fake_cache):
+        """``create`` doesn't publish progress when it's not run as a Celery task"""
+        fake_task = MagicMock()
+        fake_task.request.id = None
+        callback = tasks._create_progress(fake_task)
+
+        callback('deploying', 42)
+
+        self.assertFalse(fake_task.update_state.called)
+
+    @patch.object(tasks, 'vmware')
+    def test_refresh_networks(self, fake_vmware, fake_cache):
+        """``refresh_networks`` returns the names of every network"""
+        fake_vmware.refresh_networks.return_value = ['someNetwork']
+
+        output = tasks.refresh_networks()
+        expected = {'content' : {'networks': ['someNetwork']}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_delete_invalidates(self, fake_vmware, fake_cache):
+        """``delete`` invalidates the cached info about the jumpbox"""
+        fake_vmware.delete_jumpbox.return_value = {'worked': True}
+
+        tasks.delete(username='bob')
+
+        fake_cache.invalidate_show.assert_called_with('bob')
+
+    @patch.object(tasks, 'vmware')
+    def test_reset_ok(self, fake_vmware, fake_cache):
+        """``reset`` returns a dictionary when everything works as expected"""
+        fake_vmware.reset_jumpbox.return_value = {'worked': True}
+
+        output = tasks.reset(username='bob')
+        expected = {'content' : {'worked': True}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_reset_value_error(self, fake_vmware, fake_cache):
+        """``reset`` sets the error in the dictionary to the ValueError message"""
+        fake_vmware.reset_jumpbox.side_effect = [ValueError("testing")]
+
+        output = tasks.reset(username='bob')
+        expected = {'content' : {}, 'error': 'testing', 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_reset_releases(self, fake_vmware, fake_cache):
+        """``reset`` lets the user submit another reset once it's done"""
+        tasks.reset(username='bob')
+
+        fake_cache.invalidate_show.assert_called_with('bob')
+        fake_cache.release_task.assert_called_with('bob', 'reset')
+
+    @patch.object(tasks, 'vmware')
+    def test_resume_ok(self, fake_vmware, fake_cache):
+        """``resume`` returns a dictionary when everything works as expected"""
+        fake_vmware.resume_jumpbox.return_value = {'worked': True}
+
+        output = tasks.resume(username='bob')
+        expected = {'content' : {'worked': True}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_resume_value_error(self, fake_vmware, fake_cache):
+        """``resume`` sets the error in the dictionary to the ValueError message"""
+        fake_vmware.resume_jumpbox.side_effect = [ValueError("testing")]
+
+        output = tasks.resume(username='bob')
+        expected = {'content' : {}, 'error': 'testing', 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_resume_clears_idle(self, fake_vmware, fake_cache):
+        """``resume`` starts the idle clock over, since the user is connecting"""
+        tasks.resume(username='bob')
+
+        fake_cache.clear_idle.assert_called_with('bob')
+        fake_cache.release_task.assert_called_with('bob', 'resume')
+
+    @patch.object(tasks, 'vmware')
+    def test_suspend_idle(self, fake_vmware, fake_cache):
+        """``suspend_idle`` returns who had their jumpbox suspended"""
+        fake_cache.backend.add.return_value = True
+        fake_vmware.suspend_idle.return_value = ['bob']
+
+        output = tasks.suspend_idle()
+        expected = {'content' : {'suspended': ['bob']}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+        fake_cache.invalidate_show.assert_called_with('bob')
+
+    @patch.object(tasks, 'vmware')
+    def test_suspend_idle_running(self, fake_vmware, fake_cache):
+        """``suspend_idle`` does nothing if another sweep is already running"""
+        fake_cache.backend.add.return_value = False
+
+        tasks.suspend_idle()
+
+        self.assertFalse(fake_vmware.suspend_idle.called)
+
+    @patch.object(tasks, 'vmware')
+    def test_check_vcenters(self, fake_vmware, fake_cache):
+        """``check_vcenters`` publishes the status of every vCenter for the API"""
+        status = {'ok': True, 'error': None, 'latency_ms': 5}
+        fake_vmware.check_vcenters.return_value = {'vc1': status}
+
+        tasks.check_vcenters()
+        the_args, _ = fake_cache.set_vcenter_status.call_args
+
+        self.assertEqual(the_args[:2], ('vc1', status))
+
+    @patch.object(tasks.warm_pool, 'enabled', return_value=True)
+    @patch.object(tasks.warm_pool, 'NETWORKS', ['someNetwork'])
+    @patch.object(tasks, 'vmware')
+    def test_refill_warm_pool(self, fake_vmware, fake_enabled, fake_cache):
+        """``refill_warm_pool`` returns a dictionary when everything works as expected"""
+        fake_cache.backend.add.return_value = True
+        fake_vmware.refill_warm_pool.return_value = {'worked': True}
+
+        output = tasks.refill_warm_pool()
+        expected = {'content' : {'worked': True}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks.warm_pool, 'enabled', return_value=False)
+    @patch.object(tasks.warm_pool, 'NETWORKS', ['someNetwork'])
+    @patch.object(tasks, 'vmware')
+    def test_refill_warm_pool_disabled(self, fake_vmware, fake_enabled, fake_cache):
+        """``refill_warm_pool`` does nothing when this worker isn't configured for a warm pool"""
+        fake_cache.backend.add.return_value = True
+
+        tasks.refill_warm_pool()
+
+        self.assertFalse(fake_vmware.refill_warm_pool.called)
+
+    def test_refill_warm_pool_scheduled(self, fake_cache):
+        """The warm pool refill is scheduled whatever beat's own pool size is"""
+        self.assertTrue('refill-warm-pool' in tasks.app.conf.beat_schedule)
+
+    @patch.object(tasks, 'warm_pool')
+    @patch.object(tasks, 'metrics')
+    @patch.object(tasks, 'sessions')
+    @patch.object(tasks, 'placement')
+    def test_record_stats(self, fake_placement, fake_sessions, fake_metrics, fake_warm_pool, fake_cache):
+        """``record_stats`` publishes the session pool of every vCenter, labeled by shard"""
+        east, west = MagicMock(), MagicMock()
+        east.name, west.name = 'east', 'west'
+        fake_placement.ring.servers.return_value = [east, west]
+        fake_sessions.get_pool.side_effect = lambda shard: MagicMock(stats={'hits': shard.name})
+
+        tasks.record_stats()
+
+        fake_metrics.record_stats.assert_any_call('session_pool', {'hits': 'east'}, 'east')
+        fake_metrics.record_stats.assert_any_call('session_pool', {'hits': 'west'}, 'west')
+
+    @patch.object(tasks.warm_pool, 'enabled', return_value=True)
+    @patch.object(tasks.warm_pool, 'NETWORKS', ['someNetwork'])
+    @patch.object(tasks, 'vmware')
+    def test_refill_warm_pool_running(self, fake_vmware, fake_enabled, fake_cache):
+        """``refill_warm_pool`` does nothing if another refill is already running"""
+        fake_cache.backend.add.return_value = False
+
+        tasks.refill_warm_pool()
+
+        self.assertFalse(fake_vmware.refill_warm_pool.called)
+
+    @patch.object(tasks, 'vmware')
+    def test_import_template(self, fake_vmware, fake_cache):
+        """``import_template`` returns a dictionary when everything works as expected"""
+        fake_vmware.import_template.return_value = {'worked': True}
+
+        output = tasks.import_template(network='someNetwork')
+        expected = {'content' : {'worked': True}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_import_template_value_error(self, fake_vmware, fake_cache):
+        """``import_template`` sets the error in the dictionary to the ValueError message"""
+        fake_vmware.import_template.side_effect = [ValueError("testing")]
+
+        output = tasks.import_template(network='someNetwork')
+        expected = {'content' : {}, 'error': 'testing', 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_bulk_create(self, fake_vmware, fake_cache):
+        """``bulk_create`` returns the per-user results"""
+        fake_vmware.bulk_create.return_value = {'alice': {'content': {}, 'error': None}}
+
+        output = tasks.bulk_create(jumpboxes=[{'username': 'alice', 'network': 'someNetwork'}])
+        expected = {'content' : {'alice': {'content': {}, 'error': None}}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_bulk_delete(self, fake_vmware, fake_cache):
+        """``bulk_delete`` returns the per-user results"""
+        fake_vmware.bulk_delete.return_value = {'alice': {'content': None, 'error': None}}
+
+        output = tasks.bulk_delete(usernames=['alice'])
+        expected = {'content' : {'alice': {'content': None, 'error': None}}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    def test_bulk_progress(self, fake_cache):
+        """``_bulk_progress`` publishes each user's result as task progress"""
+        fake_task = MagicMock()
+        results = {}
+        callback = tasks._bulk_progress(fake_task, results)
+
+        callback('alice', {'content': {}, 'error': None})
+        _, the_kwargs = fake_task.update_state.call_args
+
+        self.assertEqual(the_kwargs['state'], 'PROGRESS')
+        self.assertEqual(the_kwargs['meta']['content'], {'alice': {'content': {}, 'error': None}})
+        fake_cache.invalidate_show.assert_called_with('alice')
+
+    @patch.object(tasks, 'aio')
+    @patch.object(tasks, 'const')
+    @patch.object(tasks, 'vmware')
+    def test_show_async(self, fake_vmware, fake_const, fake_aio, fake_cache):
+        """``show`` uses the asyncio client when VLAB_JUMPBOX_ASYNC is set"""
+        fake_const.VLAB_JUMPBOX_ASYNC = True
+        fake_aio.run.return_value = {'worked': True}
+
+        output = tasks.show(username='bob')
+        expected = {'content' : {'worked': True}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+        self.assertFalse(fake_vmware.show_jumpbox.called)
+
+    @patch.object(tasks, 'confirm_delete')
+    @patch.object(tasks, 'const')
+    @patch.object(tasks, 'vmware')
+    def test_delete_no_wait(self, fake_vmware, fake_const, fake_confirm_delete, fake_cache):
+        """``delete`` confirms the destroy in the background when VLAB_JUMPBOX_DELETE_WAIT is off"""
+        fake_const.VLAB_JUMPBOX_ASYNC = False
+        fake_const.VLAB_JUMPBOX_DELETE_WAIT = False
+        fake_vmware.delete_jumpbox.return_value = ['task-1']
+        fake_cache.acquire_user_lock.return_value = 'some-token'
+
+        output = tasks.delete(username='bob')
+        expected = {'content' : {}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+        fake_confirm_delete.delay.assert_called_with('bob', ['task-1'], 'some-token')
+
+    @patch.object(tasks, 'confirm_delete')
+    @patch.object(tasks, 'const')
+    @patch.object(tasks, 'vmware')
+    def test_delete_no_wait_keeps_lock(self, fake_vmware, fake_const, fake_confirm_delete, fake_cache):
+        """``delete`` leaves the lock and in flight delete for ``confirm_delete`` to release"""
+        fake_const.VLAB_JUMPBOX_ASYNC = False
+        fake_const.VLAB_JUMPBOX_DELETE_WAIT = False
+        fake_vmware.delete_jumpbox.return_value = ['task-1']
+
+        tasks.delete(username='bob')
+
+        self.assertFalse(fake_cache.release_user_lock.called)
+        self.assertFalse(fake_cache.release_task.called)
+
+    @patch.object(tasks, 'const')
+    @patch.object(tasks, 'vmware')
+    def test_delete_releases(self, fake_vmware, fake_const, fake_cache):
+        """``delete`` releases the lock and in flight delete when it waits for the destroy itself"""
+        fake_const.VLAB_JUMPBOX_ASYNC = False
+        fake_const.VLAB_JUMPBOX_DELETE_WAIT = True
+        fake_cache.acquire_user_lock.return_value = 'some-token'
+
+        tasks.delete(username='bob')
+
+        fake_cache.release_user_lock.assert_called_with('bob', 'some-token')
+        fake_cache.release_task.assert_called_with('bob', 'delete')
+
+    @patch.object(tasks, 'vmware')
+    def test_confirm_delete_releases(self, fake_vmware, fake_cache):
+        """``confirm_delete`` releases the lock and in flight delete it was handed"""
+        tasks.confirm_delete(username='bob', task_ids=['task-1'], lock_token='some-token')
+
+        fake_cache.release_user_lock.assert_called_with('bob', 'some-token')
+        fake_cache.release_task.assert_called_with('bob', 'delete')
+
+    @patch.object(tasks, 'vmware')
+    def test_confirm_delete(self, fake_vmware, fake_cache):
+        """``confirm_delete`` sets the error when a destroy task fails"""
+        fake_vmware.confirm_delete.side_effect = RuntimeError('testing')
+
+        output = tasks.confirm_delete(username='bob', task_ids=['task-1'])
+        expected = {'content' : {}, 'error': 'testing', 'params': {}}
+
+        self.assertEqual(output, expected)
+        fake_cache.invalidate_show.assert_called_with('bob')
+
+    @patch.object(tasks, 'aio')
+    @patch.object(tasks, 'const')
+    @patch.object(tasks, 'vmware')
+    def test_delete_async(self, fake_vmware, fake_const, fake_aio, fake_cache):
+        """``delete`` uses the asyncio client when VLAB_JUMPBOX_ASYNC is set"""
+        fake_const.VLAB_JUMPBOX_ASYNC = True
+
+        tasks.delete(username='bob')
+
+        fake_aio.run.assert_called_with(fake_aio.delete_jumpbox, 'bob', shard=tasks.placement.ring.lookup('bob'))
+        self.assertFalse(fake_vmware.delete_jumpbox.called)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,103 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in templates.py
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_jumpbox_api.lib.worker import templates
+
+
+class TestTemplates(unittest.TestCase):
+    """A set of test cases for the templates.py module"""
+    @classmethod
+    def setUpClass(cls):
+        templates.logger = MagicMock()
+
+    def test_template_name(self):
+        """``template_name`` strips the file extension off the image name"""
+        output = templates.template_name('jumpBox-Ubuntu18.04.ova')
+        expected = 'jumpBox-Ubuntu18.04'
+
+        self.assertEqual(output, expected)
+
+    @patch.object(templates.inventory, 'retrieve')
+    @patch.object(templates.inventory, 'get_user_folder')
+    def test_find(self, fake_get_user_folder, fake_retrieve):
+        """``find`` returns the template and its snapshot"""
+        fake_retrieve.return_value = [('vm-1', {'name': 'jumpBox-Ubuntu18.04', 'snapshot.currentSnapshot': 'snap-1'})]
+
+        output = templates.find(MagicMock(), 'jumpBox-Ubuntu18.04.ova')
+        expected = ('vm-1', 'snap-1')
+
+        self.assertEqual(output, expected)
+
+    @patch.object(templates.inventory, 'retrieve')
+    @patch.object(templates.inventory, 'get_user_folder')
+    def test_find_no_snapshot(self, fake_get_user_folder, fake_retrieve):
+        """``find`` ignores a template that has no snapshot yet"""
+        fake_retrieve.return_value = [('vm-1', {'name': 'jumpBox-Ubuntu18.04'})]
+
+        output = templates.find(MagicMock(), 'jumpBox-Ubuntu18.04.ova')
+        expected = (None, None)
+
+        self.assertEqual(output, expected)
+
+    @patch.object(templates.inventory, 'get_user_folder')
+    def test_find_no_folder(self, fake_get_user_folder):
+        """``find`` returns (None, None) when the template folder does not exist"""
+        fake_get_user_folder.side_effect = [ValueError('testing')]
+
+        output = templates.find(MagicMock(), 'jumpBox-Ubuntu18.04.ova')
+        expected = (None, None)
+
+        self.assertEqual(output, expected)
+
+    @patch.object(templates, 'consume_task')
+    def test_snapshot(self, fake_consume_task):
+        """``snapshot`` takes a snapshot without memory"""
+        fake_vm = MagicMock()
+
+        templates.snapshot(fake_vm)
+        _, the_kwargs = fake_vm.CreateSnapshot_Task.call_args
+
+        self.assertFalse(the_kwargs['memory'])
+        self.assertEqual(the_kwargs['name'], templates.SNAPSHOT_NAME)
+
+    @patch.object(templates, '_nic_change')
+    @patch.object(templates, 'consume_task')
+    def test_clone(self, fake_consume_task, fake_nic_change):
+        """``clone`` makes a linked clone of the snapshot"""
+        fake_nic_change.return_value = templates.vim.vm.device.VirtualDeviceSpec()
+        fake_template = MagicMock()
+        fake_snapshot = templates.vim.vm.Snapshot('snapshot-1')
+
+        templates.clone(fake_template, fake_snapshot, 'someFolder', 'jumpBox', 'someNetwork')
+        spec = fake_template.CloneVM_Task.call_args[1]['spec']
+
+        self.assertEqual(spec.location.diskMoveType, 'createNewChildDiskBacking')
+        self.assertTrue(spec.snapshot is fake_snapshot)
+
+    def test_nic_change(self):
+        """``_nic_change`` connects the first NIC to the supplied network"""
+        nic = templates.vim.vm.device.VirtualVmxnet3()
+        fake_template = MagicMock()
+        fake_template.config.hardware.device = [templates.vim.vm.device.VirtualDisk(), nic]
+        network = templates.vim.Network('network-1')
+        with patch.object(templates.vim.Network, 'name', 'someNetwork', create=True):
+            output = templates._nic_change(fake_template, network)
+
+        self.assertTrue(output.device is nic)
+        self.assertEqual(output.device.backing.deviceName, 'someNetwork')
+
+    def test_nic_change_no_nic(self):
+        """``_nic_change`` raises RuntimeError if the template has no NIC"""
+        fake_template = MagicMock()
+        fake_template.config.hardware.device = [templates.vim.vm.device.VirtualDisk()]
+
+        with self.assertRaises(RuntimeError):
+            templates._nic_change(fake_template, MagicMock())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the upload.py module, against a local HTTP server
+"""
+import io
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from unittest.mock import MagicMock
+
+from vlab_jumpbox_api.lib.worker import upload
+
+
+class _FakeNfc(BaseHTTPRequestHandler):
+    """Stands in for the NFC service of an ESXi host"""
+    def do_POST(self):
+        """Record the uploaded disk"""
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        with self.server.lock:
+            self.server.received[self.path] = body
+            self.server.content_types.append(self.headers['Content-Type'])
+            self.server.active += 1
+            self.server.most_active = max(self.server.most_active, self.server.active)
+        # Give the other uploads a chance to overlap with this one
+        self.server.overlap.wait(1)
+        with self.server.lock:
+            self.server.active -= 1
+        self.send_response(self.server.status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        """Keep the test output clean"""
+        pass
+
+
+class _UnbufferedReader(object):
+    """A reader without ``readinto``, like the memory mapped disks"""
+    def __init__(self, data):
+        self._data = memoryview(data)
+        self._position = 0
+        self.reads = []
+
+    def read(self, amount):
+        chunk = self._data[self._position:self._position + amount]
+        self._position += len(chunk)
+        self.reads.append(len(chunk))
+        return chunk
+
+
+class TestDiskUploader(unittest.TestCase):
+    """A set of test cases for the DiskUploader object"""
+    @classmethod
+    def setUpClass(cls):
+        upload.logger = MagicMock()
+
+    def setUp(self):
+        """Runs before every test case"""
+        # Each upload is handled on its own thread, like a real NFC server
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _FakeNfc)
+        self.server.received = {}
+        self.server.content_types = []
+        self.server.lock = threading.Lock()
+        self.server.overlap = threading.Event()
+        self.server.active = 0
+        self.server.most_active = 0
+        self.server.status = 200
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.uploader = upload.DiskUploader(connections=2, chunk_size=64)
+
+    def tearDown(self):
+        """Runs after every test case"""
+        self.server.overlap.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_upload(self):
+        """``DiskUploader.upload`` sends every byte of every disk"""
+        disks = [(self.url + '/nfc/disk-0.vmdk', io.BytesIO(b'a' * 1000), 1000),
+                 (self.url + '/nfc/disk-1.vmdk', io.BytesIO(b'b' * 300), 300)]
+
+        self.uploader.upload(disks)
+
+        self.assertEqual(self.server.received['/nfc/disk-0.vmdk'], b'a' * 1000)
+        self.assertEqual(self.server.received['/nfc/disk-1.vmdk'], b'b' * 300)
+        self.assertEqual(self.server.content_types, [upload.CONTENT_TYPE] * 2)
+
+    def test_upload_concurrent(self):
+        """``DiskUploader.upload`` sends several disks at the same time"""
+        disks = [(self.url + '/nfc/disk-{}.vmdk'.format(x), io.BytesIO(b'a' * 100), 100) for x in range(2)]
+        # Both requests must be in flight at once for the server to finish either
+        release = threading.Timer(0.5, self.server.overlap.set)
+        release.start()
+
+        self.uploader.upload(disks)
+        release.cancel()
+
+        self.assertEqual(self.server.most_active, 2)
+
+    def test_upload_zero_copy(self):
+        """``DiskUploader.upload`` reads readers without ``readinto`` in chunk sized pieces"""
+        reader = _UnbufferedReader(b'c' * 200)
+        self.server.overlap.set()
+
+        self.uploader.upload([(self.url + '/nfc/disk-0.vmdk', reader, 200)])
+
+        self.assertEqual(reader.reads, [64, 64, 64, 8])
+        self.assertEqual(self.server.received['/nfc/disk-0.vmdk'], b'c' * 200)
+
+    def test_upload_host(self):
+        """``DiskUploader.upload`` replaces the ``*`` in the URL with the host"""
+        self.server.overlap.set()
+
+        self.uploader.upload([('http://*:{}/nfc/disk-0.vmdk'.format(self.server.server_port),
+                               io.BytesIO(b'a'), 1)],
+                             host='127.0.0.1')
+
+        self.assertEqual(self.server.received['/nfc/disk-0.vmdk'], b'a')
+
+    def test_upload_progress(self):
+        """``DiskUploader.upload`` reports how many bytes were sent, and how fast"""
+        self.server.overlap.set()
+        reports = []
+
+        self.uploader.upload([(self.url + '/nfc/disk-0.vmdk', io.BytesIO(b'a' * 200), 200)],
+                             callback=reports.append)
+
+        self.assertEqual([x['sent'] for x in reports], [64, 128, 192, 200])
+        self.assertEqual(reports[-1]['percent'], 100)
+        self.assertTrue(reports[-1]['bytes_per_second'] > 0)
+
+    def test_upload_rejected(self):
+        """``DiskUploader.upload`` raises RuntimeError when the server rejects a disk"""
+        self.server.status = 500
+        self.server.overlap.set()
+
+        with self.assertRaises(RuntimeError):
+            self.uploader.upload([(self.url + '/nfc/disk-0.vmdk', io.BytesIO(b'a'), 1)])
+
+    def test_upload_short_disk(self):
+        """``DiskUploader.upload`` raises RuntimeError when a disk is smaller than its size"""
+        self.server.overlap.set()
+
+        with self.assertRaises(RuntimeError):
+            self.uploader.upload([(self.url + '/nfc/disk-0.vmdk', io.BytesIO(b'a' * 10), 20)])
+
+
+class TestChunks(unittest.TestCase):
+    """A set of test cases for the ``_chunks`` function"""
+    def test_reuses_buffer(self):
+        """``_chunks`` reads every chunk into the same buffer"""
+        chunks = upload._chunks(io.BytesIO(b'abcdefgh'), 8, 3)
+
+        first = next(chunks)
+        first_data = bytes(first)
+        second = next(chunks)
+
+        self.assertEqual(first_data, b'abc')
+        self.assertEqual(bytes(second), b'def')
+        self.assertTrue(first.obj is second.obj)
+
+    def test_stops_at_size(self):
+        """``_chunks`` doesn't read past the size of the disk"""
+        chunks = [bytes(x) for x in upload._chunks(io.BytesIO(b'abcdefgh'), 5, 3)]
+
+        self.assertEqual(chunks, [b'abc', b'de'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,14 +15,11 @@ class TestVMware(unittest.TestCase):
         vmware.logger = MagicMock()
 
     @patch.object(vmware.virtual_machine, 'get_info')
-    @patch.object(vmware, 'vCenter')
-    def test_show_jumpbox(self, fake_vCenter, fake_get_info):
+    @patch.object(vmware.inventory, 'get_user_vms')
+    @patch.object(vmware, 'sessions')
+    def test_show_jumpbox(self, fake_sessions, fake_get_user_vms, fake_get_info):
         """``show_jumpbox`` returns a dictionary when everything works as expected"""
-        fake_vm = MagicMock()
-        fake_vm.name = 'jumpBox'
-        fake_folder = MagicMock()
-        fake_folder.childEntity = [fake_vm]
-        fake_vCenter.return_value.__enter__.return_value.get_by_name.return_value = fake_folder
+        fake_get_user_vms.return_value = [MagicMock()]
         fake_get_info.return_value = {'worked': True}
 
         output = vmware.show_jumpbox(username='alice')
@@ -30,25 +27,48 @@ class TestVMware(unittest.TestCase):
 
         self.assertEqual(output, expected)
 
-    @patch.object(vmware, 'vCenter')
-    def test_show_jumpbox_nothing(self, fake_vCenter):
+    @patch.object(vmware.inventory, 'get_user_vms')
+    @patch.object(vmware, 'sessions')
+    def test_has_jumpbox(self, fake_sessions, fake_get_user_vms):
+        """``has_jumpbox`` checks the shard's vCenter for the user's VMs"""
+        fake_get_user_vms.return_value = [MagicMock()]
+        shard = vmware.placement.ring.primary
+
+        self.assertTrue(vmware.has_jumpbox(shard, 'alice'))
+        fake_sessions.get_pool.assert_called_with(shard)
+
+    @patch.object(vmware.inventory, 'get_user_vms')
+    @patch.object(vmware, 'sessions')
+    def test_has_jumpbox_not(self, fake_sessions, fake_get_user_vms):
+        """``has_jumpbox`` returns False when the user has no VMs on the shard"""
+        fake_get_user_vms.return_value = []
+
+        self.assertFalse(vmware.has_jumpbox(vmware.placement.ring.primary, 'alice'))
+
+    @patch.object(vmware.inventory, 'get_user_vms')
+    @patch.object(vmware, 'sessions')
+    def test_show_jumpbox_nothing(self, fake_sessions, fake_get_user_vms):
         """``show_jumpbox`` returns an empty dictionary no jumpbox is found"""
+        fake_get_user_vms.return_value = []
+
         output = vmware.show_jumpbox(username='alice')
         expected = {}
 
         self.assertEqual(output, expected)
 
-    @patch.object(vmware, 'time') # so tests run faster
-    @patch.object(vmware, 'Ova')
+    @patch.object(vmware, '_take_reset_snapshot')
+    @patch.object(vmware.networks, 'index')
+    @patch.object(vmware, '_wait_for_ip')
+    @patch.object(vmware, 'images')
     @patch.object(vmware, '_setup_jumpbox')
     @patch.object(vmware.virtual_machine, 'get_info')
-    @patch.object(vmware.virtual_machine, 'deploy_from_ova')
-    @patch.object(vmware, 'vCenter')
-    def test_create_jumpbox(self, fake_vCenter, fake_deploy_from_ova, fake_get_info,
-            fake_setup_jumpbox, fake_Ova, fake_time):
+    @patch.object(vmware, '_import_ova')
+    @patch.object(vmware, 'sessions')
+    def test_create_jumpbox(self, fake_sessions, fake_import_ova, fake_get_info,
+            fake_setup_jumpbox, fake_images, fake_wait_for_ip, fake_index, fake_take_reset_snapshot):
         """``create_jumpbox`` returns the new jumpbox's info when everything works"""
-        fake_Ova.return_value.networks = ['vLabNetwork']
-        fake_vCenter.return_value.__enter__.return_value.networks = {'someNetwork': vmware.vim.Network(moId='asdf')}
+        fake_images.catalog.open.return_value.networks = ['vLabNetwork']
+        fake_index.get.return_value = vmware.vim.Network(moId='asdf')
         fake_get_info.return_value = {'worked' : True}
 
         output = vmware.create_jumpbox(username='alice',
@@ -57,41 +77,759 @@ class TestVMware(unittest.TestCase):
 
         self.assertEqual(output, expected)
 
-    @patch.object(vmware, 'time') # so tests run faster
-    @patch.object(vmware, 'Ova')
+    @patch.object(vmware, '_take_reset_snapshot')
+    @patch.object(vmware.networks, 'index')
+    @patch.object(vmware, '_wait_for_ip')
+    @patch.object(vmware, 'images')
+    @patch.object(vmware, '_setup_jumpbox')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, '_import_ova')
+    @patch.object(vmware, 'sessions')
+    def test_create_jumpbox_metrics(self, fake_sessions, fake_import_ova, fake_get_info,
+            fake_setup_jumpbox, fake_images, fake_wait_for_ip, fake_index, fake_take_reset_snapshot):
+        """``create_jumpbox`` records how long deploying the OVA took"""
+        fake_images.catalog.open.return_value.networks = ['vLabNetwork']
+        fake_index.get.return_value = vmware.vim.Network(moId='asdf')
+        labels = {'task': 'create', 'step': 'deploy_from_ova', 'outcome': 'success'}
+        before = vmware.metrics.REGISTRY.get_sample_value('vlab_jumpbox_step_seconds_count', labels) or 0
+
+        vmware.create_jumpbox(username='alice', network='someNetwork')
+        after = vmware.metrics.REGISTRY.get_sample_value('vlab_jumpbox_step_seconds_count', labels)
+
+        self.assertEqual(after, before + 1)
+
+    @patch.object(vmware, '_take_reset_snapshot')
+    @patch.object(vmware, '_wait_for_ip')
+    @patch.object(vmware, '_deploy_jumpbox')
+    @patch.object(vmware, '_setup_jumpbox')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, 'sessions')
+    def test_create_jumpbox_progress(self, fake_sessions, fake_get_info, fake_setup_jumpbox,
+            fake_deploy_jumpbox, fake_wait_for_ip, fake_take_reset_snapshot):
+        """``create_jumpbox`` reports each stage of the create"""
+        fake_wait_for_ip.return_value = True
+        progress = MagicMock()
+
+        vmware.create_jumpbox(username='alice', network='someNetwork', progress=progress)
+        stages = [x[0] for x, _ in progress.call_args_list]
+        expected = [('deploying', 0), ('deployed', 70), ('ip acquired', 100)]
+
+        self.assertEqual(stages, [x[0] for x in expected])
+        self.assertEqual(progress.call_args_list[-1][0], expected[-1])
+
+    @patch.object(vmware, '_take_reset_snapshot')
+    @patch.object(vmware, 'placement')
+    @patch.object(vmware, '_wait_for_ip')
+    @patch.object(vmware, '_deploy_jumpbox')
+    @patch.object(vmware, '_setup_jumpbox')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, 'sessions')
+    def test_create_jumpbox_placed(self, fake_sessions, fake_get_info, fake_setup_jumpbox,
+            fake_deploy_jumpbox, fake_wait_for_ip, fake_placement, fake_take_reset_snapshot):
+        """``create_jumpbox`` deploys to the shard the user is placed on"""
+        shard = fake_placement.ring.place.return_value
+
+        vmware.create_jumpbox(username='alice', network='someNetwork')
+        _, the_kwargs = fake_deploy_jumpbox.call_args
+
+        fake_sessions.get_pool.assert_called_with(shard)
+        self.assertTrue(the_kwargs['shard'] is shard)
+
+    @patch.object(vmware, 'placement')
+    @patch.object(vmware, '_deploy_jumpbox')
+    @patch.object(vmware, 'sessions')
+    def test_create_jumpbox_unplaced(self, fake_sessions, fake_deploy_jumpbox, fake_placement):
+        """``create_jumpbox`` frees the spot on the shard if the jumpbox isn't deployed"""
+        fake_deploy_jumpbox.side_effect = ValueError('testing')
+
+        with self.assertRaises(ValueError):
+            vmware.create_jumpbox(username='alice', network='someNetwork')
+
+        fake_placement.ring.release.assert_called_with('alice')
+
+    @patch.object(vmware, 'placement')
+    @patch.object(vmware, '_deploy_jumpbox')
+    @patch.object(vmware, 'sessions')
+    def test_create_jumpbox_busy(self, fake_sessions, fake_deploy_jumpbox, fake_placement):
+        """``create_jumpbox`` keeps the spot on the shard while the deploy waits to be retried"""
+        fake_deploy_jumpbox.side_effect = vmware.scheduler.Busy(5)
+
+        with self.assertRaises(vmware.scheduler.Busy):
+            vmware.create_jumpbox(username='alice', network='someNetwork')
+
+        self.assertFalse(fake_placement.ring.release.called)
+
+    def test_watch_deploy(self):
+        """``_watch_deploy`` reports how far along uploading the OVA is, until the deploy is done"""
+        fake_ova = MagicMock()
+        fake_ova.deploy_progress = 50
+        fake_ova.bytes_per_second = 1024.5
+        fake_done = MagicMock()
+        fake_done.wait.side_effect = [False, True]
+        progress = MagicMock()
+
+        vmware._watch_deploy(fake_ova, progress, fake_done)
+
+        progress.assert_called_once_with('deploying', 35, bytes_per_second=1024)
+
+    @patch.object(vmware.networks, 'index')
+    @patch.object(vmware, '_wait_for_ip')
+    @patch.object(vmware, 'images')
     @patch.object(vmware, '_setup_jumpbox')
     @patch.object(vmware.virtual_machine, 'get_info')
-    @patch.object(vmware.virtual_machine, 'deploy_from_ova')
-    @patch.object(vmware, 'vCenter')
-    def test_create_jumpbox_valueError(self, fake_vCenter, fake_deploy_from_ova, fake_get_info,
-            fake_setup_jumpbox, fake_Ova, fake_time):
+    @patch.object(vmware, '_import_ova')
+    @patch.object(vmware, 'sessions')
+    def test_create_jumpbox_valueError(self, fake_sessions, fake_import_ova, fake_get_info,
+            fake_setup_jumpbox, fake_images, fake_wait_for_ip, fake_index):
         """``create_jumpbox`` raises ValueError if the requested network does not exist"""
-        fake_Ova.return_value.networks = ['vLabNetwork']
-        fake_vCenter.return_value.__enter__.return_value.networks = {'theNetworks': vmware.vim.Network(moId='asdf')}
+        fake_images.catalog.open.return_value.networks = ['vLabNetwork']
+        fake_index.get.side_effect = ValueError('No such network named someNetwork')
         fake_get_info.return_value = {'worked' : True}
 
         with self.assertRaises(ValueError):
             vmware.create_jumpbox(username='alice', network='someNetwork')
 
+    @patch.object(vmware, '_take_reset_snapshot')
+    @patch.object(vmware, '_wait_for_ip')
+    @patch.object(vmware, '_deploy_jumpbox')
+    @patch.object(vmware, '_setup_jumpbox')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, 'warm_pool')
+    @patch.object(vmware, 'sessions')
+    def test_create_jumpbox_warm_pool(self, fake_sessions, fake_warm_pool, fake_get_info,
+            fake_setup_jumpbox, fake_deploy_jumpbox, fake_wait_for_ip, fake_take_reset_snapshot):
+        """``create_jumpbox`` uses a jumpbox from the warm pool when one is available"""
+        fake_warm_pool.enabled.return_value = True
+        fake_vm = MagicMock()
+        fake_warm_pool.claim.return_value = fake_vm
+
+        vmware.create_jumpbox(username='alice', network='someNetwork')
+        the_vm = fake_setup_jumpbox.call_args[0][1]
+
+        self.assertFalse(fake_deploy_jumpbox.called)
+        self.assertTrue(the_vm is fake_vm)
+
+    @patch.object(vmware, '_take_reset_snapshot')
+    @patch.object(vmware, '_wait_for_ip')
+    @patch.object(vmware, '_deploy_jumpbox')
+    @patch.object(vmware, '_setup_jumpbox')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, 'warm_pool')
+    @patch.object(vmware, 'sessions')
+    def test_create_jumpbox_warm_pool_empty(self, fake_sessions, fake_warm_pool, fake_get_info,
+            fake_setup_jumpbox, fake_deploy_jumpbox, fake_wait_for_ip, fake_take_reset_snapshot):
+        """``create_jumpbox`` deploys a new jumpbox if the warm pool is empty"""
+        fake_warm_pool.enabled.return_value = True
+        fake_warm_pool.claim.return_value = None
+
+        vmware.create_jumpbox(username='alice', network='someNetwork')
+
+        self.assertTrue(fake_deploy_jumpbox.called)
+
+    @patch.object(vmware, '_take_reset_snapshot')
+    @patch.object(vmware, '_wait_for_ip')
+    @patch.object(vmware, '_deploy_jumpbox')
+    @patch.object(vmware, '_setup_jumpbox')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, 'sessions')
+    def test_create_jumpbox_snapshot(self, fake_sessions, fake_get_info, fake_setup_jumpbox,
+            fake_deploy_jumpbox, fake_wait_for_ip, fake_take_reset_snapshot):
+        """``create_jumpbox`` snapshots the new jumpbox once it's provisioned"""
+        fake_wait_for_ip.return_value = True
+
+        vmware.create_jumpbox(username='alice', network='someNetwork')
+
+        fake_take_reset_snapshot.assert_called_with(fake_deploy_jumpbox.return_value)
+
+    @patch.object(vmware, 'const')
+    @patch.object(vmware, '_take_reset_snapshot')
+    @patch.object(vmware, '_wait_for_ip')
+    @patch.object(vmware, '_deploy_jumpbox')
+    @patch.object(vmware, '_setup_jumpbox')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, 'sessions')
+    def test_create_jumpbox_snapshot_disabled(self, fake_sessions, fake_get_info, fake_setup_jumpbox,
+            fake_deploy_jumpbox, fake_wait_for_ip, fake_take_reset_snapshot, fake_const):
+        """``create_jumpbox`` doesn't snapshot the new jumpbox when resets are disabled"""
+        fake_const.VLAB_JUMPBOX_RESET_SNAPSHOT = False
+        fake_wait_for_ip.return_value = True
+
+        vmware.create_jumpbox(username='alice', network='someNetwork')
+
+        self.assertFalse(fake_take_reset_snapshot.called)
+
     @patch.object(vmware, 'consume_task')
-    @patch.object(vmware.virtual_machine, 'power')
-    @patch.object(vmware, 'vCenter')
-    def test_delete_jumpbox(self, fake_vCenter, fake_power, fake_consume_task):
+    def test_take_reset_snapshot(self, fake_consume_task):
+        """``_take_reset_snapshot`` snapshots the jumpbox's memory, so a reset doesn't boot it"""
+        fake_vm = MagicMock()
+
+        vmware._take_reset_snapshot(fake_vm)
+        _, the_kwargs = fake_vm.CreateSnapshot_Task.call_args
+
+        self.assertEqual(the_kwargs['name'], vmware.RESET_SNAPSHOT)
+        self.assertTrue(the_kwargs['memory'])
+
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware.inventory, 'get_user_vms')
+    @patch.object(vmware, 'sessions')
+    def test_reset_jumpbox(self, fake_sessions, fake_get_user_vms, fake_consume_task, fake_get_info):
+        """``reset_jumpbox`` reverts the jumpbox to its snapshot"""
+        fake_vm = MagicMock()
+        fake_vm.runtime.powerState = 'poweredOn'
+        fake_snap = MagicMock()
+        fake_snap.name = vmware.RESET_SNAPSHOT
+        fake_snap.childSnapshotList = []
+        fake_vm.snapshot.rootSnapshotList = [fake_snap]
+        fake_get_user_vms.return_value = [fake_vm]
+        fake_get_info.return_value = {'worked': True}
+
+        output = vmware.reset_jumpbox(username='alice')
+
+        self.assertEqual(output, {'worked': True})
+        self.assertTrue(fake_snap.snapshot.RevertToSnapshot_Task.called)
+        self.assertFalse(fake_vm.PowerOnVM_Task.called)
+
+    @patch.object(vmware, '_wait_for_ip')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware.inventory, 'get_user_vms')
+    @patch.object(vmware, 'sessions')
+    def test_reset_jumpbox_powered_off(self, fake_sessions, fake_get_user_vms, fake_consume_task,
+            fake_get_info, fake_wait_for_ip):
+        """``reset_jumpbox`` powers on the jumpbox if the snapshot left it off"""
+        fake_vm = MagicMock()
+        fake_vm.runtime.powerState = 'poweredOff'
+        fake_snap = MagicMock()
+        fake_snap.name = vmware.RESET_SNAPSHOT
+        fake_vm.snapshot.rootSnapshotList = [fake_snap]
+        fake_get_user_vms.return_value = [fake_vm]
+
+        vmware.reset_jumpbox(username='alice')
+
+        self.assertTrue(fake_vm.PowerOnVM_Task.called)
+        self.assertTrue(fake_wait_for_ip.called)
+
+    @patch.object(vmware.inventory, 'get_user_vms')
+    @patch.object(vmware, 'sessions')
+    def test_reset_jumpbox_nothing(self, fake_sessions, fake_get_user_vms):
+        """``reset_jumpbox`` raises ValueError if the user has no jumpbox"""
+        fake_get_user_vms.return_value = []
+
+        with self.assertRaises(ValueError):
+            vmware.reset_jumpbox(username='alice')
+
+    @patch.object(vmware.inventory, 'get_user_vms')
+    @patch.object(vmware, 'sessions')
+    def test_reset_jumpbox_no_snapshot(self, fake_sessions, fake_get_user_vms):
+        """``reset_jumpbox`` raises ValueError if the jumpbox has no snapshot to revert to"""
+        fake_vm = MagicMock()
+        fake_vm.snapshot = None
+        fake_get_user_vms.return_value = [fake_vm]
+
+        with self.assertRaises(ValueError):
+            vmware.reset_jumpbox(username='alice')
+
+    def test_find_snapshot_nested(self):
+        """``_find_snapshot`` finds a snapshot taken after other snapshots"""
+        parent = MagicMock()
+        parent.name = 'before'
+        child = MagicMock()
+        child.name = vmware.RESET_SNAPSHOT
+        child.childSnapshotList = []
+        parent.childSnapshotList = [child]
+        fake_vm = MagicMock()
+        fake_vm.snapshot.rootSnapshotList = [parent]
+
+        found = vmware._find_snapshot(fake_vm, vmware.RESET_SNAPSHOT)
+
+        self.assertTrue(found is child.snapshot)
+
+    @patch.object(vmware, '_wait_for_ip')
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware.inventory, 'get_user_vms')
+    @patch.object(vmware, 'sessions')
+    def test_resume_jumpbox(self, fake_sessions, fake_get_user_vms, fake_consume_task,
+            fake_get_info, fake_wait_for_ip):
+        """``resume_jumpbox`` powers on a suspended jumpbox"""
+        fake_vm = MagicMock()
+        fake_vm.runtime.powerState = 'suspended'
+        fake_get_user_vms.return_value = [fake_vm]
+        fake_get_info.return_value = {'worked': True}
+
+        output = vmware.resume_jumpbox(username='alice')
+
+        self.assertEqual(output, {'worked': True})
+        self.assertTrue(fake_vm.PowerOnVM_Task.called)
+
+    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware.inventory, 'get_user_vms')
+    @patch.object(vmware, 'sessions')
+    def test_resume_jumpbox_running(self, fake_sessions, fake_get_user_vms, fake_get_info):
+        """``resume_jumpbox`` leaves a running jumpbox alone"""
+        fake_vm = MagicMock()
+        fake_vm.runtime.powerState = 'poweredOn'
+        fake_get_user_vms.return_value = [fake_vm]
+
+        vmware.resume_jumpbox(username='alice')
+
+        self.assertFalse(fake_vm.PowerOnVM_Task.called)
+
+    @patch.object(vmware.inventory, 'get_user_vms')
+    @patch.object(vmware, 'sessions')
+    def test_resume_jumpbox_nothing(self, fake_sessions, fake_get_user_vms):
+        """``resume_jumpbox`` raises ValueError if the user has no jumpbox"""
+        fake_get_user_vms.return_value = []
+
+        with self.assertRaises(ValueError):
+            vmware.resume_jumpbox(username='alice')
+
+    @patch.object(vmware, '_is_idle')
+    @patch.object(vmware, 'cache')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware.inventory, 'get_jumpboxes')
+    @patch.object(vmware, 'sessions')
+    def test_suspend_idle(self, fake_sessions, fake_get_jumpboxes, fake_consume_task, fake_cache, fake_is_idle):
+        """``suspend_idle`` suspends only the idle jumpboxes"""
+        busy, idle = MagicMock(), MagicMock()
+        fake_get_jumpboxes.return_value = [('alice', busy, {}), ('bob', idle, {})]
+        fake_is_idle.side_effect = [False, True]
+
+        output = vmware.suspend_idle()
+
+        self.assertEqual(output, ['bob'])
+        self.assertTrue(idle.SuspendVM_Task.called)
+        self.assertFalse(busy.SuspendVM_Task.called)
+
+    @patch.object(vmware, '_is_idle')
+    @patch.object(vmware, 'cache')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware.inventory, 'get_jumpboxes')
+    @patch.object(vmware, 'sessions')
+    def test_suspend_idle_error(self, fake_sessions, fake_get_jumpboxes, fake_consume_task, fake_cache, fake_is_idle):
+        """``suspend_idle`` keeps suspending jumpboxes when one fails"""
+        fake_get_jumpboxes.return_value = [('alice', MagicMock(), {}), ('bob', MagicMock(), {})]
+        fake_is_idle.return_value = True
+        fake_consume_task.side_effect = [RuntimeError('testing'), None]
+
+        output = vmware.suspend_idle()
+
+        self.assertEqual(output, ['bob'])
+
+    @patch.object(vmware, '_is_idle')
+    @patch.object(vmware, 'cache')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware.inventory, 'get_jumpboxes')
+    @patch.object(vmware, 'sessions')
+    def test_suspend_idle_locked(self, fake_sessions, fake_get_jumpboxes, fake_consume_task, fake_cache, fake_is_idle):
+        """``suspend_idle`` leaves alone a jumpbox another worker is changing"""
+        locked, idle = MagicMock(), MagicMock()
+        fake_get_jumpboxes.return_value = [('alice', locked, {}), ('bob', idle, {})]
+        fake_is_idle.return_value = True
+        fake_cache.try_user_lock.side_effect = [None, 'token']
+
+        output = vmware.suspend_idle()
+
+        self.assertEqual(output, ['bob'])
+        self.assertFalse(locked.SuspendVM_Task.called)
+        fake_cache.release_user_lock.assert_called_once_with('bob', 'token')
+
+    @patch.object(vmware, 'cache')
+    def test_is_idle(self, fake_cache):
+        """``_is_idle`` is True once a jumpbox has been idle longer than the user's policy"""
+        fake_cache.get_idle_policy.return_value = 600
+        fake_cache.mark_idle.return_value = 1000.0
+        props = {'runtime.powerState': 'poweredOn', 'summary.quickStats.overallCpuUsage': 10}
+
+        self.assertFalse(vmware._is_idle('alice', props, 1500.0))
+        self.assertTrue(vmware._is_idle('alice', props, 1600.0))
+
+    @patch.object(vmware, 'cache')
+    def test_is_idle_busy(self, fake_cache):
+        """``_is_idle`` starts the idle clock over when the jumpbox is being used"""
+        props = {'runtime.powerState': 'poweredOn',
+                 'summary.quickStats.overallCpuUsage': vmware.const.VLAB_JUMPBOX_IDLE_CPU_MHZ + 1}
+
+        self.assertFalse(vmware._is_idle('alice', props, 1000.0))
+        fake_cache.clear_idle.assert_called_with('alice')
+
+    @patch.object(vmware, 'cache')
+    def test_is_idle_memory(self, fake_cache):
+        """``_is_idle`` starts the idle clock over when the guest is actively using memory"""
+        props = {'runtime.powerState': 'poweredOn', 'summary.quickStats.overallCpuUsage': 0,
+                 'summary.quickStats.guestMemoryUsage': vmware.const.VLAB_JUMPBOX_IDLE_MEMORY_MB + 1}
+
+        self.assertFalse(vmware._is_idle('alice', props, 1000.0))
+        fake_cache.clear_idle.assert_called_with('alice')
+
+    @patch.object(vmware, 'cache')
+    def test_is_idle_booting(self, fake_cache):
+        """``_is_idle`` starts the idle clock over while the guest is still booting"""
+        props = {'runtime.powerState': 'poweredOn', 'summary.quickStats.overallCpuUsage': 0,
+                 'guest.toolsRunningStatus': 'guestToolsExecutingScripts'}
+
+        self.assertFalse(vmware._is_idle('alice', props, 1000.0))
+        fake_cache.clear_idle.assert_called_with('alice')
+
+    @patch.object(vmware, 'cache')
+    def test_is_idle_never(self, fake_cache):
+        """``_is_idle`` is never True for a user whose policy is zero"""
+        fake_cache.get_idle_policy.return_value = 0
+        fake_cache.mark_idle.return_value = 0.0
+        props = {'runtime.powerState': 'poweredOn', 'summary.quickStats.overallCpuUsage': 0}
+
+        self.assertFalse(vmware._is_idle('alice', props, 1000000.0))
+
+    @patch.object(vmware, 'cache')
+    def test_is_idle_default(self, fake_cache):
+        """``_is_idle`` uses VLAB_JUMPBOX_IDLE_TIMEOUT when the user hasn't chosen a policy"""
+        fake_cache.get_idle_policy.return_value = None
+        fake_cache.mark_idle.return_value = 0.0
+        props = {'runtime.powerState': 'poweredOn', 'summary.quickStats.overallCpuUsage': 0}
+
+        self.assertTrue(vmware._is_idle('alice', props, float(vmware.const.VLAB_JUMPBOX_IDLE_TIMEOUT)))
+
+    @patch.object(vmware, 'cache')
+    def test_is_idle_suspended(self, fake_cache):
+        """``_is_idle`` ignores jumpboxes that aren't running, and forgets when they were last idle"""
+        props = {'runtime.powerState': 'suspended'}
+
+        self.assertFalse(vmware._is_idle('alice', props, 1000.0))
+        fake_cache.clear_idle.assert_called_with('alice')
+
+    @patch.object(vmware, '_wait_for_ip')
+    @patch.object(vmware, '_deploy_jumpbox')
+    @patch.object(vmware, 'warm_pool')
+    @patch.object(vmware, 'sessions')
+    def test_refill_warm_pool(self, fake_sessions, fake_warm_pool, fake_deploy_jumpbox, fake_wait_for_ip):
+        """``refill_warm_pool`` deploys enough jumpboxes to fill the pool"""
+        fake_warm_pool.available.return_value = {'someNetwork': [MagicMock()]}
+
+        output = vmware.refill_warm_pool(networks=['someNetwork'], size=3, rate=5)
+        expected = {'someNetwork': 3}
+
+        self.assertEqual(output['pool'], expected)
+        self.assertEqual(fake_deploy_jumpbox.call_count, 2)
+        self.assertEqual(fake_warm_pool.mark.call_count, 2)
+        self.assertFalse(fake_deploy_jumpbox.call_args[1]['queue'])
+
+    @patch.object(vmware, '_wait_for_ip')
+    @patch.object(vmware, '_deploy_jumpbox')
+    @patch.object(vmware, 'warm_pool')
+    @patch.object(vmware, 'sessions')
+    def test_refill_warm_pool_rate(self, fake_sessions, fake_warm_pool, fake_deploy_jumpbox, fake_wait_for_ip):
+        """``refill_warm_pool`` deploys no more than ``rate`` jumpboxes per call"""
+        fake_warm_pool.available.return_value = {}
+
+        output = vmware.refill_warm_pool(networks=['someNetwork', 'otherNetwork'], size=3, rate=4)
+        expected = {'someNetwork': 3, 'otherNetwork': 1}
+
+        self.assertEqual(output['pool'], expected)
+        self.assertEqual(fake_deploy_jumpbox.call_count, 4)
+
+    @patch.object(vmware.networks, 'index')
+    @patch.object(vmware, '_deploy_from_ova')
+    @patch.object(vmware.inventory, 'get_user_folder')
+    @patch.object(vmware, 'templates')
+    def test_deploy_jumpbox_linked_clone(self, fake_templates, fake_get_user_folder, fake_deploy_from_ova, fake_index):
+        """``_deploy_jumpbox`` makes a linked clone when the template exists"""
+        fake_templates.enabled.return_value = True
+        fake_templates.find.return_value = (MagicMock(), MagicMock())
+        fake_vcenter = MagicMock()
+
+        output = vmware._deploy_jumpbox(fake_vcenter, 'alice', 'someNetwork', 'some.ova', 'jumpBox')
+
+        self.assertTrue(output is fake_templates.clone.return_value)
+        self.assertFalse(fake_deploy_from_ova.called)
+
+    @patch.object(vmware, '_deploy_from_ova')
+    @patch.object(vmware, 'templates')
+    def test_deploy_jumpbox_no_template(self, fake_templates, fake_deploy_from_ova):
+        """``_deploy_jumpbox`` falls back to importing the OVA when there is no template"""
+        fake_templates.enabled.return_value = True
+        fake_templates.find.return_value = (None, None)
+
+        output = vmware._deploy_jumpbox(MagicMock(), 'alice', 'someNetwork', 'some.ova', 'jumpBox')
+
+        self.assertTrue(output is fake_deploy_from_ova.return_value)
+
+    @patch.object(vmware, 'scheduler')
+    @patch.object(vmware, '_deploy_from_ova')
+    @patch.object(vmware, 'templates')
+    def test_deploy_jumpbox_scheduled(self, fake_templates, fake_deploy_from_ova, fake_scheduler):
+        """``_deploy_jumpbox`` waits for a deploy slot before importing the OVA"""
+        fake_templates.enabled.return_value = False
+
+        vmware._deploy_jumpbox(MagicMock(), 'alice', 'someNetwork', 'some.ova', 'jumpBox')
+
+        fake_scheduler.scheduler.slot.assert_called_with('alice', 'jumpBox', vmware.const.INF_VCENTER_DATASTORE, queue=True)
+
+    @patch.object(vmware, '_deploy_from_ova')
+    @patch.object(vmware, 'templates')
+    @patch.object(vmware, 'sessions')
+    def test_import_template(self, fake_sessions, fake_templates, fake_deploy_from_ova):
+        """``import_template`` deploys the OVA powered off, then snapshots it"""
+        fake_templates.find.return_value = (None, None)
+
+        vmware.import_template('someNetwork')
+        _, the_kwargs = fake_deploy_from_ova.call_args
+
+        self.assertFalse(the_kwargs['power_on'])
+        self.assertTrue(fake_templates.snapshot.called)
+
+    @patch.object(vmware, '_deploy_from_ova')
+    @patch.object(vmware, 'templates')
+    @patch.object(vmware, 'sessions')
+    def test_import_template_exists(self, fake_sessions, fake_templates, fake_deploy_from_ova):
+        """``import_template`` does nothing if the template already exists"""
+        fake_templates.find.return_value = (MagicMock(), MagicMock())
+
+        vmware.import_template('someNetwork')
+
+        self.assertFalse(fake_deploy_from_ova.called)
+
+    @patch.object(vmware, 'create_jumpbox')
+    def test_bulk_create(self, fake_create_jumpbox):
+        """``bulk_create`` creates a jumpbox for every user"""
+        fake_create_jumpbox.return_value = {'worked': True}
+        jumpboxes = [{'username': 'alice', 'network': 'someNetwork'},
+                     {'username': 'sam', 'network': 'someNetwork'}]
+
+        output = vmware.bulk_create(jumpboxes, concurrency=2)
+        expected = {'alice': {'content': {'worked': True}, 'error': None},
+                    'sam': {'content': {'worked': True}, 'error': None}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(vmware, 'create_jumpbox')
+    def test_bulk_create_error(self, fake_create_jumpbox):
+        """``bulk_create`` records the error of a user's failed create without stopping the others"""
+        def fake_create(username, network, image_name):
+            if username == 'alice':
+                raise ValueError('testing')
+            return {'worked': True}
+        fake_create_jumpbox.side_effect = fake_create
+        jumpboxes = [{'username': 'alice', 'network': 'someNetwork'},
+                     {'username': 'sam', 'network': 'someNetwork'}]
+
+        output = vmware.bulk_create(jumpboxes, concurrency=2)
+
+        self.assertEqual(output['alice']['error'], 'testing')
+        self.assertEqual(output['sam']['error'], None)
+
+    @patch.object(vmware, 'create_jumpbox')
+    def test_bulk_create_callback(self, fake_create_jumpbox):
+        """``bulk_create`` calls the callback as each jumpbox is created"""
+        fake_callback = MagicMock()
+        jumpboxes = [{'username': 'alice', 'network': 'someNetwork'},
+                     {'username': 'sam', 'network': 'someNetwork'}]
+
+        vmware.bulk_create(jumpboxes, concurrency=2, callback=fake_callback)
+
+        self.assertEqual(fake_callback.call_count, 2)
+
+    @patch.object(vmware, 'delete_jumpbox')
+    def test_bulk_delete(self, fake_delete_jumpbox):
+        """``bulk_delete`` deletes the jumpbox of every user"""
+        fake_delete_jumpbox.return_value = None
+
+        output = vmware.bulk_delete(['alice', 'sam'], concurrency=2)
+        expected = {'alice': {'content': None, 'error': None},
+                    'sam': {'content': None, 'error': None}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(vmware, 'delete_jumpbox')
+    @patch.object(vmware, 'cache')
+    def test_bulk_delete_locks(self, fake_cache, fake_delete_jumpbox):
+        """``bulk_delete`` holds each user's lock while deleting their jumpbox"""
+        vmware.bulk_delete(['alice'], concurrency=1)
+
+        fake_cache.user_lock.assert_called_with('alice')
+
+    @patch.object(vmware, 'delete_jumpbox')
+    @patch.object(vmware, 'cache')
+    def test_bulk_delete_locked(self, fake_cache, fake_delete_jumpbox):
+        """``bulk_delete`` skips, and reports, a user whose jumpbox is being changed by another task"""
+        fake_cache.user_lock.side_effect = ValueError('testing')
+
+        output = vmware.bulk_delete(['alice'], concurrency=1)
+
+        self.assertEqual(output['alice']['error'], 'testing')
+        self.assertFalse(fake_delete_jumpbox.called)
+
+    @patch.object(vmware, 'sessions')
+    def test_check_vcenters(self, fake_sessions):
+        """``check_vcenters`` reports each vCenter a session works with"""
+        output = vmware.check_vcenters()
+        status = output[vmware.placement.ring.primary.server]
+
+        self.assertTrue(status['ok'])
+        self.assertTrue('latency_ms' in status)
+
+    @patch.object(vmware, 'sessions')
+    def test_check_vcenters_failed(self, fake_sessions):
+        """``check_vcenters`` reports the error of a vCenter it can't login to"""
+        fake_sessions.get_pool.return_value.session.side_effect = RuntimeError('bad password')
+
+        output = vmware.check_vcenters()
+        status = output[vmware.placement.ring.primary.server]
+
+        self.assertFalse(status['ok'])
+        self.assertEqual(status['error'], 'bad password')
+
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware.inventory, 'get_user_vms')
+    @patch.object(vmware, 'sessions')
+    def test_delete_jumpbox(self, fake_sessions, fake_get_user_vms, fake_consume_task):
         """``delete_jumpbox`` powers off the VM then deletes it"""
         fake_vm = MagicMock()
-        fake_vm.name = 'jumpBox'
-        fake_folder = MagicMock()
-        fake_folder.childEntity = [fake_vm]
-        fake_vCenter.return_value.__enter__.return_value.get_by_name.return_value = fake_folder
+        fake_get_user_vms.return_value = [fake_vm]
 
         vmware.delete_jumpbox(username='alice')
 
-        self.assertTrue(fake_power.called)
+        self.assertTrue(fake_vm.PowerOffVM_Task.called)
         self.assertTrue(fake_vm.Destroy_Task.called)
 
+    @patch.object(vmware, 'placement')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware.inventory, 'get_user_vms')
+    @patch.object(vmware, 'sessions')
+    def test_delete_jumpbox_shard(self, fake_sessions, fake_get_user_vms, fake_consume_task, fake_placement):
+        """``delete_jumpbox`` goes straight to the user's shard, and frees their spot on it"""
+        fake_get_user_vms.return_value = [MagicMock()]
+
+        vmware.delete_jumpbox(username='alice')
+
+        fake_placement.ring.lookup.assert_called_with('alice', search=vmware.has_jumpbox)
+        fake_sessions.get_pool.assert_called_with(fake_placement.ring.lookup.return_value)
+        fake_placement.ring.release.assert_called_with('alice')
+
+    @patch.object(vmware, 'placement')
+    @patch.object(vmware.inventory, 'get_user_vms')
+    @patch.object(vmware, 'sessions')
+    def test_delete_jumpbox_nothing(self, fake_sessions, fake_get_user_vms, fake_placement):
+        """``delete_jumpbox`` doesn't free a spot on the shard when the user has no jumpbox"""
+        fake_get_user_vms.return_value = []
+
+        vmware.delete_jumpbox(username='alice')
+
+        self.assertFalse(fake_placement.ring.release.called)
+
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware.inventory, 'get_user_vms')
+    @patch.object(vmware, 'sessions')
+    def test_delete_jumpbox_powered_off(self, fake_sessions, fake_get_user_vms, fake_consume_task):
+        """``delete_jumpbox`` doesn't power off a VM that's already off"""
+        fake_vm = MagicMock()
+        fake_vm.runtime.powerState = 'poweredOff'
+        fake_get_user_vms.return_value = [fake_vm]
+
+        vmware.delete_jumpbox(username='alice')
+
+        self.assertFalse(fake_vm.PowerOffVM_Task.called)
+        self.assertTrue(fake_vm.Destroy_Task.called)
+
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware.inventory, 'get_user_vms')
+    @patch.object(vmware, 'sessions')
+    def test_delete_jumpbox_concurrent(self, fake_sessions, fake_get_user_vms, fake_consume_task):
+        """``delete_jumpbox`` powers off every VM before waiting on any of them"""
+        fake_vms = [MagicMock(), MagicMock()]
+        fake_get_user_vms.return_value = fake_vms
+        started = []
+        for fake_vm in fake_vms:
+            fake_vm.PowerOffVM_Task.side_effect = lambda: started.append(fake_consume_task.call_count)
+
+        vmware.delete_jumpbox(username='alice')
+
+        self.assertEqual(started, [0, 0])
+
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware.inventory, 'get_user_vms')
+    @patch.object(vmware, 'sessions')
+    def test_delete_jumpbox_no_wait(self, fake_sessions, fake_get_user_vms, fake_consume_task):
+        """``delete_jumpbox`` returns the destroy task ids, without waiting on them, when wait=False"""
+        fake_vm = MagicMock()
+        fake_vm.runtime.powerState = 'poweredOff'
+        fake_vm.Destroy_Task.return_value._moId = 'task-1'
+        fake_get_user_vms.return_value = [fake_vm]
+
+        output = vmware.delete_jumpbox(username='alice', wait=False)
+
+        self.assertEqual(output, ['task-1'])
+        self.assertFalse(fake_consume_task.called)
+
+    @patch.object(vmware, 'vim')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware, 'sessions')
+    def test_confirm_delete(self, fake_sessions, fake_consume_task, fake_vim):
+        """``confirm_delete`` waits on every destroy task"""
+        vmware.confirm_delete('alice', ['task-1', 'task-2'])
+
+        self.assertEqual(fake_consume_task.call_count, 2)
+
+    @patch.object(vmware.virtual_machine, 'power')
+    @patch.object(vmware.virtual_machine, '_get_lease')
+    @patch.object(vmware, '_locate')
+    def test_import_ova(self, fake_locate, fake_get_lease, fake_power):
+        """``_import_ova`` uploads to the shard's datastore, and returns the VM from the lease"""
+        fake_pool, fake_datastore = MagicMock(), MagicMock()
+        fake_mount = MagicMock()
+        fake_mount.mountInfo.accessible = True
+        fake_mount.key.runtime.inMaintenanceMode = False
+        fake_datastore.host = [fake_mount]
+        fake_locate.return_value = (fake_pool, fake_datastore)
+        fake_vcenter = MagicMock()
+        fake_ova = MagicMock()
+
+        output = vmware._import_ova(fake_vcenter, fake_ova, [], 'alice', 'jumpBox', MagicMock())
+        _, the_kwargs = fake_vcenter.ovf_manager.CreateImportSpec.call_args
+
+        self.assertTrue(output is fake_get_lease.return_value.info.entity)
+        self.assertTrue(the_kwargs['datastore'] is fake_datastore)
+        self.assertTrue(the_kwargs['resourcePool'] is fake_pool)
+        self.assertTrue(fake_ova.deploy.called)
+        fake_power.assert_called_with(output, state='on')
+
+    @patch.object(vmware, '_locate')
+    def test_import_ova_no_hosts(self, fake_locate):
+        """``_import_ova`` raises RuntimeError if no host can reach the datastore"""
+        fake_datastore = MagicMock()
+        fake_mount = MagicMock()
+        fake_mount.key.runtime.inMaintenanceMode = True
+        fake_datastore.host = [fake_mount]
+        fake_locate.return_value = (MagicMock(), fake_datastore)
+
+        with self.assertRaises(RuntimeError):
+            vmware._import_ova(MagicMock(), MagicMock(), [], 'alice', 'jumpBox', MagicMock())
+
+    def test_locate_missing(self):
+        """``_locate`` raises ValueError if the shard's datastore doesn't exist"""
+        fake_vcenter = MagicMock()
+        fake_vcenter.resource_pools = {'Resources': MagicMock()}
+        fake_vcenter.datastores = {}
+        shard = vmware.placement.Shard('east', 'vc-east', 'SSD', 'Resources')
+
+        with self.assertRaises(ValueError):
+            vmware._locate(fake_vcenter, shard)
+
+    @patch.object(vmware, 'consume_task')
+    def test_consume_tasks_error(self, fake_consume_task):
+        """``_consume_tasks`` waits on every task before raising the first error"""
+        fake_consume_task.side_effect = [RuntimeError('doh'), 'ok']
+
+        with self.assertRaises(RuntimeError):
+            vmware._consume_tasks(['task-1', 'task-2'])
+
+        self.assertEqual(fake_consume_task.call_count, 2)
+
+    @patch.object(vmware.provision, '_download')
+    @patch.object(vmware.provision, '_upload')
     @patch.object(vmware, 'consume_task')
     @patch.object(vmware.virtual_machine, 'run_command')
-    def test_setup_jumpbox(self, fake_run_command, fake_consume_task):
+    def test_setup_jumpbox(self, fake_run_command, fake_consume_task, fake_upload, fake_download):
         """``_setup_jumpbox`` returns None when everything works as expected"""
         fake_vcenter = MagicMock()
         fake_vm = MagicMock()
@@ -104,9 +842,26 @@ class TestVMware(unittest.TestCase):
 
         self.assertEqual(result, expected)
 
+    @patch.object(vmware.provision, '_download')
+    @patch.object(vmware.provision, '_upload')
     @patch.object(vmware, 'consume_task')
     @patch.object(vmware.virtual_machine, 'run_command')
-    def test_setup_jumpbox_failure(self, fake_run_command, fake_consume_task):
+    def test_setup_jumpbox_progress(self, fake_run_command, fake_consume_task, fake_upload, fake_download):
+        """``_setup_jumpbox`` reports when the user is created, and the VM is reconfigured"""
+        fake_run_command.return_value.exitCode = 0
+        progress = MagicMock()
+
+        vmware._setup_jumpbox(username='alice', vcenter=MagicMock(), the_vm=MagicMock(), progress=progress)
+        stages = [x for x, _ in progress.call_args_list]
+        expected = [('user created', 85), ('reconfigured', 90)]
+
+        self.assertEqual(stages, expected)
+
+    @patch.object(vmware.provision, '_download')
+    @patch.object(vmware.provision, '_upload')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware.virtual_machine, 'run_command')
+    def test_setup_jumpbox_failure(self, fake_run_command, fake_consume_task, fake_upload, fake_download):
         """``_setup_jumpbox`` Raises RuntimeError if unable to configure the VM"""
         fake_vcenter = MagicMock()
         fake_vm = MagicMock()
@@ -117,6 +872,66 @@ class TestVMware(unittest.TestCase):
         with self.assertRaises(RuntimeError):
             vmware._setup_jumpbox(username='alice', vcenter=fake_vcenter, the_vm=fake_vm)
 
+    @patch.object(vmware, 'time')
+    def test_wait_for_ip(self, fake_time):
+        """``_wait_for_ip`` returns True once the VM has an IP"""
+        fake_time.time.return_value = 0
+        fake_nic = MagicMock()
+        fake_nic.connected = True
+        fake_nic.ipAddress = ['fe80::1', '192.168.1.2']
+        fake_vm = MagicMock()
+        fake_vm.guest.net = [fake_nic]
+
+        output = vmware._wait_for_ip(fake_vm)
+
+        self.assertTrue(output)
+        self.assertFalse(fake_time.sleep.called)
+
+    @patch.object(vmware, 'time')
+    def test_wait_for_ip_backoff(self, fake_time):
+        """``_wait_for_ip`` backs off between checks, up to the max interval"""
+        fake_time.time.return_value = 0
+        fake_vm = MagicMock()
+        fake_vm.guest.net = []
+        fake_nic = MagicMock()
+        fake_nic.connected = True
+        fake_nic.ipAddress = ['192.168.1.2']
+
+        def fake_sleep(seconds):
+            if fake_time.sleep.call_count == 4:
+                fake_vm.guest.net = [fake_nic]
+        fake_time.sleep.side_effect = fake_sleep
+
+        vmware._wait_for_ip(fake_vm, timeout=60, interval=1, max_interval=3)
+        delays = [x[0][0] for x in fake_time.sleep.call_args_list]
+        expected = [1, 2, 3, 3]
+
+        self.assertEqual(delays, expected)
+
+    @patch.object(vmware, 'time')
+    def test_wait_for_ip_timeout(self, fake_time):
+        """``_wait_for_ip`` returns False if the VM never gets an IP"""
+        fake_time.time.side_effect = [0, 5, 11]
+        fake_nic = MagicMock()
+        fake_nic.connected = True
+        fake_nic.ipAddress = ['fe80::1']
+        fake_vm = MagicMock()
+        fake_vm.guest.net = [fake_nic]
+
+        output = vmware._wait_for_ip(fake_vm, timeout=10)
+
+        self.assertFalse(output)
+
+    def test_has_ip_disconnected(self):
+        """``_has_ip`` ignores NICs that are not connected"""
+        fake_nic = MagicMock()
+        fake_nic.connected = False
+        fake_nic.ipAddress = ['192.168.1.2']
+        fake_vm = MagicMock()
+        fake_vm.guest.net = [fake_nic]
+
+        self.assertFalse(vmware._has_ip(fake_vm))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,147 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in warm_pool.py
+"""
+import unittest
+from unittest.mock import patch, MagicMock, ANY
+
+from vlab_jumpbox_api.lib.worker import warm_pool
+
+
+class TestWarmPool(unittest.TestCase):
+    """A set of test cases for the warm_pool.py module"""
+    @classmethod
+    def setUpClass(cls):
+        warm_pool.logger = MagicMock()
+
+    @patch.object(warm_pool.cache, 'shared', return_value=True)
+    @patch.object(warm_pool, 'NETWORKS', ['someNetwork'])
+    @patch.object(warm_pool, 'const')
+    def test_enabled(self, fake_const, fake_shared):
+        """``enabled`` is True for configured networks when the pool has a size"""
+        fake_const.VLAB_JUMPBOX_WARM_POOL_SIZE = 2
+
+        self.assertTrue(warm_pool.enabled('someNetwork'))
+        self.assertFalse(warm_pool.enabled('otherNetwork'))
+
+    @patch.object(warm_pool, 'NETWORKS', ['someNetwork'])
+    @patch.object(warm_pool, 'const')
+    def test_enabled_no_size(self, fake_const):
+        """``enabled`` is False when the pool size is zero"""
+        fake_const.VLAB_JUMPBOX_WARM_POOL_SIZE = 0
+
+        self.assertFalse(warm_pool.enabled('someNetwork'))
+
+    @patch.object(warm_pool.cache, 'shared', return_value=False)
+    @patch.object(warm_pool, 'NETWORKS', ['someNetwork'])
+    @patch.object(warm_pool, 'const')
+    def test_enabled_private_cache(self, fake_const, fake_shared):
+        """``enabled`` is False without a shared cache, since claims can't be coordinated"""
+        fake_const.VLAB_JUMPBOX_WARM_POOL_SIZE = 2
+
+        self.assertFalse(warm_pool.enabled('someNetwork'))
+
+    @patch.object(warm_pool.inventory, 'retrieve')
+    @patch.object(warm_pool.inventory, 'get_user_folder')
+    def test_available(self, fake_get_user_folder, fake_retrieve):
+        """``available`` groups warm jumpboxes by network"""
+        fake_retrieve.return_value = [('vm-1', {'config.annotation': '{"warm_pool":"someNetwork"}'}),
+                                      ('vm-2', {'config.annotation': '{"warm_pool":"someNetwork"}'}),
+                                      ('vm-3', {'config.annotation': ''}),
+                                      ('vm-4', {})]
+
+        output = warm_pool.available(MagicMock())
+        expected = {'someNetwork': ['vm-1', 'vm-2']}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(warm_pool.inventory, 'get_user_folder')
+    def test_available_no_folder(self, fake_get_user_folder):
+        """``available`` returns an empty pool if the staging folder does not exist"""
+        fake_get_user_folder.side_effect = [ValueError('testing')]
+
+        output = warm_pool.available(MagicMock())
+
+        self.assertEqual(output, {})
+
+    @patch.object(warm_pool, 'consume_task')
+    def test_mark(self, fake_consume_task):
+        """``mark`` records the network in the VM annotation"""
+        fake_vm = MagicMock()
+
+        warm_pool.mark(fake_vm, 'someNetwork')
+        spec = fake_vm.ReconfigVM_Task.call_args[0][0]
+
+        self.assertEqual(spec.annotation, '{"warm_pool":"someNetwork"}')
+
+    @patch.object(warm_pool, 'consume_task')
+    @patch.object(warm_pool.inventory, 'get_user_folder')
+    @patch.object(warm_pool, 'cache')
+    @patch.object(warm_pool, 'available')
+    def test_claim(self, fake_available, fake_cache, fake_get_user_folder, fake_consume_task):
+        """``claim`` moves a warm jumpbox into the user's folder and renames it"""
+        fake_vm = MagicMock()
+        fake_available.return_value = {'someNetwork': [fake_vm]}
+        fake_cache.backend.add.return_value = True
+
+        output = warm_pool.claim(MagicMock(), 'bob', 'someNetwork', 'jumpBox')
+
+        self.assertTrue(output is fake_vm)
+        fake_vm.Rename_Task.assert_called_with('jumpBox')
+        fake_get_user_folder.return_value.MoveIntoFolder_Task.assert_called_with([fake_vm])
+
+    @patch.object(warm_pool, 'consume_task')
+    @patch.object(warm_pool.inventory, 'get_user_folder')
+    @patch.object(warm_pool, 'cache')
+    @patch.object(warm_pool, 'available')
+    def test_claim_taken(self, fake_available, fake_cache, fake_get_user_folder, fake_consume_task):
+        """``claim`` skips jumpboxes that another worker already claimed"""
+        fake_available.return_value = {'someNetwork': [MagicMock(), MagicMock()]}
+        fake_cache.backend.add.side_effect = [False, True]
+
+        output = warm_pool.claim(MagicMock(), 'bob', 'someNetwork', 'jumpBox')
+
+        self.assertTrue(output is fake_available.return_value['someNetwork'][1])
+
+    @patch.object(warm_pool, 'consume_task')
+    @patch.object(warm_pool.inventory, 'get_user_folder')
+    @patch.object(warm_pool, 'cache')
+    @patch.object(warm_pool, 'available')
+    def test_claim_failed(self, fake_available, fake_cache, fake_get_user_folder, fake_consume_task):
+        """``claim`` gives up the claim on a jumpbox it fails to move, and tries the next one"""
+        fake_available.return_value = {'someNetwork': [MagicMock(_moId='vm-1'), MagicMock(_moId='vm-2')]}
+        fake_cache.backend.add.return_value = True
+        fake_consume_task.side_effect = [RuntimeError('testing'), None, None]
+
+        output = warm_pool.claim(MagicMock(), 'bob', 'someNetwork', 'jumpBox')
+
+        self.assertTrue(output is fake_available.return_value['someNetwork'][1])
+        fake_cache.backend.delete.assert_called_with('jumpbox:warm_pool:claim:vm-1')
+
+    @patch.object(warm_pool, 'consume_task')
+    @patch.object(warm_pool.inventory, 'get_user_folder')
+    def test_hand_over_rename_failed(self, fake_get_user_folder, fake_consume_task):
+        """``_hand_over`` moves the jumpbox back into the pool if renaming it fails"""
+        fake_vm = MagicMock()
+        fake_consume_task.side_effect = [None, RuntimeError('testing'), None]
+
+        with self.assertRaises(RuntimeError):
+            warm_pool._hand_over(MagicMock(), fake_vm, 'bob', 'jumpBox')
+
+        fake_get_user_folder.assert_called_with(ANY, warm_pool.const.VLAB_JUMPBOX_WARM_POOL_FOLDER)
+        self.assertEqual(fake_get_user_folder.return_value.MoveIntoFolder_Task.call_count, 2)
+
+    @patch.object(warm_pool, 'available')
+    def test_claim_empty(self, fake_available):
+        """``claim`` returns None when the pool is empty"""
+        fake_available.return_value = {}
+        before = warm_pool.stats()['misses']
+
+        output = warm_pool.claim(MagicMock(), 'bob', 'someNetwork', 'jumpBox')
+
+        self.assertTrue(output is None)
+        self.assertEqual(warm_pool.stats()['misses'], before + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
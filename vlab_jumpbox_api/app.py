@@ -1,16 +1,35 @@
 # -*- coding: UTF-8 -*-
-from flask import Flask
+from time import time
+
+from flask import Flask, request, g
 from celery import Celery
 
-from vlab_jumpbox_api.lib import const
-from vlab_jumpbox_api.lib.views import HealthView, JumpboxView
+from vlab_jumpbox_api.lib import metrics, celery_config
+from vlab_jumpbox_api.lib.views import HealthView, JumpboxView, MetricsView
 
 app = Flask(__name__)
-app.celery_app = Celery('jumpbox', backend='rpc://', broker=const.VLAB_MESSAGE_BROKER)
-app.celery_app.conf.broker_heartbeat = 0 #https://github.com/celery/celery/issues/4895
+app.celery_app = Celery('jumpbox')
+app.celery_app.config_from_object(celery_config)
 
 HealthView.register(app)
 JumpboxView.register(app)
+MetricsView.register(app)
+
+
+@app.before_request
+def start_timer():
+    """Note when the request started, so its latency can be recorded"""
+    g.request_start = time()
+
+
+@app.after_request
+def record_latency(response):
+    """Record how long the API took to handle the request"""
+    start = getattr(g, 'request_start', None)
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unknown'
+        metrics.API_SECONDS.labels(request.method, endpoint, response.status_code).observe(time() - start)
+    return response
 
 
 if __name__ == '__main__':
@@ -0,0 +1,718 @@
+# -*- coding: UTF-8 -*-
+"""
+A small TTL cache that's shared between the API and the backend workers.
+
+When ``VLAB_JUMPBOX_CACHE_URL`` points at a Redis server, every API and worker
+process sees the same entries. Without it (or without the ``redis`` library)
+each process falls back to a private, in-memory cache.
+"""
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+
+import ujson
+from vlab_api_common import get_logger
+
+from vlab_jumpbox_api.lib import const
+
+
+logger = get_logger(__name__, loglevel=const.VLAB_JUMPBOX_LOG_LEVEL)
+
+
+class MemoryBackend(object):
+    """Stores entries in the memory of the current process"""
+    # Other processes can't see these entries
+    shared = False
+
+    def __init__(self):
+        self._data = {}
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Obtain a value, or None if the key is missing or expired
+
+        :Returns: String
+        """
+        with self._lock:
+            value, expires = self._data.get(key, (None, 0))
+            if expires and expires < time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl):
+        """Store a value for ``ttl`` seconds
+
+        :Returns: None
+        """
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+
+    def add(self, key, value, ttl):
+        """Store a value for ``ttl`` seconds, but only if the key isn't already set
+
+        :Returns: Boolean
+        """
+        with self._lock:
+            _, expires = self._data.get(key, (None, 0))
+            if expires > time.time():
+                return False
+            self._data[key] = (value, time.time() + ttl)
+            return True
+
+    def incr(self, key, amount, ttl):
+        """Atomically add to a counter, and (re)set how long it lives
+
+        :Returns: Integer
+        """
+        with self._lock:
+            value, expires = self._data.get(key, (0, 0))
+            if expires < time.time():
+                value = 0
+            value = int(value) + amount
+            self._data[key] = (value, time.time() + ttl)
+            return value
+
+    def delete(self, key):
+        """Remove a value
+
+        :Returns: None
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_if(self, key, value):
+        """Remove a value, but only if it's still the one supplied
+
+        :Returns: Boolean
+        """
+        with self._lock:
+            current, expires = self._data.get(key, (None, 0))
+            if current != value or expires < time.time():
+                return False
+            del self._data[key]
+            return True
+
+    def take_slots(self, holder, limits, ttl, stale, queue=True):
+        """Take a slot under every limit, or none of them
+
+        Every slot expires on its own, ``ttl`` seconds after it's taken (or
+        taken again). With ``queue``, a holder that has to wait keeps its place
+        in line until it stops asking for ``stale`` seconds, and nobody behind it
+        gets a slot first. Without ``queue``, a slot is only taken if nobody is
+        waiting for it.
+
+        :Returns: Boolean
+
+        :param holder: Who the slots are for; taking a slot it holds refreshes it
+        :type holder: String
+
+        :param limits: The (key, limit) pairs to take a slot under
+        :type limits: List
+
+        :param ttl: How many seconds the slots last
+        :type ttl: Integer
+
+        :param stale: How many seconds a waiter keeps its place in line without asking again
+        :type stale: Integer
+
+        :param queue: Set to False to not wait in line, and to not go ahead of anyone who is
+        :type queue: Boolean
+        """
+        now = time.time()
+        with self._lock:
+            free = True
+            for key, limit in limits:
+                held, waiting = self._live_slots(key, now)
+                if holder in held:
+                    continue
+                ahead = len(waiting)
+                if queue:
+                    arrived = waiting.get(holder, (now, 0))[0]
+                    waiting[holder] = (arrived, now + stale)
+                    ahead = len([x for x, y in waiting.items() if (y[0], x) < (arrived, holder)])
+                if len(held) + ahead >= limit:
+                    free = False
+            if not free:
+                return False
+            for key, _ in limits:
+                held, waiting = self._slots[key]
+                held[holder] = now + ttl
+                waiting.pop(holder, None)
+            return True
+
+    def release_slots(self, holder, keys):
+        """Give back every slot, and place in line, that a holder has
+
+        :Returns: None
+        """
+        with self._lock:
+            for key in keys:
+                held, waiting = self._slots.get(key, ({}, {}))
+                held.pop(holder, None)
+                waiting.pop(holder, None)
+
+    def count_slots(self, key):
+        """How many slots under a limit are taken
+
+        :Returns: Integer
+        """
+        with self._lock:
+            held, _ = self._live_slots(key, time.time())
+            return len(held)
+
+    def _live_slots(self, key, now):
+        """The holders and waiters of a limit, without the expired ones
+
+        :Returns: Tuple of (Dictionary, Dictionary)
+        """
+        held, waiting = self._slots.setdefault(key, ({}, {}))
+        for holder in [x for x, y in held.items() if y < now]:
+            del held[holder]
+        for holder in [x for x, y in waiting.items() if y[1] < now]:
+            del waiting[holder]
+        return held, waiting
+
+
+# Compare and delete in one step, so no other client can set the key in between
+_DELETE_IF = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+# Slots are sorted sets of holders, scored by when each expires. Waiters are in
+# a second sorted set scored by when they arrived, and a third scored by when
+# they stop counting as waiting.
+_TAKE_SLOTS = """
+local now, ttl, stale, queue, holder = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), ARGV[4] == '1', ARGV[5]
+local free = true
+for i, key in ipairs(KEYS) do
+    local waiting, seen = key .. ':waiting', key .. ':seen'
+    redis.call('zremrangebyscore', key, '-inf', now)
+    for _, gone in ipairs(redis.call('zrangebyscore', seen, '-inf', now)) do
+        redis.call('zrem', waiting, gone)
+    end
+    redis.call('zremrangebyscore', seen, '-inf', now)
+    if not redis.call('zscore', key, holder) then
+        local ahead = redis.call('zcard', waiting)
+        if queue then
+            redis.call('zadd', waiting, 'NX', now, holder)
+            redis.call('zadd', seen, now + stale, holder)
+            redis.call('expire', waiting, math.ceil(stale))
+            redis.call('expire', seen, math.ceil(stale))
+            ahead = redis.call('zrank', waiting, holder)
+        end
+        if redis.call('zcard', key) + ahead >= tonumber(ARGV[5 + i]) then
+            free = false
+        end
+    end
+end
+if not free then
+    return 0
+end
+for _, key in ipairs(KEYS) do
+    redis.call('zadd', key, now + ttl, holder)
+    redis.call('zrem', key .. ':waiting', holder)
+    redis.call('zrem', key .. ':seen', holder)
+    local last = redis.call('zrange', key, -1, -1, 'WITHSCORES')
+    redis.call('expire', key, math.ceil(tonumber(last[2]) - now))
+end
+return 1
+"""
+
+
+class RedisBackend(object):
+    """Stores entries in Redis, so they're shared by every process
+
+    :param url: The location of the Redis server, like ``redis://jumpbox-cache:6379/0``
+    :type url: String
+    """
+    shared = True
+
+    def __init__(self, url):
+        import redis
+        self._errors = (redis.RedisError,)
+        self._client = redis.StrictRedis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+
+    def get(self, key):
+        """Obtain a value, or None if the key is missing, expired, or Redis is down
+
+        :Returns: String
+        """
+        try:
+            value = self._client.get(key)
+        except self._errors as doh:
+            logger.error('Cache read failed: {}'.format(doh))
+            return None
+        if value is not None:
+            value = value.decode()
+        return value
+
+    def set(self, key, value, ttl):
+        """Store a value for ``ttl`` seconds
+
+        :Returns: None
+        """
+        try:
+            self._client.set(key, value, ex=ttl)
+        except self._errors as doh:
+            logger.error('Cache write failed: {}'.format(doh))
+
+    def add(self, key, value, ttl):
+        """Store a value for ``ttl`` seconds, but only if the key isn't already set
+
+        :Returns: Boolean
+        """
+        try:
+            return bool(self._client.set(key, value, ex=ttl, nx=True))
+        except self._errors as doh:
+            logger.error('Cache write failed: {}'.format(doh))
+            return False
+
+    def incr(self, key, amount, ttl):
+        """Atomically add to a counter, and (re)set how long it lives
+
+        :Returns: Integer
+        """
+        try:
+            pipe = self._client.pipeline()
+            pipe.incrby(key, amount)
+            pipe.expire(key, ttl)
+            value, _ = pipe.execute()
+        except self._errors as doh:
+            logger.error('Cache increment failed: {}'.format(doh))
+            return 0
+        return value
+
+    def delete(self, key):
+        """Remove a value
+
+        :Returns: None
+        """
+        try:
+            self._client.delete(key)
+        except self._errors as doh:
+            logger.error('Cache delete failed: {}'.format(doh))
+
+    def delete_if(self, key, value):
+        """Remove a value, but only if it's still the one supplied
+
+        :Returns: Boolean
+        """
+        try:
+            return bool(self._client.eval(_DELETE_IF, 1, key, value))
+        except self._errors as doh:
+            logger.error('Cache delete failed: {}'.format(doh))
+            return False
+
+    def take_slots(self, holder, limits, ttl, stale, queue=True):
+        """Take a slot under every limit, or none of them; see ``MemoryBackend.take_slots``
+
+        :Returns: Boolean
+        """
+        keys = [x for x, _ in limits]
+        args = [time.time(), ttl, stale, int(queue), holder] + [x for _, x in limits]
+        try:
+            return bool(self._client.eval(_TAKE_SLOTS, len(keys), *(keys + args)))
+        except self._errors as doh:
+            # The limits can't be enforced without Redis, so nobody gets a slot
+            logger.error('Cache slot update failed: {}'.format(doh))
+            return False
+
+    def release_slots(self, holder, keys):
+        """Give back every slot, and place in line, that a holder has
+
+        :Returns: None
+        """
+        try:
+            pipe = self._client.pipeline()
+            for key in keys:
+                for suffix in ('', ':waiting', ':seen'):
+                    pipe.zrem(key + suffix, holder)
+            pipe.execute()
+        except self._errors as doh:
+            logger.error('Cache slot update failed: {}'.format(doh))
+
+    def count_slots(self, key):
+        """How many slots under a limit are taken
+
+        :Returns: Integer
+        """
+        try:
+            pipe = self._client.pipeline()
+            pipe.zremrangebyscore(key, '-inf', time.time())
+            pipe.zcard(key)
+            _, count = pipe.execute()
+        except self._errors as doh:
+            logger.error('Cache read failed: {}'.format(doh))
+            return 0
+        return count
+
+
+def get_backend(url):
+    """Pick the cache backend to use
+
+    :Returns: MemoryBackend or RedisBackend
+
+    :param url: The location of the shared cache. An empty string means "use memory"
+    :type url: String
+    """
+    if url.startswith('redis://'):
+        try:
+            return RedisBackend(url)
+        except ImportError:
+            logger.error('Unable to import redis, falling back to an in-memory cache')
+    return MemoryBackend()
+
+
+backend = get_backend(const.VLAB_JUMPBOX_CACHE_URL)
+
+
+def shared():
+    """Tell if every API and worker process sees the same cache entries
+
+    :Returns: Boolean
+    """
+    return backend.shared
+
+
+def _show_key(username):
+    """Namespace cache entries for ``jumpbox.show``"""
+    return 'jumpbox:show:{}'.format(username)
+
+
+def get_show(username):
+    """Obtain the cached output of ``jumpbox.show`` for a user
+
+    :Returns: Dictionary, or None when there's no fresh entry
+
+    :param username: The user who owns the jumpbox
+    :type username: String
+    """
+    value = backend.get(_show_key(username))
+    if value is None:
+        return None
+    return ujson.loads(value)
+
+
+def set_show(username, info):
+    """Cache the output of ``jumpbox.show`` for a user
+
+    :Returns: None
+
+    :param username: The user who owns the jumpbox
+    :type username: String
+
+    :param info: The information about the jumpbox
+    :type info: Dictionary
+    """
+    backend.set(_show_key(username), ujson.dumps(info), const.VLAB_JUMPBOX_CACHE_TTL)
+
+
+def invalidate_show(username):
+    """Discard the cached output of ``jumpbox.show`` for a user
+
+    :Returns: None
+
+    :param username: The user who owns the jumpbox
+    :type username: String
+    """
+    backend.delete(_show_key(username))
+
+
+def _networks_key(server):
+    """Namespace the network names of each vCenter"""
+    return 'jumpbox:networks:{}'.format(server)
+
+
+def set_networks(names, server=const.INF_VCENTER_SERVER):
+    """Publish the names of every network in vCenter
+
+    :Returns: None
+
+    :param names: The names of the networks
+    :type names: Iterable
+
+    :param server: The vCenter the networks are in
+    :type server: String
+    """
+    backend.set(_networks_key(server), ujson.dumps(sorted(names)), const.VLAB_JUMPBOX_NETWORK_INDEX_TTL)
+
+
+def get_networks(server=const.INF_VCENTER_SERVER):
+    """Obtain the names of every network in vCenter, as last published by a worker
+
+    :Returns: Set, or None if no worker has published them recently
+
+    :param server: The vCenter the networks are in
+    :type server: String
+    """
+    value = backend.get(_networks_key(server))
+    if value is None:
+        return None
+    return set(ujson.loads(value))
+
+
+def _idle_policy_key(username):
+    """Namespace how long a user's jumpbox can sit idle"""
+    return 'jumpbox:idle:policy:{}'.format(username)
+
+
+def _idle_since_key(username):
+    """Namespace when a user's jumpbox was first seen idle"""
+    return 'jumpbox:idle:since:{}'.format(username)
+
+
+def set_idle_policy(username, timeout):
+    """Choose how long a user's jumpbox can sit idle before it's suspended
+
+    :Returns: None
+
+    :param username: The user who owns the jumpbox
+    :type username: String
+
+    :param timeout: How many seconds the jumpbox can be idle. Zero means never suspend it
+    :type timeout: Integer
+    """
+    backend.set(_idle_policy_key(username), str(int(timeout)), const.VLAB_JUMPBOX_IDLE_POLICY_TTL)
+
+
+def get_idle_policy(username):
+    """Obtain how long a user's jumpbox can sit idle before it's suspended
+
+    :Returns: Integer, or None if the user hasn't chosen
+
+    :param username: The user who owns the jumpbox
+    :type username: String
+    """
+    value = backend.get(_idle_policy_key(username))
+    if value is None:
+        return None
+    return int(value)
+
+
+def mark_idle(username, now):
+    """Record that a user's jumpbox is idle, unless it already was
+
+    :Returns: Float - when the jumpbox was first seen idle
+
+    :param username: The user who owns the jumpbox
+    :type username: String
+
+    :param now: The current time, in seconds since the epoch
+    :type now: Float
+    """
+    key = _idle_since_key(username)
+    if backend.add(key, str(now), const.VLAB_JUMPBOX_IDLE_POLICY_TTL):
+        return now
+    # The entry could expire between the add and the get
+    return float(backend.get(key) or now)
+
+
+def clear_idle(username):
+    """Forget that a user's jumpbox was idle, because it's being used
+
+    :Returns: None
+
+    :param username: The user who owns the jumpbox
+    :type username: String
+    """
+    backend.delete(_idle_since_key(username))
+
+
+def _vcenter_status_key(server):
+    """Namespace what the workers last saw when they logged into a vCenter"""
+    return 'jumpbox:vcenter:status:{}'.format(server)
+
+
+def set_vcenter_status(server, status, ttl):
+    """Publish how the last login to a vCenter went, for the API's readiness checks
+
+    :Returns: None
+
+    :param server: The vCenter that was checked
+    :type server: String
+
+    :param status: The ``ok``, ``error`` and ``latency_ms`` of the login
+    :type status: Dictionary
+
+    :param ttl: How many seconds until the status is too old to trust
+    :type ttl: Integer
+    """
+    backend.set(_vcenter_status_key(server), ujson.dumps(status), ttl)
+
+
+def get_vcenter_status(server):
+    """Obtain how the last login to a vCenter went, as published by a worker
+
+    :Returns: Dictionary, or None if no worker has checked recently
+
+    :param server: The vCenter that was checked
+    :type server: String
+    """
+    value = backend.get(_vcenter_status_key(server))
+    if value is None:
+        return None
+    return ujson.loads(value)
+
+
+def _inflight_key(username, operation):
+    """Namespace the record of which task is in flight for a user"""
+    return 'jumpbox:inflight:{}:{}'.format(username, operation)
+
+
+def _idempotency_key(username, operation, idempotency_key):
+    """Namespace the record of which task a client's Idempotency-Key maps to"""
+    return 'jumpbox:idempotency:{}:{}:{}'.format(username, operation, idempotency_key)
+
+
+def claim_task(username, operation, task_id, idempotency_key=None, finished=None):
+    """Record that a task is about to be sent, unless an equivalent one already was
+
+    A request is a duplicate when the same user already has the same operation
+    in flight, or when the client reuses an ``Idempotency-Key``.
+
+    The worker forgets the in flight task when it's done, but without a shared
+    cache it can only do that in its own memory. ``finished`` lets the caller
+    check the task itself, so a record the worker couldn't clear doesn't keep
+    coalescing new requests into a task that's long over.
+
+    :Returns: String - the id of the existing task, or None if ``task_id`` was recorded
+
+    :param username: The user the task is for
+    :type username: String
+
+    :param operation: What the task does, like ``create``
+    :type operation: String
+
+    :param task_id: The id the new task will be sent with
+    :type task_id: String
+
+    :param idempotency_key: The optional key the client supplied
+    :type idempotency_key: String
+
+    :param finished: Called with the id of the in flight task; returns True if it's already done
+    :type finished: Function
+    """
+    if idempotency_key:
+        ikey = _idempotency_key(username, operation, idempotency_key)
+        if not backend.add(ikey, task_id, const.VLAB_JUMPBOX_IDEMPOTENCY_TTL):
+            existing = backend.get(ikey)
+            if existing:
+                return existing
+    if backend.add(_inflight_key(username, operation), task_id, const.VLAB_JUMPBOX_INFLIGHT_TTL):
+        return None
+    existing = backend.get(_inflight_key(username, operation))
+    if existing and finished is not None and finished(existing):
+        backend.set(_inflight_key(username, operation), task_id, const.VLAB_JUMPBOX_INFLIGHT_TTL)
+        return None
+    if existing and idempotency_key:
+        backend.set(ikey, existing, const.VLAB_JUMPBOX_IDEMPOTENCY_TTL)
+    return existing
+
+
+def release_task(username, operation):
+    """Forget the in flight task of a user, so the next request sends a new one
+
+    :Returns: None
+
+    :param username: The user the task was for
+    :type username: String
+
+    :param operation: What the task does, like ``create``
+    :type operation: String
+    """
+    backend.delete(_inflight_key(username, operation))
+
+
+def _lock_key(username):
+    """Namespace the lock on a user's jumpbox"""
+    return 'jumpbox:lock:{}'.format(username)
+
+
+def acquire_user_lock(username, timeout=const.VLAB_JUMPBOX_USER_LOCK_TIMEOUT, poll_interval=1):
+    """Wait to be the only worker changing a user's jumpbox
+
+    :Returns: String - the token that releases the lock
+
+    :Raises: ValueError if the lock isn't acquired within the timeout
+
+    :param username: The user whose jumpbox is being changed
+    :type username: String
+
+    :param timeout: The most seconds to wait for the lock
+    :type timeout: Integer
+
+    :param poll_interval: How many seconds to wait between attempts
+    :type poll_interval: Float
+    """
+    deadline = time.time() + timeout
+    token = try_user_lock(username)
+    while token is None:
+        if time.time() > deadline:
+            raise ValueError('Another change to the jumpbox of {} is still running'.format(username))
+        time.sleep(poll_interval)
+        token = try_user_lock(username)
+    return token
+
+
+def try_user_lock(username):
+    """Become the only worker changing a user's jumpbox, unless another worker already is
+
+    :Returns: String - the token that releases the lock, or None if it's held
+
+    :param username: The user whose jumpbox is being changed
+    :type username: String
+    """
+    token = uuid.uuid4().hex
+    # The TTL means a worker that dies holding the lock can't hold it forever
+    if backend.add(_lock_key(username), token, const.VLAB_JUMPBOX_INFLIGHT_TTL):
+        return token
+    return None
+
+
+def release_user_lock(username, token):
+    """Let other workers change a user's jumpbox again
+
+    If the lock outlived its TTL and another worker has since taken it, that
+    worker's lock is left alone.
+
+    :Returns: None
+
+    :param username: The user whose jumpbox was being changed
+    :type username: String
+
+    :param token: What ``acquire_user_lock`` returned
+    :type token: String
+    """
+    if not backend.delete_if(_lock_key(username), token):
+        logger.warning('Lock on the jumpbox of {} expired before it was released'.format(username))
+
+
+@contextmanager
+def user_lock(username, timeout=const.VLAB_JUMPBOX_USER_LOCK_TIMEOUT, poll_interval=1):
+    """Only let one worker change a user's jumpbox at a time
+
+    :Returns: String - the token that releases the lock
+
+    :Raises: ValueError if the lock isn't acquired within the timeout
+
+    :param username: The user whose jumpbox is being changed
+    :type username: String
+
+    :param timeout: The most seconds to wait for the lock
+    :type timeout: Integer
+
+    :param poll_interval: How many seconds to wait between attempts
+    :type poll_interval: Float
+    """
+    token = acquire_user_lock(username, timeout, poll_interval)
+    try:
+        yield token
+    finally:
+        release_user_lock(username, token)
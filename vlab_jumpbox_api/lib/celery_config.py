@@ -0,0 +1,63 @@
+# -*- coding: UTF-8 -*-
+"""
+The Celery settings shared by the API and the backend workers.
+
+With the default ``rpc://`` result backend, a task's result can only be read
+by the process that sent the task. When the API runs several uwsgi workers,
+polling ``/task/<id>`` has to land on the right one. Point
+``VLAB_JUMPBOX_RESULT_BACKEND`` at a shared store, like
+``redis://jumpbox-cache:6379/1`` (or ``file:///tmp/results`` for testing),
+so any API process can look up the status of any task without waiting on the
+broker. Results are deleted after ``VLAB_JUMPBOX_RESULT_EXPIRES`` seconds.
+Streaming a task's progress events is only offered with a shared backend.
+
+Each kind of task has its own queue, so a burst of slow creates can't starve
+the fast ``jumpbox.show`` requests. A worker only consumes the queues it's
+started with (``celery -A tasks worker -Q jumpbox-show``), so dedicated pools of
+workers can be run per queue. Within a queue, interactive requests have a
+higher priority than bulk and background work.
+
+Load with ``celery_app.config_from_object(celery_config)``.
+"""
+from kombu import Exchange, Queue
+
+from vlab_jumpbox_api.lib import const
+
+
+SHOW_QUEUE = 'jumpbox-show'
+CREATE_QUEUE = 'jumpbox-create'
+DELETE_QUEUE = 'jumpbox-delete'
+MAX_PRIORITY = 9
+
+
+broker_url = const.VLAB_MESSAGE_BROKER
+broker_heartbeat = 0 #https://github.com/celery/celery/issues/4895
+result_backend = const.VLAB_JUMPBOX_RESULT_BACKEND
+result_expires = const.VLAB_JUMPBOX_RESULT_EXPIRES
+
+task_queues = [Queue(x, Exchange('jumpbox', type='direct'), routing_key=x,
+                     queue_arguments={'x-max-priority': MAX_PRIORITY})
+               for x in (SHOW_QUEUE, CREATE_QUEUE, DELETE_QUEUE)]
+task_default_queue = CREATE_QUEUE
+task_default_exchange = 'jumpbox'
+task_default_routing_key = CREATE_QUEUE
+task_default_priority = 5
+task_routes = {
+    'jumpbox.show': {'queue': SHOW_QUEUE, 'priority': MAX_PRIORITY},
+    'jumpbox.create': {'queue': CREATE_QUEUE, 'priority': 7},
+    'jumpbox.bulk_create': {'queue': CREATE_QUEUE, 'priority': 3},
+    'jumpbox.warm_pool.refill': {'queue': CREATE_QUEUE, 'priority': 1},
+    'jumpbox.template.import': {'queue': CREATE_QUEUE, 'priority': 1},
+    'jumpbox.networks.refresh': {'queue': SHOW_QUEUE, 'priority': 1},
+    'jumpbox.vcenter.check': {'queue': SHOW_QUEUE, 'priority': 1},
+    'jumpbox.delete': {'queue': DELETE_QUEUE, 'priority': 7},
+    # A reset is a quick revert, so keep it out from behind the slow creates
+    'jumpbox.reset': {'queue': DELETE_QUEUE, 'priority': 7},
+    # Someone is waiting to connect; a resume goes ahead of everything but a show
+    'jumpbox.resume': {'queue': DELETE_QUEUE, 'priority': 8},
+    'jumpbox.idle.suspend': {'queue': DELETE_QUEUE, 'priority': 1},
+    'jumpbox.delete.confirm': {'queue': DELETE_QUEUE, 'priority': 5},
+    'jumpbox.bulk_delete': {'queue': DELETE_QUEUE, 'priority': 3},
+}
+# Creates hold a worker for minutes; don't let one worker reserve a backlog of them
+worker_prefetch_multiplier = const.VLAB_JUMPBOX_PREFETCH_MULTIPLIER
@@ -22,6 +22,54 @@ DEFINED = OrderedDict([
             ('VLAB_MESSAGE_BROKER', environ.get('VLAB_MESSAGE_BROKER', 'jumpbox-broker')),
             ('VLAB_URL', environ.get('VLAB_URL', 'https://localhost')),
             ('VLAB_JUMPBOX_IMAGES_DIR', environ.get('VLAB_JUMPBOX_IMAGES_DIR', '/images')),
+            ('VLAB_JUMPBOX_SESSION_POOL_SIZE', int(environ.get('VLAB_JUMPBOX_SESSION_POOL_SIZE', 4))),
+            ('VLAB_JUMPBOX_SESSION_MAX_IDLE', int(environ.get('VLAB_JUMPBOX_SESSION_MAX_IDLE', 900))),
+            ('VLAB_JUMPBOX_SESSION_CHECK_INTERVAL', int(environ.get('VLAB_JUMPBOX_SESSION_CHECK_INTERVAL', 30))),
+            ('VLAB_JUMPBOX_CACHE_URL', environ.get('VLAB_JUMPBOX_CACHE_URL', '')),
+            ('VLAB_JUMPBOX_CACHE_TTL', int(environ.get('VLAB_JUMPBOX_CACHE_TTL', 30))),
+            ('VLAB_JUMPBOX_WARM_POOL_SIZE', int(environ.get('VLAB_JUMPBOX_WARM_POOL_SIZE', 0))),
+            ('VLAB_JUMPBOX_WARM_POOL_NETWORKS', environ.get('VLAB_JUMPBOX_WARM_POOL_NETWORKS', '')),
+            ('VLAB_JUMPBOX_WARM_POOL_FOLDER', environ.get('VLAB_JUMPBOX_WARM_POOL_FOLDER', 'jumpboxWarmPool')),
+            ('VLAB_JUMPBOX_WARM_POOL_REFILL_RATE', int(environ.get('VLAB_JUMPBOX_WARM_POOL_REFILL_RATE', 1))),
+            ('VLAB_JUMPBOX_WARM_POOL_INTERVAL', int(environ.get('VLAB_JUMPBOX_WARM_POOL_INTERVAL', 60))),
+            ('VLAB_JUMPBOX_DEPLOY_MODE', environ.get('VLAB_JUMPBOX_DEPLOY_MODE', 'ova')),
+            ('VLAB_JUMPBOX_TEMPLATE_FOLDER', environ.get('VLAB_JUMPBOX_TEMPLATE_FOLDER', 'jumpboxTemplates')),
+            ('VLAB_JUMPBOX_ADMIN_GROUP', environ.get('VLAB_JUMPBOX_ADMIN_GROUP', 'vlab-admins')),
+            ('VLAB_JUMPBOX_BULK_CONCURRENCY', int(environ.get('VLAB_JUMPBOX_BULK_CONCURRENCY', 4))),
+            ('VLAB_JUMPBOX_DEPLOYS_PER_DATASTORE', int(environ.get('VLAB_JUMPBOX_DEPLOYS_PER_DATASTORE', 4))),
+            ('VLAB_JUMPBOX_DEPLOYS_FROM_IMAGES', int(environ.get('VLAB_JUMPBOX_DEPLOYS_FROM_IMAGES', 6))),
+            ('VLAB_JUMPBOX_DEPLOYS_PER_USER', int(environ.get('VLAB_JUMPBOX_DEPLOYS_PER_USER', 1))),
+            ('VLAB_JUMPBOX_DEPLOYS_PER_HOST', int(environ.get('VLAB_JUMPBOX_DEPLOYS_PER_HOST', 2))),
+            ('VLAB_JUMPBOX_DEPLOY_QUEUE_TIMEOUT', int(environ.get('VLAB_JUMPBOX_DEPLOY_QUEUE_TIMEOUT', 1800))),
+            ('VLAB_JUMPBOX_ASYNC', environ.get('VLAB_JUMPBOX_ASYNC', 'false').lower() == 'true'),
+            ('VLAB_JUMPBOX_ASYNC_THREADS', int(environ.get('VLAB_JUMPBOX_ASYNC_THREADS', 16))),
+            ('VLAB_JUMPBOX_METRICS_PORT', int(environ.get('VLAB_JUMPBOX_METRICS_PORT', 9100))),
+            ('VLAB_JUMPBOX_DELETE_WAIT', environ.get('VLAB_JUMPBOX_DELETE_WAIT', 'true').lower() == 'true'),
+            ('VLAB_JUMPBOX_RESULT_BACKEND', environ.get('VLAB_JUMPBOX_RESULT_BACKEND', 'rpc://')),
+            ('VLAB_JUMPBOX_RESULT_EXPIRES', int(environ.get('VLAB_JUMPBOX_RESULT_EXPIRES', 3600))),
+            ('VLAB_JUMPBOX_INFLIGHT_TTL', int(environ.get('VLAB_JUMPBOX_INFLIGHT_TTL', 3600))),
+            ('VLAB_JUMPBOX_IDEMPOTENCY_TTL', int(environ.get('VLAB_JUMPBOX_IDEMPOTENCY_TTL', 86400))),
+            ('VLAB_JUMPBOX_USER_LOCK_TIMEOUT', int(environ.get('VLAB_JUMPBOX_USER_LOCK_TIMEOUT', 1800))),
+            ('VLAB_JUMPBOX_PREFETCH_MULTIPLIER', int(environ.get('VLAB_JUMPBOX_PREFETCH_MULTIPLIER', 1))),
+            ('VLAB_JUMPBOX_NETWORK_INDEX_TTL', int(environ.get('VLAB_JUMPBOX_NETWORK_INDEX_TTL', 60))),
+            ('VLAB_JUMPBOX_EVENTS_INTERVAL', float(environ.get('VLAB_JUMPBOX_EVENTS_INTERVAL', 1))),
+            ('VLAB_JUMPBOX_EVENTS_TIMEOUT', int(environ.get('VLAB_JUMPBOX_EVENTS_TIMEOUT', 300))),
+            ('VLAB_JUMPBOX_SHARDS', environ.get('VLAB_JUMPBOX_SHARDS', '')),
+            ('VLAB_JUMPBOX_PLACEMENT_TTL', int(environ.get('VLAB_JUMPBOX_PLACEMENT_TTL', 7776000))),
+            ('VLAB_JUMPBOX_UPLOAD_CONNECTIONS', int(environ.get('VLAB_JUMPBOX_UPLOAD_CONNECTIONS', 4))),
+            ('VLAB_JUMPBOX_UPLOAD_CHUNK_SIZE', int(environ.get('VLAB_JUMPBOX_UPLOAD_CHUNK_SIZE', 1048576))),
+            ('VLAB_JUMPBOX_UPLOAD_TIMEOUT', int(environ.get('VLAB_JUMPBOX_UPLOAD_TIMEOUT', 300))),
+            ('VLAB_JUMPBOX_RESET_SNAPSHOT', environ.get('VLAB_JUMPBOX_RESET_SNAPSHOT', 'true').lower() == 'true'),
+            ('VLAB_JUMPBOX_IDLE_INTERVAL', int(environ.get('VLAB_JUMPBOX_IDLE_INTERVAL', 0))),
+            ('VLAB_JUMPBOX_IDLE_TIMEOUT', int(environ.get('VLAB_JUMPBOX_IDLE_TIMEOUT', 3600))),
+            ('VLAB_JUMPBOX_IDLE_CPU_MHZ', int(environ.get('VLAB_JUMPBOX_IDLE_CPU_MHZ', 100))),
+            ('VLAB_JUMPBOX_IDLE_MEMORY_MB', int(environ.get('VLAB_JUMPBOX_IDLE_MEMORY_MB', 256))),
+            ('VLAB_JUMPBOX_IDLE_POLICY_TTL', int(environ.get('VLAB_JUMPBOX_IDLE_POLICY_TTL', 7776000))),
+            ('VLAB_JUMPBOX_READINESS_INTERVAL', float(environ.get('VLAB_JUMPBOX_READINESS_INTERVAL', 15))),
+            ('VLAB_JUMPBOX_READINESS_TIMEOUT', float(environ.get('VLAB_JUMPBOX_READINESS_TIMEOUT', 5))),
+            ('VLAB_JUMPBOX_IP_TIMEOUT', int(environ.get('VLAB_JUMPBOX_IP_TIMEOUT', 300))),
+            ('VLAB_JUMPBOX_IP_POLL_INTERVAL', float(environ.get('VLAB_JUMPBOX_IP_POLL_INTERVAL', 1))),
+            ('VLAB_JUMPBOX_IP_POLL_MAX_INTERVAL', float(environ.get('VLAB_JUMPBOX_IP_POLL_MAX_INTERVAL', 10))),
           ])
 
 Constants = namedtuple('Constants', list(DEFINED.keys()))
@@ -0,0 +1,137 @@
+# -*- coding: UTF-8 -*-
+"""
+Prometheus metrics for the API and the backend workers.
+
+Every step of a jumpbox task is timed with ``timed``, and recorded in one
+histogram labeled by the task, the step and the outcome (``success`` or
+``error``). The API serves its metrics at ``/api/1/inf/jumpbox/metrics``, and
+each worker runs an exporter on ``VLAB_JUMPBOX_METRICS_PORT``.
+
+When ``PROMETHEUS_MULTIPROC_DIR`` is set, the metrics of every uwsgi or Celery
+child process are combined before being exported.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+from prometheus_client import (Histogram, Gauge, CollectorRegistry, REGISTRY,
+                               generate_latest, start_http_server, CONTENT_TYPE_LATEST)
+from prometheus_client import multiprocess
+
+
+STEP_SECONDS = Histogram('vlab_jumpbox_step_seconds',
+                         'Time spent in each step of a jumpbox task',
+                         ['task', 'step', 'outcome'],
+                         buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200))
+
+API_SECONDS = Histogram('vlab_jumpbox_api_request_seconds',
+                        'Time spent handling an API request',
+                        ['method', 'endpoint', 'status'])
+
+WORKER_STATS = Gauge('vlab_jumpbox_worker_stat',
+                     'Counters from the session pool, warm pool and deploy scheduler',
+                     ['source', 'stat', 'shard'],
+                     multiprocess_mode='livesum')
+
+_current = threading.local()
+
+
+def _multiprocess_dir():
+    """The directory the child processes share metrics through, if any
+
+    :Returns: String
+    """
+    return os.environ.get('PROMETHEUS_MULTIPROC_DIR', os.environ.get('prometheus_multiproc_dir', ''))
+
+
+@contextmanager
+def task(name):
+    """Label every step timed within a ``with`` block as part of one task
+
+    :Returns: None
+
+    :param name: The name of the task, like ``create``
+    :type name: String
+    """
+    previous = getattr(_current, 'task', None)
+    _current.task = name
+    try:
+        with timed('total'):
+            yield
+    finally:
+        _current.task = previous
+
+
+@contextmanager
+def timed(step, task_name=None):
+    """Record how long a ``with`` block took, and if it raised an exception
+
+    :Returns: None
+
+    :param step: The name of the step being timed, like ``deploy_from_ova``
+    :type step: String
+
+    :param task_name: The task the step is part of. Defaults to the one set by ``task``
+    :type task_name: String
+    """
+    outcome = 'error'
+    start = time.time()
+    try:
+        yield
+        outcome = 'success'
+    finally:
+        labels = (task_name or getattr(_current, 'task', None) or 'unknown', step, outcome)
+        STEP_SECONDS.labels(*labels).observe(time.time() - start)
+
+
+def record_stats(source, stats, shard=''):
+    """Publish a dictionary of counters as gauges
+
+    :Returns: None
+
+    :param source: Where the counters came from, like ``session_pool``
+    :type source: String
+
+    :param stats: The counters to publish
+    :type stats: Dictionary
+
+    :param shard: The shard the counters are for, if they're kept per shard
+    :type shard: String
+    """
+    for stat, value in stats.items():
+        WORKER_STATS.labels(source, stat, shard).set(value)
+
+
+def registry():
+    """Obtain the registry that holds every metric to export
+
+    :Returns: prometheus_client.CollectorRegistry
+    """
+    if _multiprocess_dir():
+        the_registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(the_registry)
+        return the_registry
+    return REGISTRY
+
+
+def render():
+    """Format every metric in the Prometheus text format
+
+    :Returns: Tuple of (Bytes, String) - the body, and its content type
+    """
+    return generate_latest(registry()), CONTENT_TYPE_LATEST
+
+
+def start_exporter(port):
+    """Serve the metrics over HTTP from a background thread
+
+    :Returns: None
+
+    :param port: The TCP port to listen on; zero disables the exporter
+    :type port: Integer
+    """
+    if port:
+        if _multiprocess_dir():
+            os.makedirs(_multiprocess_dir(), exist_ok=True)
+        start_http_server(port, registry=registry())
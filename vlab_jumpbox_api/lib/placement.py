@@ -0,0 +1,337 @@
+# -*- coding: UTF-8 -*-
+"""
+Decide which vCenter, datastore and resource pool a user's jumpbox lives on.
+
+The shards are defined by ``VLAB_JUMPBOX_SHARDS``, a JSON list like::
+
+    [{"name": "east", "server": "vcenter-east", "datastore": "VM-Storage",
+      "resource_pool": "Resources", "capacity": 500, "weight": 2}]
+
+Without it, there's one shard made from the ``INF_VCENTER_*`` settings.
+
+A user is assigned a shard by consistent hashing of their username, so adding
+a shard only moves the users that hash to it. When a shard is at ``capacity``
+a new jumpbox spills over to the next shard on the ring. Where every jumpbox
+was deployed is recorded in the cache, and the record is kept alive every time
+it's looked up, so looking up a user's shard is usually one cache read.
+
+The cache isn't the source of truth, though; a record can expire, or only
+exist in the memory of another process. So the workers pass a ``search``
+function that checks a shard for the user's jumpbox, and when there's no
+record every shard is searched (in ring order) and what's found is recorded
+again. Not finding a jumpbox anywhere is remembered for ``MISS_TTL`` seconds, so
+a user without a jumpbox doesn't cost a search of every shard on every request.
+The API never searches, so it can only guess for a user without a record.
+
+Records and counters only work when every process shares them, so more than
+one shard (or any ``capacity``) requires ``VLAB_JUMPBOX_CACHE_URL``.
+"""
+import bisect
+import hashlib
+
+import ujson
+from vlab_api_common import get_logger
+
+from vlab_jumpbox_api.lib import const, cache
+
+
+logger = get_logger(__name__, loglevel=const.VLAB_JUMPBOX_LOG_LEVEL)
+
+# How many points each unit of weight gets on the ring; more points, more even spread
+REPLICAS = 64
+# How many seconds to remember that searching every shard found no jumpbox
+MISS_TTL = 60
+
+
+class Shard(object):
+    """One place jumpboxes can be deployed to
+
+    :param name: A unique name for the shard
+    :type name: String
+
+    :param server: The IP/FQDN of the vCenter server
+    :type server: String
+
+    :param datastore: The name of the datastore (or datastore cluster) to deploy to
+    :type datastore: String
+
+    :param resource_pool: The name of the resource pool to deploy to
+    :type resource_pool: String
+
+    :param port: The TCP port the vCenter server listens on
+    :type port: Integer
+
+    :param capacity: The most jumpboxes the shard holds. Zero means no limit
+    :type capacity: Integer
+
+    :param weight: How large a share of users the shard gets, relative to the others
+    :type weight: Integer
+    """
+    def __init__(self, name, server, datastore, resource_pool, port=443, capacity=0, weight=1):
+        self.name = name
+        self.server = server
+        self.datastore = datastore
+        self.resource_pool = resource_pool
+        self.port = port
+        self.capacity = capacity
+        self.weight = weight
+
+    def __repr__(self):
+        return 'Shard(name={!r}, server={!r}, datastore={!r})'.format(self.name, self.server, self.datastore)
+
+
+def load_shards(spec):
+    """Parse the shard definitions
+
+    :Returns: List of Shard
+
+    :Raises: ValueError if the definitions are invalid
+
+    :param spec: The JSON list of shards. An empty string means "just the one vCenter"
+    :type spec: String
+    """
+    if not spec:
+        return [Shard(name='default',
+                      server=const.INF_VCENTER_SERVER,
+                      datastore=const.INF_VCENTER_DATASTORE,
+                      resource_pool=const.INF_VCENTER_RESORUCE_POOL,
+                      port=const.INF_VCENTER_PORT)]
+    shards = []
+    for item in ujson.loads(spec):
+        try:
+            shards.append(Shard(name=item['name'],
+                                server=item['server'],
+                                datastore=item.get('datastore', const.INF_VCENTER_DATASTORE),
+                                resource_pool=item.get('resource_pool', const.INF_VCENTER_RESORUCE_POOL),
+                                port=int(item.get('port', const.INF_VCENTER_PORT)),
+                                capacity=int(item.get('capacity', 0)),
+                                weight=int(item.get('weight', 1))))
+        except KeyError as doh:
+            raise ValueError('Shard definition missing {}: {}'.format(doh, item))
+    if len(set(x.name for x in shards)) != len(shards):
+        raise ValueError('Shard names must be unique')
+    return shards
+
+
+def _hash(value):
+    """Map a string to a point on the ring
+
+    :Returns: Integer
+    """
+    return int(hashlib.md5(value.encode()).hexdigest()[:16], 16)
+
+
+class Placement(object):
+    """Assigns users to shards with a consistent hash ring
+
+    :param shards: Where jumpboxes can be deployed
+    :type shards: List of Shard
+
+    :param backend: Where the placement overrides and shard counters are stored
+    :type backend: vlab_jumpbox_api.lib.cache.MemoryBackend
+
+    :param ttl: How many seconds an override or counter lives without being touched
+    :type ttl: Integer
+    """
+    def __init__(self, shards, backend, ttl):
+        if not shards:
+            raise ValueError('At least one shard must be defined')
+        if len(shards) > 1 and not backend.shared:
+            raise ValueError('More than one shard needs a shared cache; set VLAB_JUMPBOX_CACHE_URL')
+        if any(x.capacity for x in shards) and not backend.shared:
+            raise ValueError('Shard capacity needs a shared cache; set VLAB_JUMPBOX_CACHE_URL')
+        self.shards = {x.name: x for x in shards}
+        self.primary = shards[0]
+        self.backend = backend
+        self.ttl = ttl
+        self._points = []
+        self._owners = []
+        ring = sorted((_hash('{}-{}'.format(x.name, i)), x.name) for x in shards for i in range(REPLICAS * x.weight))
+        for point, name in ring:
+            self._points.append(point)
+            self._owners.append(name)
+
+    def servers(self):
+        """One shard for every distinct vCenter, for work that's done once per vCenter
+
+        :Returns: List of Shard
+        """
+        found = {}
+        for shard in self.shards.values():
+            found.setdefault((shard.server, shard.port), shard)
+        return list(found.values())
+
+    def group(self, usernames, search=None):
+        """Sort users by the shard their jumpbox is on
+
+        :Returns: List of (Shard, List of usernames)
+
+        :param usernames: The users to sort
+        :type usernames: List
+
+        :param search: Checks if a shard has a user's jumpbox; see ``lookup``
+        :type search: Function
+        """
+        groups = {}
+        for username in usernames:
+            groups.setdefault(self.lookup(username, search).name, []).append(username)
+        return [(self.shards[x], y) for x, y in groups.items()]
+
+    def lookup(self, username, search=None):
+        """Find the shard a user's jumpbox is on (or would be deployed to)
+
+        :Returns: Shard
+
+        :param username: The user who owns the jumpbox
+        :type username: String
+
+        :param search: Called with a Shard and the username, returns True if the
+                       user's jumpbox is on that shard. Used when there's no record
+                       of where the jumpbox is.
+        :type search: Function
+        """
+        name = self._recorded(username, search)
+        if name is None:
+            name = self._owners[self._start(username)]
+        return self.shards[name]
+
+    def candidates(self, username):
+        """Every shard a user's next jumpbox could be deployed to, without searching vCenter
+
+        :Returns: List of Shard
+
+        :param username: The user the jumpbox is for
+        :type username: String
+        """
+        name = self._recorded(username)
+        if name is not None:
+            return [self.shards[name]]
+        # Without a record, it's wherever there's room
+        return [self.shards[x] for x in self._walk(username)]
+
+    def place(self, username, search=None):
+        """Pick the shard to deploy a new jumpbox to, and count it against that shard
+
+        :Returns: Shard
+
+        :Raises: ValueError if every shard is full
+
+        :param username: The user the jumpbox is for
+        :type username: String
+
+        :param search: Checks if a shard has a user's jumpbox; see ``lookup``
+        :type search: Function
+        """
+        name = self._recorded(username, search)
+        if name is not None:
+            # Keep all of a user's VMs together
+            self.backend.incr(_count_key(name), 1, self.ttl)
+            return self.shards[name]
+        for name in self._walk(username):
+            shard = self.shards[name]
+            if self.backend.incr(_count_key(name), 1, self.ttl) > shard.capacity > 0:
+                self.backend.incr(_count_key(name), -1, self.ttl)
+                continue
+            if name != self._owners[self._start(username)]:
+                logger.info('Shard for {} is full, placing on {}'.format(username, name))
+            self.assign(username, name)
+            return shard
+        raise ValueError('Every vCenter is at capacity')
+
+    def assign(self, username, shard_name):
+        """Pin a user to a shard, instead of the one their username hashes to
+
+        :Returns: None
+
+        :Raises: ValueError if there's no such shard
+
+        :param username: The user to pin
+        :type username: String
+
+        :param shard_name: The name of the shard
+        :type shard_name: String
+        """
+        if shard_name not in self.shards:
+            raise ValueError('No such shard named {}'.format(shard_name))
+        self.backend.set(_override_key(username), shard_name, self.ttl)
+        self.backend.delete(_missing_key(username))
+
+    def release(self, username):
+        """Stop counting a user's jumpbox against their shard, and forget any override
+
+        :Returns: None
+
+        :param username: The user whose jumpbox was destroyed
+        :type username: String
+        """
+        shard = self.lookup(username)
+        if self.backend.incr(_count_key(shard.name), -1, self.ttl) < 0:
+            # A jumpbox made before counting started; don't go negative
+            self.backend.incr(_count_key(shard.name), 1, self.ttl)
+        self.backend.delete(_override_key(username))
+
+    @property
+    def stats(self):
+        """How many jumpboxes are counted against each shard
+
+        :Returns: Dictionary
+        """
+        return {x: int(self.backend.get(_count_key(x)) or 0) for x in self.shards}
+
+    def _recorded(self, username, search=None):
+        """The name of the shard a user's jumpbox is recorded on, searching for it if there's no record
+
+        :Returns: String, or None if the user has no jumpbox (or there's no record, and no ``search``)
+        """
+        name = self.backend.get(_override_key(username))
+        if name in self.shards:
+            # Only jumpboxes nobody uses for the whole TTL lose their record
+            self.backend.set(_override_key(username), name, self.ttl)
+            return name
+        if search is None or len(self.shards) == 1 or self.backend.get(_missing_key(username)):
+            return None
+        for name in self._walk(username):
+            if search(self.shards[name], username):
+                logger.info('Found the jumpbox of {} on {}'.format(username, name))
+                self.assign(username, name)
+                return name
+        self.backend.set(_missing_key(username), '1', MISS_TTL)
+        return None
+
+    def _start(self, username):
+        """The index on the ring that a username hashes to
+
+        :Returns: Integer
+        """
+        return bisect.bisect(self._points, _hash(username)) % len(self._points)
+
+    def _walk(self, username):
+        """Every shard, in ring order, starting from the one the user hashes to
+
+        :Returns: Generator of shard names
+        """
+        start = self._start(username)
+        seen = set()
+        for offset in range(len(self._owners)):
+            name = self._owners[(start + offset) % len(self._owners)]
+            if name not in seen:
+                seen.add(name)
+                yield name
+
+
+def _override_key(username):
+    """Namespace the shard a user was pinned to"""
+    return 'jumpbox:placement:user:{}'.format(username)
+
+
+def _missing_key(username):
+    """Namespace that no shard had a user's jumpbox"""
+    return 'jumpbox:placement:missing:{}'.format(username)
+
+
+def _count_key(shard_name):
+    """Namespace how many jumpboxes are on a shard"""
+    return 'jumpbox:placement:count:{}'.format(shard_name)
+
+
+ring = Placement(load_shards(const.VLAB_JUMPBOX_SHARDS), cache.backend, const.VLAB_JUMPBOX_PLACEMENT_TTL)
@@ -0,0 +1,239 @@
+# -*- coding: UTF-8 -*-
+"""
+Cheap, but meaningful, health checks for load balancers.
+
+The version of the package is looked up once, when this module is imported.
+Whether the broker, the workers and vCenter are reachable is checked by a
+background thread every ``VLAB_JUMPBOX_READINESS_INTERVAL`` seconds; a health
+check only reads the results of the last round, so it never waits on any of
+them. The thread is started by the first health check a process handles, which
+is after uwsgi has forked it.
+
+The API never logs into vCenter itself (that would load pyVmomi, and log every
+API process into every vCenter). The workers check their vCenter sessions on
+the beat schedule and publish the results to the cache, which the API reads.
+That takes a shared cache, so without ``VLAB_JUMPBOX_CACHE_URL`` vCenter isn't
+probed; the workers answering a ping is all that's checked.
+
+A result that's older than a few intervals is reported as failed, so a probe
+that hangs (like a broker connection that never returns) can't leave a stale
+"ok" behind.
+"""
+import os
+import time
+import threading
+
+from vlab_api_common import get_logger
+
+from vlab_jumpbox_api.lib import const, cache, placement
+
+
+logger = get_logger(__name__, loglevel=const.VLAB_JUMPBOX_LOG_LEVEL)
+
+# How many missed rounds before a result is considered stale
+STALE_ROUNDS = 3
+
+
+def _version():
+    """Find the installed version of this package
+
+    :Returns: String
+    """
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:
+        # Python < 3.8
+        import pkg_resources
+        try:
+            return pkg_resources.get_distribution('vlab-jumpbox-api').version
+        except pkg_resources.DistributionNotFound:
+            return 'unknown'
+    try:
+        return version('vlab-jumpbox-api')
+    except PackageNotFoundError:
+        return 'unknown'
+
+
+VERSION = _version()
+
+
+class Readiness(object):
+    """Periodically runs probes of the service's dependencies, and keeps the results
+
+    :param probes: The name of each dependency, and the function that checks it.
+                   A probe raises when the dependency is unusable, and can return
+                   a dictionary of details to report.
+    :type probes: Dictionary
+
+    :param interval: How many seconds to wait between rounds of probes
+    :type interval: Float
+    """
+    def __init__(self, probes, interval):
+        self.probes = probes
+        self.interval = interval
+        self._results = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        """Start probing in the background, unless this process already is
+
+        :Returns: None
+        """
+        with self._lock:
+            # A thread started before a fork doesn't exist in the child
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='readiness', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop probing after the current round
+
+        :Returns: None
+        """
+        self._stop.set()
+
+    def run_once(self):
+        """Run every probe one time, and record how each went
+
+        :Returns: None
+        """
+        for name, probe in self.probes.items():
+            start = time.time()
+            result = {'ok': True, 'error': None}
+            try:
+                result.update(probe() or {})
+            except Exception as doh:
+                # Whatever the dependency raises, it means "not ready"
+                result['ok'] = False
+                result['error'] = '{}'.format(doh) or doh.__class__.__name__
+            result['latency_ms'] = round((time.time() - start) * 1000, 1)
+            result['checked'] = time.time()
+            if not result['ok']:
+                logger.warning('Readiness probe {} failed: {}'.format(name, result['error']))
+            with self._lock:
+                self._results[name] = result
+
+    def status(self):
+        """The results of the last round of probes
+
+        :Returns: Tuple - (Boolean, Dictionary) whether every dependency is ready, and the details of each
+        """
+        self.start()
+        now = time.time()
+        with self._lock:
+            results = {x: dict(y) for x, y in self._results.items()}
+        dependencies = {}
+        for name in self.probes:
+            result = results.get(name)
+            if result is None:
+                dependencies[name] = {'ok': False, 'error': 'Not checked yet'}
+                continue
+            checked = result.pop('checked')
+            result['age'] = round(now - checked, 1)
+            if result['ok'] and now - checked > self.interval * STALE_ROUNDS:
+                result['ok'] = False
+                result['error'] = 'No result for {} seconds'.format(int(now - checked))
+            dependencies[name] = result
+        return all(x['ok'] for x in dependencies.values()), dependencies
+
+    def _loop(self):
+        """Probe every dependency, until stopped"""
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval)
+
+
+def probe_broker(celery_app, timeout=const.VLAB_JUMPBOX_READINESS_TIMEOUT):
+    """Check that the message broker accepts connections
+
+    :Returns: None
+
+    :param celery_app: The app the API sends tasks through
+    :type celery_app: celery.Celery
+
+    :param timeout: The most seconds to wait for the broker
+    :type timeout: Float
+    """
+    with celery_app.connection_for_write(connect_timeout=timeout) as conn:
+        conn.ensure_connection(max_retries=1)
+
+
+def probe_workers(celery_app, timeout=const.VLAB_JUMPBOX_READINESS_TIMEOUT):
+    """Check that at least one worker is consuming tasks
+
+    :Returns: Dictionary
+
+    :Raises: RuntimeError if no worker replies
+
+    :param celery_app: The app the API sends tasks through
+    :type celery_app: celery.Celery
+
+    :param timeout: The most seconds to wait for replies
+    :type timeout: Float
+    """
+    replies = celery_app.control.ping(timeout=timeout)
+    if not replies:
+        raise RuntimeError('No workers replied to a ping')
+    return {'workers': len(replies)}
+
+
+def probe_vcenter(shard):
+    """Check that the workers can login to vCenter
+
+    :Returns: Dictionary
+
+    :Raises: RuntimeError if the last login failed, or no worker has checked recently
+
+    :param shard: Where the vCenter is
+    :type shard: vlab_jumpbox_api.lib.placement.Shard
+    """
+    status = cache.get_vcenter_status(shard.server)
+    if status is None:
+        raise RuntimeError('No worker has checked vCenter recently')
+    if not status['ok']:
+        raise RuntimeError(status['error'])
+    return {'login_ms': status['latency_ms']}
+
+
+def default_probes(celery_app):
+    """The dependencies the jumpbox service can't work without
+
+    :Returns: Dictionary
+
+    :param celery_app: The app the API sends tasks through
+    :type celery_app: celery.Celery
+    """
+    probes = {'broker': lambda: probe_broker(celery_app),
+              'workers': lambda: probe_workers(celery_app)}
+    if not cache.shared():
+        return probes
+    servers = placement.ring.servers()
+    for shard in servers:
+        name = 'vcenter' if len(servers) == 1 else 'vcenter:{}'.format(shard.server)
+        probes[name] = lambda shard=shard: probe_vcenter(shard)
+    return probes
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def get_monitor(celery_app):
+    """Obtain the one Readiness of this process, making it if needed
+
+    :Returns: Readiness
+
+    :param celery_app: The app the API sends tasks through
+    :type celery_app: celery.Celery
+    """
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = Readiness(default_probes(celery_app), const.VLAB_JUMPBOX_READINESS_INTERVAL)
+        return _monitor
@@ -1,3 +1,4 @@
 # -*- coding: UTF-8 -*-
 from .healthcheck import HealthView
 from .jumpbox import JumpboxView
+from .metrics import MetricsView
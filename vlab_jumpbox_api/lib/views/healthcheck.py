@@ -2,14 +2,11 @@
 """
 Enables Health checks for the power API
 """
-from time import time
-import pkg_resources
-
 import ujson
-from flask_classy import FlaskView, Response
-from vlab_inf_common.vmware import vCenter
+from flask import current_app
+from flask_classy import FlaskView, Response, route
 
-from vlab_jumpbox_api.lib import const
+from vlab_jumpbox_api.lib import readiness
 
 
 class HealthView(FlaskView):
@@ -20,11 +17,27 @@ class HealthView(FlaskView):
     trailing_slash = False
 
     def get(self):
-        """End point for health checks"""
-        resp = {}
-        status = 200
-        resp['version'] = pkg_resources.get_distribution('vlab-jumpbox-api').version
+        """End point for health checks; always 200 while the API is up"""
+        return self._respond(ready_status=200)
+
+    @route('/ready', methods=['GET'])
+    def ready(self):
+        """End point for load balancers; 503 unless the broker, workers and vCenter are all reachable"""
+        return self._respond(ready_status=503)
+
+    def _respond(self, ready_status):
+        """Report the version, and the last results of the readiness probes
+
+        The probes run in the background, so this never waits on a dependency.
+
+        :Returns: flask.Response
+
+        :param ready_status: The HTTP status to use when a dependency isn't ready
+        :type ready_status: Integer
+        """
+        ready, dependencies = readiness.get_monitor(current_app.celery_app).status()
+        resp = {'version': readiness.VERSION, 'ready': ready, 'dependencies': dependencies}
         response = Response(ujson.dumps(resp))
-        response.status_code = status
+        response.status_code = 200 if ready else ready_status
         response.headers['Content-Type'] = 'application/json'
         return response
@@ -1,16 +1,27 @@
 # -*- coding: UTF-8 -*-
 """
 This module defines the RESTful API for working with the jumpbox in your lab
+
+Following a task's progress with ``/task/<id>/events`` holds a uwsgi thread
+for as long as the stream is open, checking on the task every
+``VLAB_JUMPBOX_EVENTS_INTERVAL`` seconds. So a stream ends after
+``VLAB_JUMPBOX_EVENTS_TIMEOUT`` seconds (clients reconnect to keep following
+a slow task), and ``app.ini`` runs enough processes and threads that a few
+open streams don't block other requests. Any API process has to be able to read
+the task's state, which takes a shared result backend; with ``rpc://`` only the
+process that sent the task ever sees it finish, so streaming is refused.
 """
+import time
+import uuid
+
 import ujson
 from flask import current_app
-from flask_classy import request, Response
+from flask_classy import request, route, Response
 from vlab_inf_common.views import TaskView
-from vlab_inf_common.vmware import vCenter, vim
 from vlab_api_common import describe, get_logger, requires, validate_input
 
 
-from vlab_jumpbox_api.lib import const
+from vlab_jumpbox_api.lib import const, cache, placement
 
 
 logger = get_logger(__name__, loglevel=const.VLAB_JUMPBOX_LOG_LEVEL)
@@ -36,6 +47,57 @@ class JumpboxView(TaskView):
                     },
                     "required": ["network"]
                   }
+    BULK_POST_SCHEMA = {"$schema": "http://json-schema.org/draft-04/schema#",
+                        "type": "object",
+                        "description": "Create jumpboxes for many users",
+                        "properties": {
+                            "jumpboxes": {
+                                "description": "The users to create jumpboxes for",
+                                "type": "array",
+                                "minItems": 1,
+                                "items": {
+                                    "type": "object",
+                                    "properties": {
+                                        "username": {
+                                            "description": "The user who will own the jumpbox",
+                                            "type": "string"
+                                        },
+                                        "network": {
+                                            "description": "The name of the network the jumpbox connects to",
+                                            "type": "string"
+                                        }
+                                    },
+                                    "required": ["username", "network"]
+                                }
+                            }
+                        },
+                        "required": ["jumpboxes"]
+                       }
+    BULK_DELETE_SCHEMA = {"$schema": "http://json-schema.org/draft-04/schema#",
+                          "type": "object",
+                          "description": "Destroy the jumpboxes of many users",
+                          "properties": {
+                              "usernames": {
+                                  "description": "The users whose jumpboxes should be destroyed",
+                                  "type": "array",
+                                  "minItems": 1,
+                                  "items": {"type": "string"}
+                              }
+                          },
+                          "required": ["usernames"]
+                         }
+    IDLE_SCHEMA = {"$schema": "http://json-schema.org/draft-04/schema#",
+                   "type": "object",
+                   "description": "Choose how long your jumpbox can sit idle before it's suspended",
+                   "properties": {
+                       "timeout": {
+                           "description": "Seconds of idleness before suspending; zero means never",
+                           "type": "integer",
+                           "minimum": 0
+                       }
+                   },
+                   "required": ["timeout"]
+                  }
 
     @requires(verify=False, version=(1,2))
     @describe(post=POST_SCHEMA, delete=DELETE_SCHEMA, get_args=GET_SCHEMA)
@@ -43,35 +105,230 @@ class JumpboxView(TaskView):
         """Obtain a info about the jumpbox a user owns"""
         username = kwargs['token']['username']
         resp_data = {'user' : username}
-        task = current_app.celery_app.send_task('jumpbox.show', [username])
-        resp_data['content'] = {'task-id': task.id}
-        resp = Response(ujson.dumps(resp_data))
-        resp.status_code = 202
-        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task.id))
-        return resp
+        info = cache.get_show(username)
+        if info is not None:
+            # Fresh enough to skip the round trip through the broker & worker
+            resp_data['content'] = info
+            resp = Response(ujson.dumps(resp_data))
+            resp.status_code = 200
+            return resp
+        return self._submit('show', username, [username])
 
     @requires(verify=False, version=(1,2)) # XXX remove verify=False before commit
     @validate_input(schema=POST_SCHEMA)
     def post(self, *args, **kwargs):
         """Create a new gateway"""
         username = kwargs['token']['username']
-        resp_data = {'user' : username}
         network = kwargs['body']['network']
-        task = current_app.celery_app.send_task('jumpbox.create', [username, network])
+        indexes = [cache.get_networks(x.server) for x in placement.ring.candidates(username)]
+        # No index means no worker has published one recently; let the worker decide
+        if None not in indexes and not any(network in x for x in indexes):
+            resp_data = {'user' : username, 'error': 'No such network named {}'.format(network)}
+            resp = Response(ujson.dumps(resp_data))
+            resp.status_code = 400
+            return resp
+        return self._submit('create', username, [username, network])
+
+    @requires(verify=False, version=(1,2)) # XXX remove verify=False before commit
+    def delete(self, *args, **kwargs):
+        """Delete a gateway"""
+        username = kwargs['token']['username']
+        return self._submit('delete', username, [username])
+
+    @route('/reset', methods=['POST'])
+    @requires(verify=False, version=(1,2))
+    def reset(self, *args, **kwargs):
+        """Put the jumpbox back the way it was right after it was created"""
+        username = kwargs['token']['username']
+        return self._submit('reset', username, [username])
+
+    @route('/connect', methods=['POST'])
+    @requires(verify=False, version=(1,2))
+    def connect(self, *args, **kwargs):
+        """Resume the jumpbox if it was suspended for being idle, so the user can connect to it"""
+        username = kwargs['token']['username']
+        return self._submit('resume', username, [username])
+
+    @route('/idle', methods=['GET'])
+    @requires(verify=False, version=(1,2))
+    def get_idle(self, *args, **kwargs):
+        """Obtain how long the jumpbox can sit idle before it's suspended"""
+        username = kwargs['token']['username']
+        timeout = cache.get_idle_policy(username)
+        if timeout is None:
+            timeout = const.VLAB_JUMPBOX_IDLE_TIMEOUT
+        resp = Response(ujson.dumps({'user' : username, 'content': {'timeout': timeout}}))
+        resp.status_code = 200
+        return resp
+
+    @route('/idle', methods=['PUT'])
+    @requires(verify=False, version=(1,2))
+    @validate_input(schema=IDLE_SCHEMA)
+    def put_idle(self, *args, **kwargs):
+        """Choose how long the jumpbox can sit idle before it's suspended"""
+        username = kwargs['token']['username']
+        timeout = kwargs['body']['timeout']
+        cache.set_idle_policy(username, timeout)
+        resp = Response(ujson.dumps({'user' : username, 'content': {'timeout': timeout}}))
+        resp.status_code = 200
+        return resp
+
+    def _submit(self, operation, username, task_args):
+        """Send a task, unless the same one is already in flight for the user
+
+        A double-clicked create, or a client retrying a POST, gets the id of
+        the task that's already running instead of starting another one.
+        Clients can also supply an ``Idempotency-Key`` header to safely retry a
+        request after the original task has finished.
+
+        :Returns: flask.Response
+
+        :param operation: The kind of jumpbox task, like ``create``
+        :type operation: String
+
+        :param username: The user making the request
+        :type username: String
+
+        :param task_args: The arguments for the Celery task
+        :type task_args: List
+        """
+        resp_data = {'user' : username}
+        task_id = str(uuid.uuid4())
+        celery_app = current_app.celery_app
+        existing = cache.claim_task(username, operation, task_id, request.headers.get('Idempotency-Key'),
+                                    finished=lambda x: celery_app.AsyncResult(x).ready())
+        if existing:
+            logger.info('Coalesced {} request for {} into task {}'.format(operation, username, existing))
+            task_id = existing
+        else:
+            task = celery_app.send_task('jumpbox.{}'.format(operation), task_args, task_id=task_id)
+            task_id = task.id
+        resp_data['content'] = {'task-id': task_id}
+        resp = Response(ujson.dumps(resp_data))
+        resp.status_code = 202
+        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task_id))
+        if _streamable(celery_app):
+            resp.headers.add('Link', '<{0}{1}/task/{2}/events>; rel=events'.format(const.VLAB_URL, self.route_base, task_id))
+        return resp
+
+    @route('/task/<tid>/events', methods=['GET'])
+    @requires(verify=False, version=(1,2))
+    def task_events(self, *args, **kwargs):
+        """Stream the progress of a task as Server-Sent Events, instead of polling for it"""
+        celery_app = current_app.celery_app
+        if not _streamable(celery_app):
+            username = kwargs['token']['username']
+            error = 'Streaming events requires a shared result backend; poll the task instead'
+            resp = Response(ujson.dumps({'user' : username, 'error': error}))
+            resp.status_code = 501
+            resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, kwargs['tid']))
+            return resp
+        # The generator runs after the request context is gone
+        events = _task_events(celery_app, kwargs['tid'])
+        resp = Response(events, mimetype='text/event-stream')
+        resp.headers['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream until the task is done
+        resp.headers['X-Accel-Buffering'] = 'no'
+        return resp
+
+    @route('/bulk', methods=['POST'])
+    @requires(verify=False, version=(1,2), memberOf=const.VLAB_JUMPBOX_ADMIN_GROUP)
+    @validate_input(schema=BULK_POST_SCHEMA)
+    def bulk_create(self, *args, **kwargs):
+        """Create jumpboxes for a whole class or team"""
+        username = kwargs['token']['username']
+        resp_data = {'user' : username}
+        jumpboxes = kwargs['body']['jumpboxes']
+        task = current_app.celery_app.send_task('jumpbox.bulk_create', [jumpboxes])
         resp_data['content'] = {'task-id': task.id}
         resp = Response(ujson.dumps(resp_data))
         resp.status_code = 202
         resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task.id))
         return resp
 
-    @requires(verify=False, version=(1,2)) # XXX remove verify=False before commit
-    def delete(self, *args, **kwargs):
-        """Delete a gateway"""
+    @route('/bulk', methods=['DELETE'])
+    @requires(verify=False, version=(1,2), memberOf=const.VLAB_JUMPBOX_ADMIN_GROUP)
+    @validate_input(schema=BULK_DELETE_SCHEMA)
+    def bulk_delete(self, *args, **kwargs):
+        """Delete the jumpboxes of a whole class or team"""
         username = kwargs['token']['username']
         resp_data = {'user' : username}
-        task = current_app.celery_app.send_task('jumpbox.delete', [username])
+        usernames = kwargs['body']['usernames']
+        task = current_app.celery_app.send_task('jumpbox.bulk_delete', [usernames])
         resp_data['content'] = {'task-id': task.id}
         resp = Response(ujson.dumps(resp_data))
         resp.status_code = 202
         resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task.id))
         return resp
+
+
+def _streamable(celery_app):
+    """Determine if any API process can follow a task, which streaming events needs
+
+    :Returns: Boolean
+
+    :param celery_app: The app the API sends tasks through
+    :type celery_app: celery.Celery
+    """
+    backend = '{}'.format(celery_app.conf.result_backend or '')
+    return bool(backend) and not backend.startswith('rpc')
+
+
+def _task_events(celery_app, task_id, interval=None, timeout=None):
+    """Yield an event every time a task's state or progress changes, until it's done
+
+    Each event is a ``progress`` event with the task's status and progress, and
+    the last one is a ``done`` event with the task's result. A ``timeout``
+    event ends the stream if the task takes too long.
+
+    :Returns: Generator of Strings
+
+    :param celery_app: The app the task was sent with
+    :type celery_app: celery.Celery
+
+    :param task_id: The id of the task to follow
+    :type task_id: String
+
+    :param interval: How many seconds to wait between checks on the task
+    :type interval: Float
+
+    :param timeout: The most seconds to stream events for
+    :type timeout: Integer
+    """
+    if interval is None:
+        interval = const.VLAB_JUMPBOX_EVENTS_INTERVAL
+    if timeout is None:
+        timeout = const.VLAB_JUMPBOX_EVENTS_TIMEOUT
+    deadline = time.time() + timeout
+    last = None
+    while True:
+        result = celery_app.AsyncResult(task_id)
+        status = result.status
+        if status == 'SUCCESS':
+            yield _event('done', {'status': status, 'result': result.result})
+            return
+        elif status == 'FAILURE':
+            yield _event('done', {'status': status, 'result': {'content': {}, 'error': '{}'.format(result.result), 'params': {}}})
+            return
+        info = result.info if status == 'PROGRESS' else None
+        if (status, info) != last:
+            last = (status, info)
+            yield _event('progress', {'status': status, 'progress': info})
+        if time.time() > deadline:
+            yield _event('timeout', {'status': status})
+            return
+        time.sleep(interval)
+
+
+def _event(name, data):
+    """Format one Server-Sent Event
+
+    :Returns: String
+
+    :param name: The kind of event
+    :type name: String
+
+    :param data: The payload of the event
+    :type data: Dictionary
+    """
+    return 'event: {}\ndata: {}\n\n'.format(name, ujson.dumps(data))
@@ -0,0 +1,23 @@
+# -*- coding: UTF-8 -*-
+"""
+Exposes Prometheus metrics for the jumpbox API
+"""
+from flask_classy import FlaskView, Response
+
+from vlab_jumpbox_api.lib import metrics
+
+
+class MetricsView(FlaskView):
+    """
+    End point for Prometheus to scrape
+    """
+    route_base = '/api/1/inf/jumpbox/metrics'
+    trailing_slash = False
+
+    def get(self):
+        """Obtain every metric, in the Prometheus text format"""
+        body, content_type = metrics.render()
+        response = Response(body)
+        response.status_code = 200
+        response.headers['Content-Type'] = content_type
+        return response
@@ -0,0 +1,185 @@
+# -*- coding: UTF-8 -*-
+"""
+An asyncio based way to run the read heavy, and wait heavy, vCenter work.
+
+pyVmomi is synchronous, so each blocking SOAP call is run on a small thread
+pool, and waiting on a vSphere Task is an ``asyncio.sleep`` loop instead of a
+blocked thread. That lets one worker process have many vCenter calls in flight,
+like when deleting the jumpboxes of a whole class.
+
+All coroutines share the one vCenter session passed to them; the pyVmomi SOAP
+stub keeps its own connection pool, so concurrent calls on it are safe.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from celery.utils.log import get_task_logger
+from vlab_inf_common.vmware import virtual_machine
+
+from vlab_jumpbox_api.lib import const, metrics, placement, cache
+from vlab_jumpbox_api.lib.worker import sessions, inventory
+from vlab_jumpbox_api.lib.worker.vmware import COMPONENT_NAME
+
+
+logger = get_task_logger(__name__)
+logger.setLevel(const.VLAB_JUMPBOX_LOG_LEVEL.upper())
+
+_executor = ThreadPoolExecutor(max_workers=const.VLAB_JUMPBOX_ASYNC_THREADS)
+
+# How many seconds to wait between checks on a vSphere task
+POLL_INTERVAL = 1
+
+
+def run(coroutine_func, *args, shard=None, **kwargs):
+    """Borrow a vCenter session, and run a coroutine function to completion with it
+
+    :Returns: Whatever the coroutine returns
+
+    :param coroutine_func: The async function to run. The vCenter session is
+                           supplied as the first argument.
+    :type coroutine_func: Function
+
+    :param shard: Which vCenter to borrow a session to. Defaults to the primary shard
+    :type shard: vlab_jumpbox_api.lib.placement.Shard
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        with sessions.get_pool(shard or placement.ring.primary).session() as vcenter:
+            return loop.run_until_complete(coroutine_func(vcenter, *args, **kwargs))
+    finally:
+        loop.close()
+
+
+async def call(func, *args, **kwargs):
+    """Run a blocking function without blocking the event loop
+
+    :Returns: Whatever the function returns
+    """
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+async def consume_task(the_task, timeout=600, interval=None):
+    """Wait for a vSphere task to complete, without holding a thread while waiting
+
+    :Returns: vim.TaskInfo.result
+
+    :Raises: RuntimeError
+
+    :param the_task: The pyVmomi task that you're waiting on
+    :type the_task: vim.Task
+
+    :param timeout: How many seconds to wait for a task to complete
+    :type timeout: Integer
+
+    :param interval: How many seconds to wait between checks. Defaults to ``POLL_INTERVAL``
+    :type interval: Float
+    """
+    if interval is None:
+        interval = POLL_INTERVAL
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + timeout
+    while True:
+        info = await call(getattr, the_task, 'info')
+        if info.completeTime:
+            break
+        if loop.time() > deadline:
+            msg = 'Timeout of {} seconds exceeded for task {}'.format(timeout, the_task)
+            raise RuntimeError(msg)
+        await asyncio.sleep(interval)
+    if info.error:
+        raise RuntimeError(info.error.msg)
+    return info.result
+
+
+async def show_jumpbox(vcenter, username):
+    """Obtain basic information about the user's Jumpbox
+
+    :Returns: Dictionary
+
+    :param vcenter: The instantiated connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param username: The user requesting info about their jumpbox
+    :type username: String
+    """
+    # Coroutines interleave on one thread, so name the task explicitly
+    with metrics.timed('total', task_name='show'):
+        vms = await call(inventory.get_user_vms, vcenter, username, COMPONENT_NAME)
+        for vm in vms:
+            return await call(virtual_machine.get_info, vcenter, vm)
+        return {}
+
+
+async def delete_jumpbox(vcenter, username):
+    """Power off and destroy every jumpbox the user has, all at once
+
+    :Returns: None
+
+    :param vcenter: The instantiated connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param username: The user who wants to delete their jumpbox
+    :type username: String
+    """
+    with metrics.timed('total', task_name='delete'):
+        vms = await call(inventory.get_user_vms, vcenter, username, COMPONENT_NAME)
+        await asyncio.gather(*[_destroy(vm) for vm in vms])
+    if vms:
+        await call(placement.ring.release, username)
+
+
+async def _destroy(the_vm):
+    """Hard power off, then destroy, a single VM
+
+    :Returns: None
+
+    :param the_vm: The VM to destroy
+    :type the_vm: vim.VirtualMachine
+    """
+    power_state = await call(getattr, the_vm.runtime, 'powerState')
+    if power_state != 'poweredOff':
+        logger.debug('powering off VM')
+        await consume_task(await call(the_vm.PowerOffVM_Task))
+    logger.debug('waiting while VM is being destroyed')
+    await consume_task(await call(the_vm.Destroy_Task))
+
+
+async def bulk_delete(vcenter, usernames, concurrency=const.VLAB_JUMPBOX_BULK_CONCURRENCY, callback=None):
+    """Destroy the jumpboxes of many users, multiplexed over one session
+
+    :Returns: Dictionary
+
+    :param vcenter: The instantiated connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param usernames: The users whose jumpboxes should be destroyed
+    :type usernames: List
+
+    :param concurrency: The most users to work on at the same time
+    :type concurrency: Integer
+
+    :param callback: Called with the username and result as each jumpbox is deleted
+    :type callback: Function
+    """
+    limit = asyncio.Semaphore(concurrency)
+    results = {}
+
+    async def _delete(username):
+        async with limit:
+            try:
+                # Waiting on the lock holds a thread, not the event loop
+                token = await call(cache.acquire_user_lock, username)
+                try:
+                    results[username] = {'content': await delete_jumpbox(vcenter, username), 'error': None}
+                finally:
+                    await call(cache.release_user_lock, username, token)
+            except (ValueError, RuntimeError) as doh:
+                logger.error('Failed for user {}: {}'.format(username, doh))
+                results[username] = {'content': {}, 'error': '{}'.format(doh)}
+        if callback:
+            callback(username, results[username])
+
+    await asyncio.gather(*[_delete(x) for x in usernames])
+    return results
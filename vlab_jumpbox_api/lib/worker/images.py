@@ -0,0 +1,300 @@
+# -*- coding: UTF-8 -*-
+"""
+An index of the OVA files in ``VLAB_JUMPBOX_IMAGES_DIR``.
+
+Building an ``Ova`` opens the tarball, walks every member header and parses the
+OVF descriptor, just so ``deploy_from_ova`` can stream the disks. The catalog
+does that once per image, and remembers the descriptor, the networks and where
+each disk lives in the tarball. The entry is reused until the file's mtime or
+size changes.
+
+Each image is memory mapped once, and shared by every deploy in the process.
+A deploy gets its own cursor into each disk, so concurrent deploys of the same
+image don't fight over one file position. The disks are sent by the
+``upload`` module, all at once and without copying them out of the map.
+"""
+import os
+import mmap
+import tarfile
+import threading
+
+from pyVmomi import vmodl
+from celery.utils.log import get_task_logger
+from vlab_inf_common.vmware import Ova
+from vlab_inf_common.ssl_context import get_context
+
+from vlab_jumpbox_api.lib import const
+from vlab_jumpbox_api.lib.worker import upload
+
+
+logger = get_task_logger(__name__)
+logger.setLevel(const.VLAB_JUMPBOX_LOG_LEVEL.upper())
+
+
+class _Image(object):
+    """The cached metadata of one OVA file
+
+    :param path: The location of the OVA file
+    :type path: String
+    """
+    def __init__(self, path):
+        stat = os.stat(path)
+        self.path = path
+        self.mtime = stat.st_mtime
+        self.size = stat.st_size
+        self.disks = {}
+        self.ovf = None
+        with tarfile.open(path) as the_tar:
+            for member in the_tar.getmembers():
+                if member.name.endswith('.vmdk'):
+                    self.disks[member.name] = (member.offset_data, member.size)
+                elif member.name.endswith('.ovf'):
+                    self.ovf = the_tar.extractfile(member).read().decode()
+        with open(path, 'rb') as the_file:
+            self.mapped = mmap.mmap(the_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def is_current(self):
+        """Determine if the file on disk is the one that was indexed
+
+        :Returns: Boolean
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return stat.st_mtime == self.mtime and stat.st_size == self.size
+
+    def close(self):
+        """Release the memory map
+
+        :Returns: None
+        """
+        try:
+            self.mapped.close()
+        except BufferError:
+            # A deploy still has a view of the map; it's freed once that's done
+            pass
+
+
+class _Progress(object):
+    """Tracks how much of an image a single deploy has read, like ``ova.FileHandle``
+
+    :param size: The size of the OVA file
+    :type size: Integer
+    """
+    def __init__(self, size):
+        self.st_size = size
+        self.offset = 0
+        self._lock = threading.Lock()
+
+    def add(self, amount):
+        """Count bytes that were read; disks are read from several threads at once
+
+        :Returns: None
+        """
+        with self._lock:
+            self.offset += amount
+
+    def progress(self):
+        """How far along reading the image is, as a percentage
+
+        :Returns: Integer
+        """
+        return min(int(100.0 * self.offset / self.st_size), 100)
+
+    def close(self):
+        """Nothing to close; the memory map is owned by the catalog"""
+        pass
+
+
+class _DiskReader(object):
+    """A file-like view of one disk within a memory mapped OVA
+
+    :param mapped: The memory mapped OVA file
+    :type mapped: mmap.mmap
+
+    :param offset: Where the disk starts within the OVA
+    :type offset: Integer
+
+    :param size: How many bytes the disk is
+    :type size: Integer
+
+    :param progress: Where to count how many bytes have been read
+    :type progress: _Progress
+    """
+    def __init__(self, mapped, offset, size, progress):
+        self._view = memoryview(mapped)[offset:offset + size]
+        self._position = 0
+        self._progress = progress
+        self.size = size
+
+    def read(self, amount=-1):
+        """Obtain the next chunk of the disk, without copying it out of the map
+
+        :Returns: memoryview
+        """
+        if amount is None or amount < 0:
+            amount = self.size - self._position
+        chunk = self._view[self._position:self._position + amount]
+        self._position += len(chunk)
+        self._progress.add(len(chunk))
+        return chunk
+
+    def seek(self, offset, whence=0):
+        """Move the cursor, like ``file.seek``
+
+        :Returns: Integer
+        """
+        if whence == 1:
+            offset += self._position
+        elif whence == 2:
+            offset += self.size
+        self._position = max(0, min(offset, self.size))
+        return self._position
+
+    def tell(self):
+        """Where the cursor is
+
+        :Returns: Integer
+        """
+        return self._position
+
+    def close(self):
+        """Release this reader's view of the memory map"""
+        self._view.release()
+
+
+class CachedOva(Ova):
+    """An ``Ova`` built from catalog metadata instead of reparsing the tarball
+
+    :param image: The cached metadata of the OVA file
+    :type image: _Image
+    """
+    def __init__(self, image):
+        # Deliberately skips Ova.__init__; that's the parsing this avoids
+        self._spec = None
+        self._lease = None
+        self._host = None
+        self._prog = None
+        self._tar = None
+        self._ovf = image.ovf
+        self._handle = _Progress(image.size)
+        self._disks = {name: _DiskReader(image.mapped, offset, size, self._handle)
+                       for name, (offset, size) in image.disks.items()}
+        self.bytes_per_second = 0.0
+
+    def deploy(self, deploy_spec, lease, host):
+        """Create a new VM based off the OVA, uploading every disk at once
+
+        :Returns: None
+
+        :param deploy_spec: The OVA deployment spec
+        :type deploy_spec: vim.OvfManager.CreateImportSpecResult
+
+        :param lease: The vSphere lease that enables VM creation
+        :type lease: vim.HttpNfcLease
+
+        :param host: The FQDN of the ESXi host the disks are uploaded to
+        :type host: String
+        """
+        self._spec = deploy_spec
+        self._lease = lease
+        self._host = host
+        try:
+            # Keeps the lease alive, and reports progress to vCenter
+            self._chime_progress(lease)
+            disks = []
+            for file_item in deploy_spec.fileItem:
+                disk = self._disks.get(file_item.path)
+                if disk is not None:
+                    disks.append((self._get_device_url(file_item), disk, disk.size))
+            uploader = upload.DiskUploader(connections=const.VLAB_JUMPBOX_UPLOAD_CONNECTIONS,
+                                           chunk_size=const.VLAB_JUMPBOX_UPLOAD_CHUNK_SIZE,
+                                           timeout=const.VLAB_JUMPBOX_UPLOAD_TIMEOUT,
+                                           context=get_context())
+            uploader.upload(disks, host=host, callback=self._uploaded)
+            lease.Progress(100)
+            lease.Complete()
+        except vmodl.MethodFault as doh:
+            lease.Abort(doh)
+            raise
+        except Exception as doh:
+            lease.Abort(vmodl.fault.SystemError(reason=str(doh)))
+            raise
+        finally:
+            self._reset()
+
+    def _uploaded(self, stats):
+        """Remember how fast the disks are being uploaded"""
+        self.bytes_per_second = stats['bytes_per_second']
+
+    def _reset(self):
+        """Reset after deployment"""
+        super(CachedOva, self)._reset()
+        self._handle.offset = 0
+
+    def close(self):
+        """Release this deploy's views of the memory mapped image"""
+        for disk in self._disks.values():
+            disk.close()
+
+
+class ImageCatalog(object):
+    """Hands out ``Ova`` objects for the images in a directory
+
+    :param images_dir: Where the OVA files are
+    :type images_dir: String
+    """
+    def __init__(self, images_dir):
+        self.images_dir = images_dir
+        self._images = {}
+        self._lock = threading.Lock()
+
+    def index(self):
+        """Index every OVA in the images directory
+
+        :Returns: List of the image names
+        """
+        names = sorted(x for x in os.listdir(self.images_dir) if x.endswith('.ova'))
+        for name in names:
+            self.get(name)
+        return names
+
+    def get(self, image_name):
+        """Obtain the metadata of an image, reindexing it if the file changed
+
+        :Returns: _Image
+
+        :Raises: ValueError if there's no such image
+
+        :param image_name: The name of the OVA file
+        :type image_name: String
+        """
+        with self._lock:
+            image = self._images.get(image_name)
+            if image is not None and image.is_current():
+                return image
+            path = os.path.join(self.images_dir, image_name)
+            if not os.path.isfile(path):
+                raise ValueError('No such image named {}'.format(image_name))
+            logger.info('Indexing image {}'.format(path))
+            if image is not None:
+                image.close()
+            image = _Image(path)
+            self._images[image_name] = image
+            return image
+
+    def open(self, image_name):
+        """Obtain an ``Ova`` that's ready to deploy
+
+        :Returns: vlab_inf_common.vmware.Ova
+
+        :Raises: ValueError if there's no such image
+
+        :param image_name: The name of the OVA file
+        :type image_name: String
+        """
+        return CachedOva(self.get(image_name))
+
+
+catalog = ImageCatalog(const.VLAB_JUMPBOX_IMAGES_DIR)
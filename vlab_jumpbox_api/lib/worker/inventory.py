@@ -0,0 +1,152 @@
+# -*- coding: UTF-8 -*-
+"""
+Cheap lookups of inventory objects in vCenter.
+
+Reading an attribute like ``vm.name`` on a pyVmomi object is a SOAP round trip,
+so walking ``folder.childEntity`` costs one call per child. The functions in
+this module instead ask the PropertyCollector for just the properties needed,
+for every object in a container, in a single batched call.
+"""
+from pyVmomi import vmodl
+from vlab_inf_common.vmware import vim
+
+from vlab_jumpbox_api.lib import const
+
+
+def retrieve(vcenter, container, vimtype, properties, recursive=False):
+    """Obtain some properties of every object of a given type within a container
+
+    :Returns: List of (pyVmomi.ManagedObject, Dictionary) tuples
+
+    :param vcenter: The instantiated connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param container: The folder (or other container) to look in
+    :type container: vim.ManagedEntity
+
+    :param vimtype: The category of object to find
+    :type vimtype: pyVmomi.VmomiSupport.LazyType
+
+    :param properties: The property paths to fetch, like ``['name']``
+    :type properties: List
+
+    :param recursive: Set to True to also look in child containers
+    :type recursive: Boolean
+    """
+    content = vcenter.content
+    view = content.viewManager.CreateContainerView(container=container,
+                                                   type=[vimtype],
+                                                   recursive=recursive)
+    try:
+        traversal = vmodl.query.PropertyCollector.TraversalSpec(name='traverseView',
+                                                                path='view',
+                                                                skip=False,
+                                                                type=vim.view.ContainerView)
+        obj_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[traversal])
+        prop_spec = vmodl.query.PropertyCollector.PropertySpec(type=vimtype, pathSet=properties, all=False)
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(objectSet=[obj_spec], propSet=[prop_spec])
+        collector = content.propertyCollector
+        result = collector.RetrievePropertiesEx([filter_spec], vmodl.query.PropertyCollector.RetrieveOptions())
+        found = []
+        while result:
+            for item in result.objects:
+                found.append((item.obj, {x.name: x.val for x in item.propSet}))
+            if not result.token:
+                break
+            result = collector.ContinueRetrievePropertiesEx(result.token)
+    finally:
+        view.DestroyView()
+    return found
+
+
+def get_user_folder(vcenter, username):
+    """Find the VM folder that holds all of a user's lab
+
+    :Returns: vim.Folder
+
+    :Raises: ValueError if the user has no folder
+
+    :param vcenter: The instantiated connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param username: The user who owns the folder
+    :type username: String
+    """
+    base_dir = [x for x in const.INF_VCENTER_TOP_LVL_DIR.split('/') if x]
+    folders = retrieve(vcenter, vcenter.content.rootFolder, vim.Folder, ['name', 'parent'], recursive=True)
+    parents = {folder: props for folder, props in folders}
+    for folder, props in folders:
+        if props['name'] == username and _path_of(props['parent'], parents)[1:] == base_dir:
+            return folder
+    raise ValueError('Unable to locate object named {}'.format(username))
+
+
+def get_user_vms(vcenter, username, name):
+    """Find all VMs in a user's folder that have a specific name
+
+    :Returns: List of vim.VirtualMachine
+
+    :param vcenter: The instantiated connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param username: The user who owns the VMs
+    :type username: String
+
+    :param name: The name of the VM to find
+    :type name: String
+    """
+    folder = get_user_folder(vcenter, username)
+    vms = retrieve(vcenter, folder, vim.VirtualMachine, ['name'])
+    return [vm for vm, props in vms if props['name'] == name]
+
+
+def get_jumpboxes(vcenter, name, properties):
+    """Find the VM with a specific name in every user's folder
+
+    Every VM and folder is read in one batched call each, instead of one
+    search per user.
+
+    :Returns: List of (username, vim.VirtualMachine, Dictionary) tuples
+
+    :param vcenter: The instantiated connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param name: The name of the VMs to find
+    :type name: String
+
+    :param properties: The extra property paths to fetch for each VM, like ``['runtime.powerState']``
+    :type properties: List
+    """
+    base_dir = [x for x in const.INF_VCENTER_TOP_LVL_DIR.split('/') if x]
+    folders = retrieve(vcenter, vcenter.content.rootFolder, vim.Folder, ['name', 'parent'], recursive=True)
+    parents = {folder: props for folder, props in folders}
+    vms = retrieve(vcenter, vcenter.content.rootFolder, vim.VirtualMachine, ['name', 'parent'] + properties, recursive=True)
+    found = []
+    for vm, props in vms:
+        if props['name'] != name:
+            continue
+        path = _path_of(props.get('parent'), parents)
+        # Skips the jumpboxes in the warm pool, which aren't in a user's folder yet
+        if len(path) > 1 and path[1:-1] == base_dir:
+            found.append((path[-1], vm, props))
+    return found
+
+
+def _path_of(folder, parents):
+    """Convert a folder into the list of folder names from the datacenter down
+
+    The first name is always the datacenter's root VM folder (i.e. ``vm``).
+
+    :Returns: List
+
+    :param folder: The folder to find the path of
+    :type folder: vim.Folder
+
+    :param parents: A mapping of every folder to its name and parent
+    :type parents: Dictionary
+    """
+    path = []
+    while folder in parents:
+        path.insert(0, parents[folder]['name'])
+        folder = parents[folder]['parent']
+    return path
@@ -0,0 +1,114 @@
+# -*- coding: UTF-8 -*-
+"""
+An index of network names to the networks in vCenter.
+
+``vcenter.networks`` reads the name of every portgroup in the inventory, one
+round trip at a time, on every lookup. With thousands of lab networks that takes
+seconds. The index reads every name with one batched PropertyCollector call, and
+keeps it for ``VLAB_JUMPBOX_NETWORK_INDEX_TTL`` seconds. A name that's missing
+from the index triggers an early refresh, so a network created moments ago is
+still found.
+
+Every refresh also publishes the network names to the shared cache, so the API
+can reject a create for a network that doesn't exist without a round trip to a
+worker.
+
+Network ids are only meaningful to the vCenter they came from, so every vCenter
+jumpboxes are placed on gets its own index.
+"""
+import time
+import threading
+
+from celery.utils.log import get_task_logger
+from vlab_inf_common.vmware import vim
+
+from vlab_jumpbox_api.lib import const, cache
+from vlab_jumpbox_api.lib.worker import inventory
+
+
+logger = get_task_logger(__name__)
+logger.setLevel(const.VLAB_JUMPBOX_LOG_LEVEL.upper())
+
+# Don't let requests for a bad name refresh the index more often than this
+MIN_REFRESH_INTERVAL = 5
+
+
+class NetworkIndex(object):
+    """Maps network names to networks, refreshed every ``ttl`` seconds
+
+    :param ttl: How many seconds the index is trusted for
+    :type ttl: Integer
+
+    :param server: The vCenter the networks are in
+    :type server: String
+    """
+    def __init__(self, ttl, server=const.INF_VCENTER_SERVER):
+        self.ttl = ttl
+        self.server = server
+        self._networks = {}
+        self._refreshed = 0
+        self._lock = threading.Lock()
+
+    def refresh(self, vcenter):
+        """Reread every network name from vCenter
+
+        :Returns: List of the network names
+
+        :param vcenter: The instantiated connection to vCenter
+        :type vcenter: vlab_inf_common.vmware.vCenter
+        """
+        found = inventory.retrieve(vcenter, vcenter.content.rootFolder, vim.Network, ['name'], recursive=True)
+        # Only keep the type & id; the objects are bound to the session that found them
+        networks = {props['name']: (type(obj), obj._moId) for obj, props in found}
+        with self._lock:
+            self._networks = networks
+            self._refreshed = time.time()
+        cache.set_networks(networks.keys(), self.server)
+        logger.debug('Indexed {} networks'.format(len(networks)))
+        return sorted(networks.keys())
+
+    def get(self, vcenter, name):
+        """Look up a network by name
+
+        :Returns: vim.Network
+
+        :Raises: ValueError if there's no such network
+
+        :param vcenter: The instantiated connection to vCenter
+        :type vcenter: vlab_inf_common.vmware.vCenter
+
+        :param name: The name of the network
+        :type name: String
+        """
+        with self._lock:
+            age = time.time() - self._refreshed
+            found = self._networks.get(name)
+        if age > self.ttl or (found is None and age > MIN_REFRESH_INTERVAL):
+            self.refresh(vcenter)
+            with self._lock:
+                found = self._networks.get(name)
+        if found is None:
+            raise ValueError('No such network named {}'.format(name))
+        vimtype, moid = found
+        return vimtype(moid, vcenter.content._stub)
+
+
+def get_index(shard):
+    """Obtain the network index of the vCenter a shard is on
+
+    :Returns: NetworkIndex
+
+    :param shard: Where the jumpbox is placed
+    :type shard: vlab_jumpbox_api.lib.placement.Shard
+    """
+    if shard.server == const.INF_VCENTER_SERVER:
+        return index
+    with _indexes_lock:
+        if shard.server not in _indexes:
+            _indexes[shard.server] = NetworkIndex(ttl=const.VLAB_JUMPBOX_NETWORK_INDEX_TTL, server=shard.server)
+        return _indexes[shard.server]
+
+
+index = NetworkIndex(ttl=const.VLAB_JUMPBOX_NETWORK_INDEX_TTL)
+_indexes = {}
+_indexes_lock = threading.Lock()
@@ -0,0 +1,217 @@
+# -*- coding: UTF-8 -*-
+"""
+Configure a new jumpbox for its user with a single guest-side script.
+
+Every guest operation pays for authentication and process start up, then has
+to be polled until it exits. Instead of one ``run_command`` per setup step,
+all the steps are rendered into one shell script that's uploaded and run once.
+The script records the exit code and timing of each step in a report file,
+which is downloaded afterwards.
+"""
+import time
+
+import requests
+from celery.utils.log import get_task_logger
+from vlab_inf_common.vmware import vim, virtual_machine
+
+from vlab_jumpbox_api.lib import const
+
+
+logger = get_task_logger(__name__)
+logger.setLevel(const.VLAB_JUMPBOX_LOG_LEVEL.upper())
+
+SCRIPT_PATH = '/tmp/vlab-provision.sh'
+REPORT_PATH = '/tmp/vlab-provision.log'
+
+# SHA 512 version of the letter 'a' (plus the $6$ to denote SHA 512)
+PASSWORD_HASH = '$6$qM5mj4O0$x8l6R4T4sH1HJgYt9dw3n2pYO8E0Rs/sqlCfts5/p8o8ZK8aBjfHRlh37xnxIfPZBp.ErfBgnSJcauzP2mxBx.'
+
+# (name, command, error message) - the steps run in order, stopping at the first failure
+STEPS = (
+    # Create an admin user with the same username as the end-user
+    ('useradd',
+     "/usr/sbin/useradd --shell /bin/bash --password '{password}' --create-home --groups sudo --home-dir /home/{username} {username}",
+     'Failed to create user {username} in newly deployed jumpbox'),
+    # Make the Ubuntu GNOME desktop the default used by xRDP
+    # https://www.hiroom2.com/2018/04/29/ubuntu-1804-xrdp-gnome-en/
+    ('xsessionrc',
+     '/bin/cp /etc/xrdp/xsessionrc /home/{username}/.xsessionrc',
+     'Failed to create .xsessionrc file in {username} homedir'),
+)
+
+STEP_TEMPLATE = """
+start=$(date +%s.%N)
+{command}
+rc=$?
+echo "{name} $rc $start $(date +%s.%N)" >> {report}
+[ $rc -eq 0 ] || exit {number}
+"""
+
+
+def render(username, steps=STEPS):
+    """Create the provisioning script for a user
+
+    :Returns: String
+
+    :param username: The user who owns the jumpbox
+    :type username: String
+
+    :param steps: The (name, command, error message) steps to run
+    :type steps: Tuple
+    """
+    script = ['#!/bin/bash', ': > {}'.format(REPORT_PATH)]
+    for number, (name, command, _) in enumerate(steps, 1):
+        command = command.format(username=username, password=PASSWORD_HASH)
+        script.append(STEP_TEMPLATE.format(command=command, name=name, number=number, report=REPORT_PATH))
+    return '\n'.join(script)
+
+
+def run(vcenter, the_vm, username, user, password, steps=STEPS, init_timeout=600):
+    """Upload and execute the provisioning script
+
+    :Returns: Dictionary
+
+    :Raises: RuntimeError if any step fails
+
+    :param vcenter: The instantiated connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param the_vm: The new jumpbox
+    :type the_vm: vim.VirtualMachine
+
+    :param username: The user who owns the jumpbox
+    :type username: String
+
+    :param user: The guest account to run the script as
+    :type user: String
+
+    :param password: The password of the guest account
+    :type password: String
+
+    :param steps: The (name, command, error message) steps to run
+    :type steps: Tuple
+
+    :param init_timeout: How long to wait for VMware Tools to become available
+    :type init_timeout: Integer
+    """
+    creds = vim.vm.guest.NamePasswordAuthentication(username=user, password=password)
+    start = time.time()
+    _upload(vcenter, the_vm, creds, SCRIPT_PATH, render(username, steps).encode(), init_timeout)
+    result = virtual_machine.run_command(vcenter,
+                                         the_vm,
+                                         '/usr/bin/sudo',
+                                         user=user,
+                                         password=password,
+                                         arguments='/bin/bash {}'.format(SCRIPT_PATH))
+    report = {'exit_code': result.exitCode,
+              'seconds': round(time.time() - start, 3),
+              'steps': _parse_report(vcenter, the_vm, creds)}
+    logger.info('Provisioned jumpbox for {}: {}'.format(username, report))
+    if result.exitCode:
+        # The script exits with the number of the step that failed
+        try:
+            _, _, error = steps[result.exitCode - 1]
+        except IndexError:
+            error = 'Failed to provision jumpbox for {username}'
+        raise RuntimeError(error.format(username=username))
+    return report
+
+
+def _upload(vcenter, the_vm, creds, path, data, init_timeout):
+    """Write a file into the guest
+
+    :Returns: None
+
+    :param vcenter: The instantiated connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param the_vm: The VM to upload to
+    :type the_vm: vim.VirtualMachine
+
+    :param creds: The guest account to authenticate with
+    :type creds: vim.vm.guest.NamePasswordAuthentication
+
+    :param path: Where in the guest to write the file
+    :type path: String
+
+    :param data: The contents of the file
+    :type data: Bytes
+
+    :param init_timeout: How long to wait for VMware Tools to become available
+    :type init_timeout: Integer
+    """
+    file_manager = vcenter.content.guestOperationsManager.fileManager
+    attributes = vim.vm.guest.FileManager.FileAttributes()
+    for _ in range(init_timeout):
+        try:
+            url = file_manager.InitiateFileTransferToGuest(vm=the_vm,
+                                                           auth=creds,
+                                                           guestFilePath=path,
+                                                           fileAttributes=attributes,
+                                                           fileSize=len(data),
+                                                           overwrite=True)
+        except vim.fault.GuestOperationsUnavailable:
+            # VMTools not yet available
+            time.sleep(1)
+        else:
+            break
+    else:
+        raise RuntimeError('VMTools not available within {} seconds'.format(init_timeout))
+    resp = requests.put(url, data=data, verify=False)
+    resp.raise_for_status()
+
+
+def _download(vcenter, the_vm, creds, path):
+    """Read a file from the guest
+
+    :Returns: String
+
+    :param vcenter: The instantiated connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param the_vm: The VM to download from
+    :type the_vm: vim.VirtualMachine
+
+    :param creds: The guest account to authenticate with
+    :type creds: vim.vm.guest.NamePasswordAuthentication
+
+    :param path: The file in the guest to read
+    :type path: String
+    """
+    file_manager = vcenter.content.guestOperationsManager.fileManager
+    info = file_manager.InitiateFileTransferFromGuest(vm=the_vm, auth=creds, guestFilePath=path)
+    resp = requests.get(info.url, verify=False)
+    resp.raise_for_status()
+    return resp.text
+
+
+def _parse_report(vcenter, the_vm, creds):
+    """Obtain the exit code and duration of every step the script ran
+
+    :Returns: List
+
+    :param vcenter: The instantiated connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param the_vm: The VM the script ran in
+    :type the_vm: vim.VirtualMachine
+
+    :param creds: The guest account to authenticate with
+    :type creds: vim.vm.guest.NamePasswordAuthentication
+    """
+    try:
+        text = _download(vcenter, the_vm, creds, REPORT_PATH)
+    except Exception as doh:
+        # The report is nice to have; it's not worth failing the create over
+        logger.warning('Unable to read provisioning report: {}'.format(doh))
+        return []
+    steps = []
+    for line in text.splitlines():
+        try:
+            name, exit_code, started, ended = line.split()
+            steps.append({'name': name,
+                          'exit_code': int(exit_code),
+                          'seconds': round(float(ended) - float(started), 3)})
+        except ValueError:
+            continue
+    return steps
@@ -0,0 +1,265 @@
+# -*- coding: UTF-8 -*-
+"""
+Limit how many jumpbox deployments hit the same resources at once.
+
+When a burst of ``jumpbox.create`` tasks arrives, starting every OVA upload at
+the same time saturates the datastore, the ESXi hosts and the images volume,
+and every create gets slower. Before deploying, a worker takes a slot for each
+resource the deploy uses. The slots are kept in the shared cache, so the limits
+apply across every worker process.
+
+A deploy that can't get its slots doesn't wait for them; ``Busy`` is raised,
+and the task retries after ``Busy.countdown`` seconds, so the worker can run
+other tasks in the meantime. Waiting deploys are served in the order they
+first asked. A user can only have a limited number of deploys in flight, and
+only a user's next deploy waits in line for the shared resources, so one
+user's burst can't hold up everyone else. Background work, like refilling the
+warm pool, doesn't get in line at all; it only takes slots nobody is waiting
+for. When the slots can't be read (like when Redis is down) nobody gets one.
+
+Each slot belongs to one deploy and expires ``SLOT_TTL`` seconds after it's
+taken, so a worker that dies in the middle of a deploy can't leak a slot
+forever. A deploy that stops retrying loses its place in line after
+``STALE_SECONDS``.
+"""
+import sys
+import time
+import random
+import threading
+from contextlib import contextmanager
+
+from celery.utils.log import get_task_logger
+
+from vlab_jumpbox_api.lib import const, cache, metrics
+
+
+logger = get_task_logger(__name__)
+logger.setLevel(const.VLAB_JUMPBOX_LOG_LEVEL.upper())
+
+SLOT_TTL = 7200
+# How long a waiting deploy keeps its place in line without retrying
+STALE_SECONDS = 120
+WAITING_KEY = 'jumpbox:deploy:waiting'
+
+
+class Busy(Exception):
+    """Raised when a deploy has to wait for a slot
+
+    :param countdown: About how many seconds to wait before trying again
+    :type countdown: Float
+    """
+    def __init__(self, countdown):
+        super(Busy, self).__init__('Waiting for a deploy slot')
+        self.countdown = countdown
+
+
+class DeployScheduler(object):
+    """Hands out deploy slots, telling callers when to come back if a resource is busy
+
+    :param backend: Where the slots are stored
+    :type backend: vlab_jumpbox_api.lib.cache.MemoryBackend
+
+    :param per_datastore: The most deploys to run against one datastore
+    :type per_datastore: Integer
+
+    :param from_images: The most deploys reading OVAs from the images volume
+    :type from_images: Integer
+
+    :param per_user: The most deploys one user can have in flight
+    :type per_user: Integer
+
+    :param per_host: The most OVA imports to run on one ESXi host
+    :type per_host: Integer
+
+    :param timeout: The longest (in seconds) to wait for a slot
+    :type timeout: Integer
+
+    :param retry_interval: About how often (in seconds) to check for a free slot
+    :type retry_interval: Float
+    """
+    def __init__(self, backend, per_datastore, from_images, per_user, per_host, timeout, retry_interval=5.0):
+        self.backend = backend
+        self.per_datastore = per_datastore
+        self.from_images = from_images
+        self.per_user = per_user
+        self.per_host = per_host
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._stats = {'acquired': 0, 'timeouts': 0, 'wait_seconds': 0.0, 'last_wait_seconds': 0.0}
+
+    @property
+    def stats(self):
+        """How long this process has waited on slots, and the current queue depth
+
+        :Returns: Dictionary
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['waiting'] = self.backend.count_slots(WAITING_KEY)
+        return stats
+
+    @contextmanager
+    def slot(self, username, machine_name, datastore, uses_images=True, queue=True):
+        """Hold a deploy slot for the duration of a ``with`` block
+
+        :Returns: None
+
+        :Raises: Busy if a slot isn't free yet, or RuntimeError if none freed up within the timeout
+
+        :param username: The user the jumpbox is being deployed for
+        :type username: String
+
+        :param machine_name: The name of the VM being deployed
+        :type machine_name: String
+
+        :param datastore: The name of the datastore the jumpbox is deployed to
+        :type datastore: String
+
+        :param uses_images: Set to False if the deploy doesn't read an OVA
+        :type uses_images: Boolean
+
+        :param queue: Set to False for background work that only takes a slot nobody's waiting for
+        :type queue: Boolean
+        """
+        holder = _holder(username, machine_name)
+        user = [('jumpbox:deploy:user:{}'.format(username), self.per_user)]
+        shared = [('jumpbox:deploy:datastore:{}'.format(datastore), self.per_datastore)]
+        if uses_images:
+            shared.append(('jumpbox:deploy:images', self.from_images))
+        with metrics.timed('wait_for_slot'):
+            waited = self._acquire(holder, user, shared, queue)
+        logger.info('Deploy for {} waited {:.1f} seconds for a slot'.format(username, waited))
+        try:
+            yield
+        finally:
+            self.backend.release_slots(holder, [x for x, _ in user + shared])
+
+    @contextmanager
+    def host(self, username, machine_name, hosts):
+        """Pick the least busy ESXi host to import an OVA on, and hold a slot on it for a ``with`` block
+
+        :Returns: The host
+
+        :Raises: Busy if every host is at its limit
+
+        :param username: The user the jumpbox is being deployed for
+        :type username: String
+
+        :param machine_name: The name of the VM being deployed
+        :type machine_name: String
+
+        :param hosts: The hosts that can reach the datastore
+        :type hosts: List of vim.HostSystem
+        """
+        holder = _holder(username, machine_name)
+        # Shuffle first, so equally busy hosts share the work
+        hosts = random.sample(hosts, len(hosts))
+        hosts.sort(key=lambda x: self.backend.count_slots(_host_key(x.name)))
+        for host in hosts:
+            key = _host_key(host.name)
+            if self.backend.take_slots(holder, [(key, self.per_host)], SLOT_TTL, STALE_SECONDS, queue=False):
+                break
+        else:
+            raise Busy(self._countdown())
+        try:
+            yield host
+        finally:
+            self.backend.release_slots(holder, [key])
+
+    def _acquire(self, holder, user, shared, queue=True):
+        """Take the user's slot, then the shared ones, without blocking
+
+        :Returns: Float - How many seconds the deploy spent waiting
+
+        :Raises: Busy, or RuntimeError after waiting longer than the timeout
+
+        :param holder: Who the slots are for
+        :type holder: String
+
+        :param user: The (key, limit) of the user's in flight deploys
+        :type user: List
+
+        :param shared: The (key, limit) pairs of the resources every user shares
+        :type shared: List
+
+        :param queue: Set to False to not wait in line, nor be counted as waiting
+        :type queue: Boolean
+        """
+        now = time.time()
+        if not queue:
+            if not self.backend.take_slots(holder, user + shared, SLOT_TTL, STALE_SECONDS, queue=False):
+                raise Busy(self._countdown())
+            return 0.0
+        since_key = 'jumpbox:deploy:since:{}'.format(holder)
+        self.backend.add(since_key, now, self.timeout + STALE_SECONDS)
+        since = self.backend.get(since_key)
+        since = now if since is None else float(since)
+        # Only the deploy that's next for its user gets in line for the shared
+        # resources, so a user's backlog can't block the line for anyone else
+        acquired = self.backend.take_slots(holder, user, STALE_SECONDS, STALE_SECONDS) and \
+                   self.backend.take_slots(holder, shared, SLOT_TTL, STALE_SECONDS)
+        if not acquired:
+            if now - since > self.timeout:
+                self.backend.release_slots(holder, [x for x, _ in user + shared] + [WAITING_KEY])
+                self.backend.delete(since_key)
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                raise RuntimeError('No deploy slot available within {} seconds'.format(self.timeout))
+            # Counted as waiting until it stops retrying
+            self.backend.take_slots(holder, [(WAITING_KEY, sys.maxsize)], STALE_SECONDS, STALE_SECONDS, queue=False)
+            raise Busy(self._countdown())
+        # Hold the user's slot as long as the shared ones, now the deploy is running
+        self.backend.take_slots(holder, user, SLOT_TTL, STALE_SECONDS)
+        self.backend.release_slots(holder, [WAITING_KEY])
+        self.backend.delete(since_key)
+        waited = now - since
+        with self._lock:
+            self._stats['acquired'] += 1
+            self._stats['wait_seconds'] += waited
+            self._stats['last_wait_seconds'] = waited
+        return waited
+
+    def _countdown(self):
+        """How long to wait before trying again
+
+        :Returns: Float
+        """
+        # Jitter, so waiting deploys don't all retry in lock step
+        return self.retry_interval * random.uniform(0.5, 1.5)
+
+
+def wait(func, *args, **kwargs):
+    """Call a function that deploys, sleeping and calling it again whenever it raises Busy
+
+    For work that already holds a worker for its whole run, like a bulk create;
+    a single create retries its task instead.
+
+    :Returns: Whatever the function returns
+
+    :param func: The function to call
+    :type func: Function
+    """
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except Busy as doh:
+            time.sleep(doh.countdown)
+
+
+def _holder(username, machine_name):
+    """Identify one deploy; it's the same every time the deploy is retried"""
+    return '{}/{}'.format(username, machine_name)
+
+
+def _host_key(name):
+    """Namespace the deploys on an ESXi host"""
+    return 'jumpbox:deploy:host:{}'.format(name)
+
+
+scheduler = DeployScheduler(backend=cache.backend,
+                            per_datastore=const.VLAB_JUMPBOX_DEPLOYS_PER_DATASTORE,
+                            from_images=const.VLAB_JUMPBOX_DEPLOYS_FROM_IMAGES,
+                            per_user=const.VLAB_JUMPBOX_DEPLOYS_PER_USER,
+                            per_host=const.VLAB_JUMPBOX_DEPLOYS_PER_HOST,
+                            timeout=const.VLAB_JUMPBOX_DEPLOY_QUEUE_TIMEOUT)
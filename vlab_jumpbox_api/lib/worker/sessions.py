@@ -0,0 +1,229 @@
+# -*- coding: UTF-8 -*-
+"""
+Reuse authenticated vCenter sessions across tasks within a worker process.
+
+Logging into vCenter is expensive, and every session counts against the
+server-side session limit. Instead of a login/logout per task, each worker
+process keeps a small pool of idle ``vCenter`` objects and hands them out to
+tasks. A session is health checked before it's reused, and transparently
+replaced if vCenter has expired it.
+
+Every vCenter a jumpbox can be placed on gets its own pool.
+"""
+import time
+import threading
+from contextlib import contextmanager
+
+from celery.utils.log import get_task_logger
+from vlab_inf_common.vmware import vCenter
+
+from vlab_jumpbox_api.lib import const
+
+
+logger = get_task_logger(__name__)
+logger.setLevel(const.VLAB_JUMPBOX_LOG_LEVEL.upper())
+
+
+class SessionPool(object):
+    """A bounded pool of logged in vCenter sessions
+
+    :param host: The IP/FQDN of the vCenter server
+    :type host: String
+
+    :param user: The account to authenticate with
+    :type user: String
+
+    :param password: The password of the account
+    :type password: String
+
+    :param port: The TCP port the vCenter server listens on
+    :type port: Integer
+
+    :param max_size: The most sessions the pool will ever have open at once
+    :type max_size: Integer
+
+    :param max_idle: Sessions unused for longer than this (in seconds) are closed
+                     instead of being reused
+    :type max_idle: Integer
+
+    :param check_interval: Only health check a session if it's been idle for
+                           more than this many seconds
+    :type check_interval: Integer
+    """
+    def __init__(self, host, user, password, port=443, max_size=4, max_idle=900, check_interval=30):
+        self.host = host
+        self.user = user
+        self._password = password
+        self.port = port
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.check_interval = check_interval
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._stats = {'hits': 0, 'misses': 0, 'reconnects': 0}
+
+    @property
+    def stats(self):
+        """Counters for how often the pool avoided a login
+
+        :Returns: Dictionary
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = len(self._idle)
+        stats['max_size'] = self.max_size
+        return stats
+
+    @contextmanager
+    def session(self, timeout=600):
+        """Borrow a logged in vCenter session for the duration of a ``with`` block
+
+        :Returns: vlab_inf_common.vmware.vCenter
+
+        :Raises: RuntimeError if no session frees up within the timeout
+
+        :param timeout: How long to wait (in seconds) for a session when the
+                        pool is exhausted
+        :type timeout: Integer
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise RuntimeError('No vCenter session available within {} seconds'.format(timeout))
+        try:
+            vcenter = self._checkout()
+            try:
+                yield vcenter
+            except Exception:
+                # The error might be the session itself; make the next user verify it
+                self._checkin(vcenter, verified=False)
+                raise
+            else:
+                self._checkin(vcenter)
+        finally:
+            self._slots.release()
+
+    def clear(self):
+        """Logout of every idle session in the pool
+
+        :Returns: None
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for vcenter, _, _ in idle:
+            self._close(vcenter)
+
+    def _checkout(self):
+        """Obtain a healthy session, preferring the most recently used one
+
+        :Returns: vlab_inf_common.vmware.vCenter
+        """
+        now = time.time()
+        while True:
+            with self._lock:
+                if not self._idle:
+                    self._stats['misses'] += 1
+                    break
+                vcenter, last_used, verified = self._idle.pop()
+            idle_for = now - last_used
+            if idle_for > self.max_idle:
+                self._close(vcenter)
+                continue
+            if verified and idle_for < self.check_interval:
+                with self._lock:
+                    self._stats['hits'] += 1
+                return vcenter
+            if _is_alive(vcenter):
+                with self._lock:
+                    self._stats['hits'] += 1
+                return vcenter
+            logger.info('vCenter session expired, reconnecting')
+            with self._lock:
+                self._stats['reconnects'] += 1
+            self._close(vcenter)
+        return vCenter(host=self.host, user=self.user, password=self._password, port=self.port)
+
+    def _checkin(self, vcenter, verified=True):
+        """Return a session to the pool
+
+        :Returns: None
+
+        :param vcenter: The session being returned
+        :type vcenter: vlab_inf_common.vmware.vCenter
+
+        :param verified: Set to False if the session might no longer be usable
+        :type verified: Boolean
+        """
+        with self._lock:
+            self._idle.append((vcenter, time.time(), verified))
+
+    @staticmethod
+    def _close(vcenter):
+        """Logout of a session, ignoring errors from ones vCenter already dropped
+
+        :Returns: None
+        """
+        try:
+            vcenter.close()
+        except Exception as doh:
+            logger.debug('Ignoring error while closing vCenter session: {}'.format(doh))
+
+
+def _is_alive(vcenter):
+    """Determine if vCenter still considers a session to be logged in
+
+    :Returns: Boolean
+
+    :param vcenter: The session to check
+    :type vcenter: vlab_inf_common.vmware.vCenter
+    """
+    try:
+        return vcenter.content.sessionManager.currentSession is not None
+    except Exception:
+        return False
+
+
+def _new_pool(host, port):
+    """Make a pool of sessions to a vCenter server
+
+    :Returns: SessionPool
+    """
+    return SessionPool(host=host,
+                       user=const.INF_VCENTER_USER,
+                       password=const.INF_VCENTER_PASSWORD,
+                       port=port,
+                       max_size=const.VLAB_JUMPBOX_SESSION_POOL_SIZE,
+                       max_idle=const.VLAB_JUMPBOX_SESSION_MAX_IDLE,
+                       check_interval=const.VLAB_JUMPBOX_SESSION_CHECK_INTERVAL)
+
+
+def get_pool(shard):
+    """Obtain the pool of sessions to the vCenter a shard is on
+
+    :Returns: SessionPool
+
+    :param shard: Where the jumpbox is placed
+    :type shard: vlab_jumpbox_api.lib.placement.Shard
+    """
+    if (shard.server, shard.port) == (const.INF_VCENTER_SERVER, const.INF_VCENTER_PORT):
+        return pool
+    with _pools_lock:
+        if (shard.server, shard.port) not in _pools:
+            _pools[(shard.server, shard.port)] = _new_pool(shard.server, shard.port)
+        return _pools[(shard.server, shard.port)]
+
+
+def clear():
+    """Logout of every idle session, to every vCenter
+
+    :Returns: None
+    """
+    pool.clear()
+    with _pools_lock:
+        others = list(_pools.values())
+    for other in others:
+        other.clear()
+
+
+pool = _new_pool(const.INF_VCENTER_SERVER, const.INF_VCENTER_PORT)
+_pools = {}
+_pools_lock = threading.Lock()
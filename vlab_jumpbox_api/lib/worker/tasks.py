@@ -3,16 +3,41 @@
 Entry point logic for available backend worker tasks
 """
 from celery import Celery
+from celery.signals import worker_init, worker_process_shutdown, task_postrun
 from celery.utils.log import get_task_logger
 
-from vlab_jumpbox_api.lib import const
-from vlab_jumpbox_api.lib.worker import vmware
+from vlab_jumpbox_api.lib import const, cache, metrics, celery_config, placement, readiness
+from vlab_jumpbox_api.lib.worker import vmware, sessions, aio, warm_pool, scheduler, images
 
 
-app = Celery('jumpbox', backend='rpc://', broker=const.VLAB_MESSAGE_BROKER)
+app = Celery('jumpbox')
+app.config_from_object(celery_config)
 logger = get_task_logger(__name__)
 logger.setLevel(const.VLAB_JUMPBOX_LOG_LEVEL.upper())
 
+app.conf.beat_schedule = {
+    # Keep the network names the API validates against from going stale
+    'refresh-network-index': {
+        'task': 'jumpbox.networks.refresh',
+        'schedule': max(const.VLAB_JUMPBOX_NETWORK_INDEX_TTL // 2, 1),
+    },
+}
+# What the API's readiness checks report for vCenter
+app.conf.beat_schedule['check-vcenters'] = {
+    'task': 'jumpbox.vcenter.check',
+    'schedule': const.VLAB_JUMPBOX_READINESS_INTERVAL,
+}
+# Always scheduled; whether there's a pool is up to the workers' settings, not beat's
+app.conf.beat_schedule['refill-warm-pool'] = {
+    'task': 'jumpbox.warm_pool.refill',
+    'schedule': const.VLAB_JUMPBOX_WARM_POOL_INTERVAL,
+}
+if const.VLAB_JUMPBOX_IDLE_INTERVAL:
+    app.conf.beat_schedule['suspend-idle-jumpboxes'] = {
+        'task': 'jumpbox.idle.suspend',
+        'schedule': const.VLAB_JUMPBOX_IDLE_INTERVAL,
+    }
+
 
 @app.task(name='jumpbox.show')
 def show(username):
@@ -26,20 +51,30 @@ def show(username):
     resp = {'content' : {}, 'error': None, 'params': {}}
     logger.info('Task starting')
     try:
-        info = vmware.show_jumpbox(username)
+        if const.VLAB_JUMPBOX_ASYNC:
+            info = aio.run(aio.show_jumpbox, username, shard=placement.ring.lookup(username, search=vmware.has_jumpbox))
+        else:
+            info = vmware.show_jumpbox(username)
     except ValueError as doh:
         logger.error('Task failed: {}'.format(doh))
         resp['error'] = '{}'.format(doh)
     else:
         logger.info('Task complete')
         resp['content'] = info
+        cache.set_show(username, info)
+    finally:
+        cache.release_task(username, 'show')
     return resp
 
 
-@app.task(name='jumpbox.create')
-def create(username, network):
+@app.task(name='jumpbox.create', bind=True)
+def create(self, username, network):
     """Deploy a new jumpbox
 
+    The stage the create is in, and an estimate of how far along it is, are
+    published as task progress. When the deploy has to wait for a slot, the
+    task is retried later instead of holding this worker.
+
     :Returns: Dictionary
 
     :param username: The name of the user who wants to create a new default gateway
@@ -50,32 +85,387 @@ def create(username, network):
     """
     resp = {'content' : {}, 'error': None, 'params': {}}
     logger.info('Task starting')
+    cache.invalidate_show(username)
+    retrying = False
     try:
-        resp['content'] = vmware.create_jumpbox(username, network)
+        with cache.user_lock(username):
+            resp['content'] = vmware.create_jumpbox(username, network, progress=_create_progress(self))
+    except scheduler.Busy as doh:
+        logger.info('Deploy slots are busy, retrying in {:.1f} seconds'.format(doh.countdown))
+        # The same task keeps the request in flight, so duplicates still coalesce into it
+        retrying = True
+        raise self.retry(countdown=doh.countdown, max_retries=None)
     except ValueError as doh:
         logger.error('Task Failed: {}'.format(doh))
         resp['error'] = '{}'.format(doh)
+    finally:
+        cache.invalidate_show(username)
+        if not retrying:
+            cache.release_task(username, 'create')
     logger.info('Task complete')
     return resp
 
 
+def _create_progress(task):
+    """Make a callback that publishes the stage a create is in
+
+    :Returns: Function
+
+    :param task: The create task being run
+    :type task: celery.Task
+    """
+    def callback(stage, percent, **details):
+        logger.info('Create is {}% done: {}'.format(percent, stage))
+        if task.request.id:
+            content = dict(details, stage=stage, percent=percent)
+            task.update_state(state='PROGRESS', meta={'content': content, 'error': None, 'params': {}})
+    return callback
+
+
 @app.task(name='jumpbox.delete')
 def delete(username):
     """Destory the user's jumpbox
 
+    When the destroy is confirmed in the background, the user's lock and the
+    in flight delete are held until ``confirm_delete`` is done, so nothing else
+    can change the jumpbox while vCenter is still destroying it.
+
     :Returns: Dictionary
 
     :param username: The name of the user who wants to create a new default gateway
     :type username: String
     """
     resp = {'content' : {}, 'error': None, 'params': {}}
+    cache.invalidate_show(username)
+    token = None
+    handed_off = False
     try:
         logger.info('Task starting')
-        info = vmware.delete_jumpbox(username)
+        token = cache.acquire_user_lock(username)
+        info, pending = _delete(username)
+        if pending:
+            confirm_delete.delay(username, pending, token)
+            handed_off = True
     except ValueError as doh:
         logger.error('Task failed: {}'.format(doh))
         resp['error'] = '{}'.format(doh)
     else:
         logger.info('Task complete')
         resp['content'] = info
+    finally:
+        cache.invalidate_show(username)
+        if not handed_off:
+            if token is not None:
+                cache.release_user_lock(username, token)
+            cache.release_task(username, 'delete')
     return resp
+
+
+def _delete(username):
+    """Destroy the user's jumpbox the way the worker is configured to
+
+    :Returns: Tuple - whatever the delete function returns, and the ids of the
+              destroy tasks still running in vCenter (or None)
+
+    :param username: The name of the user whose jumpbox is destroyed
+    :type username: String
+    """
+    if const.VLAB_JUMPBOX_ASYNC:
+        return aio.run(aio.delete_jumpbox, username, shard=placement.ring.lookup(username, search=vmware.has_jumpbox)), None
+    elif const.VLAB_JUMPBOX_DELETE_WAIT:
+        return vmware.delete_jumpbox(username), None
+    # Free up this worker as soon as vCenter accepts the destroy
+    return {}, vmware.delete_jumpbox(username, wait=False)
+
+
+@app.task(name='jumpbox.delete.confirm')
+def confirm_delete(username, task_ids, lock_token=None):
+    """Wait in the background for a user's jumpbox to finish being destroyed
+
+    :Returns: Dictionary
+
+    :param username: The name of the user whose jumpbox is being destroyed
+    :type username: String
+
+    :param task_ids: The ids of the vSphere destroy tasks
+    :type task_ids: List
+
+    :param lock_token: The user's lock, which ``delete`` handed over to be released here
+    :type lock_token: String
+    """
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    logger.info('Task starting')
+    try:
+        vmware.confirm_delete(username, task_ids)
+    except RuntimeError as doh:
+        logger.error('Failed to destroy jumpbox of {}: {}'.format(username, doh))
+        resp['error'] = '{}'.format(doh)
+    else:
+        logger.info('Task complete')
+    finally:
+        cache.invalidate_show(username)
+        if lock_token is not None:
+            cache.release_user_lock(username, lock_token)
+        cache.release_task(username, 'delete')
+    return resp
+
+
+@app.task(name='jumpbox.reset')
+def reset(username):
+    """Revert the user's jumpbox to how it was right after it was created
+
+    :Returns: Dictionary
+
+    :param username: The name of the user who wants a clean jumpbox
+    :type username: String
+    """
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    logger.info('Task starting')
+    cache.invalidate_show(username)
+    try:
+        with cache.user_lock(username):
+            resp['content'] = vmware.reset_jumpbox(username)
+    except ValueError as doh:
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = '{}'.format(doh)
+    else:
+        logger.info('Task complete')
+    finally:
+        cache.invalidate_show(username)
+        cache.release_task(username, 'reset')
+    return resp
+
+
+@app.task(name='jumpbox.resume')
+def resume(username):
+    """Wake up the user's jumpbox if it was suspended for being idle
+
+    :Returns: Dictionary
+
+    :param username: The name of the user who wants to connect to their jumpbox
+    :type username: String
+    """
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    logger.info('Task starting')
+    try:
+        with cache.user_lock(username):
+            resp['content'] = vmware.resume_jumpbox(username)
+    except ValueError as doh:
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = '{}'.format(doh)
+    else:
+        logger.info('Task complete')
+    finally:
+        # Connecting counts as using the jumpbox
+        cache.clear_idle(username)
+        cache.invalidate_show(username)
+        cache.release_task(username, 'resume')
+    return resp
+
+
+@app.task(name='jumpbox.idle.suspend')
+def suspend_idle():
+    """Suspend the jumpboxes nobody is using, to free up the cluster for active labs
+
+    :Returns: Dictionary
+    """
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    lock = 'jumpbox:idle:suspend'
+    # A slow sweep shouldn't overlap with the next scheduled one
+    if not cache.backend.add(lock, 'locked', const.VLAB_JUMPBOX_IDLE_INTERVAL * 10 or 3600):
+        logger.info('Idle sweep already running')
+        return resp
+    logger.info('Task starting')
+    try:
+        suspended = vmware.suspend_idle()
+    except ValueError as doh:
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = '{}'.format(doh)
+    else:
+        logger.info('Task complete')
+        for username in suspended:
+            cache.invalidate_show(username)
+        resp['content'] = {'suspended': suspended}
+    finally:
+        cache.backend.delete(lock)
+    return resp
+
+
+@app.task(name='jumpbox.bulk_create', bind=True)
+def bulk_create(self, jumpboxes):
+    """Deploy jumpboxes for many users, like a whole class
+
+    Per-user results are published as task progress while the other
+    jumpboxes are still being created.
+
+    :Returns: Dictionary
+
+    :param jumpboxes: The ``username`` and ``network`` of every jumpbox to create
+    :type jumpboxes: List of Dictionaries
+    """
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    logger.info('Task starting')
+    for jumpbox in jumpboxes:
+        cache.invalidate_show(jumpbox['username'])
+    resp['content'] = vmware.bulk_create(jumpboxes, callback=_bulk_progress(self, resp['content']))
+    logger.info('Task complete')
+    return resp
+
+
+@app.task(name='jumpbox.bulk_delete', bind=True)
+def bulk_delete(self, usernames):
+    """Destroy the jumpboxes of many users
+
+    :Returns: Dictionary
+
+    :param usernames: The users whose jumpboxes should be destroyed
+    :type usernames: List
+    """
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    logger.info('Task starting')
+    for username in usernames:
+        cache.invalidate_show(username)
+    callback = _bulk_progress(self, resp['content'])
+    if const.VLAB_JUMPBOX_ASYNC:
+        # One event loop per vCenter, each multiplexed over one session
+        for shard, group in placement.ring.group(usernames, search=vmware.has_jumpbox):
+            resp['content'].update(aio.run(aio.bulk_delete, group, callback=callback, shard=shard))
+    else:
+        resp['content'] = vmware.bulk_delete(usernames, callback=callback)
+    logger.info('Task complete')
+    return resp
+
+
+def _bulk_progress(task, results):
+    """Make a callback that publishes each user's result as soon as it's done
+
+    :Returns: Function
+
+    :param task: The bulk task being run
+    :type task: celery.Task
+
+    :param results: Where to accumulate the per-user results
+    :type results: Dictionary
+    """
+    def callback(username, result):
+        cache.invalidate_show(username)
+        results[username] = result
+        task.update_state(state='PROGRESS', meta={'content': results, 'error': None, 'params': {}})
+    return callback
+
+
+@app.task(name='jumpbox.warm_pool.refill')
+def refill_warm_pool():
+    """Deploy new jumpboxes into the warm pool
+
+    :Returns: Dictionary
+    """
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    if not any(warm_pool.enabled(x) for x in warm_pool.NETWORKS):
+        logger.debug('Warm pool is disabled')
+        return resp
+    lock = 'jumpbox:warm_pool:refill'
+    # A slow refill shouldn't overlap with the next scheduled one
+    if not cache.backend.add(lock, 'locked', const.VLAB_JUMPBOX_WARM_POOL_INTERVAL * 10):
+        logger.info('Warm pool refill already running')
+        return resp
+    logger.info('Task starting')
+    try:
+        resp['content'] = vmware.refill_warm_pool()
+    except ValueError as doh:
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = '{}'.format(doh)
+    else:
+        logger.info('Task complete')
+    finally:
+        cache.backend.delete(lock)
+    return resp
+
+
+@app.task(name='jumpbox.networks.refresh')
+def refresh_networks():
+    """Reindex the networks in vCenter, and publish their names for the API
+
+    :Returns: Dictionary
+    """
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    logger.info('Task starting')
+    resp['content'] = {'networks': vmware.refresh_networks()}
+    logger.info('Task complete')
+    return resp
+
+
+@app.task(name='jumpbox.vcenter.check')
+def check_vcenters():
+    """Login to every vCenter, and publish how it went for the API's readiness checks
+
+    :Returns: Dictionary
+    """
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    logger.info('Task starting')
+    resp['content'] = vmware.check_vcenters()
+    # Outlives a couple missed checks, but not a dead beat scheduler
+    ttl = int(const.VLAB_JUMPBOX_READINESS_INTERVAL * readiness.STALE_ROUNDS) or 1
+    for server, status in resp['content'].items():
+        cache.set_vcenter_status(server, status, ttl)
+    logger.info('Task complete')
+    return resp
+
+
+@app.task(name='jumpbox.template.import', bind=True)
+def import_template(self, network, image_name=vmware.DEFAULT_IMAGE):
+    """Import an image once so jumpboxes can be deployed as linked clones
+
+    :Returns: Dictionary
+
+    :param network: The name of any network the template can connect to
+    :type network: String
+
+    :param image_name: The name of the OVA file to import
+    :type image_name: String
+    """
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    logger.info('Task starting')
+    try:
+        resp['content'] = vmware.import_template(network, image_name)
+    except scheduler.Busy as doh:
+        raise self.retry(countdown=doh.countdown, max_retries=None)
+    except ValueError as doh:
+        logger.error('Task failed: {}'.format(doh))
+        resp['error'] = '{}'.format(doh)
+    else:
+        logger.info('Task complete')
+    return resp
+
+
+@worker_init.connect
+def start_metrics_exporter(**kwargs):
+    """Serve the worker's Prometheus metrics on ``VLAB_JUMPBOX_METRICS_PORT``"""
+    logger.info('Starting metrics exporter on port {}'.format(const.VLAB_JUMPBOX_METRICS_PORT))
+    metrics.start_exporter(const.VLAB_JUMPBOX_METRICS_PORT)
+
+
+@worker_init.connect
+def index_images(**kwargs):
+    """Parse every OVA once, before the worker forks, so child processes share the index"""
+    try:
+        logger.info('Indexed images: {}'.format(images.catalog.index()))
+    except OSError as doh:
+        logger.error('Unable to index images: {}'.format(doh))
+
+
+@task_postrun.connect
+def record_stats(**kwargs):
+    """Publish the session pool, warm pool and deploy scheduler counters after every task"""
+    for shard in placement.ring.servers():
+        metrics.record_stats('session_pool', sessions.get_pool(shard).stats, shard.name)
+    metrics.record_stats('warm_pool', warm_pool.stats())
+    metrics.record_stats('deploy_scheduler', scheduler.scheduler.stats)
+    metrics.record_stats('placement', placement.ring.stats)
+
+
+@worker_process_shutdown.connect
+def close_sessions(**kwargs):
+    """Logout of any pooled vCenter sessions when a worker process exits"""
+    logger.info('vCenter session pool stats: {}'.format(sessions.pool.stats))
+    sessions.clear()
@@ -0,0 +1,146 @@
+# -*- coding: UTF-8 -*-
+"""
+Deploy jumpboxes as linked clones of a template, instead of importing the OVA.
+
+Each image is imported once into ``VLAB_JUMPBOX_TEMPLATE_FOLDER`` and has a
+snapshot taken. A linked clone of that snapshot only creates a small delta disk,
+so no disk image is streamed to the datastore when a user creates a jumpbox.
+"""
+import os.path
+
+from celery.utils.log import get_task_logger
+from vlab_inf_common.vmware import vim, consume_task
+
+from vlab_jumpbox_api.lib import const
+from vlab_jumpbox_api.lib.worker import inventory
+
+
+logger = get_task_logger(__name__)
+logger.setLevel(const.VLAB_JUMPBOX_LOG_LEVEL.upper())
+
+SNAPSHOT_NAME = 'base'
+
+
+def enabled():
+    """Determine if jumpboxes should be deployed as linked clones
+
+    :Returns: Boolean
+    """
+    return const.VLAB_JUMPBOX_DEPLOY_MODE == 'linked_clone'
+
+
+def template_name(image_name):
+    """Convert the name of an OVA file into the name of its template VM
+
+    :Returns: String
+
+    :param image_name: The name of the OVA file
+    :type image_name: String
+    """
+    return os.path.splitext(image_name)[0]
+
+
+def find(vcenter, image_name):
+    """Locate the template for an image, and the snapshot to clone from
+
+    :Returns: Tuple of (vim.VirtualMachine, vim.vm.Snapshot), or (None, None)
+
+    :param vcenter: The instantiated connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param image_name: The name of the OVA file the template was made from
+    :type image_name: String
+    """
+    try:
+        folder = inventory.get_user_folder(vcenter, const.VLAB_JUMPBOX_TEMPLATE_FOLDER)
+    except ValueError:
+        return None, None
+    name = template_name(image_name)
+    for the_vm, props in inventory.retrieve(vcenter, folder, vim.VirtualMachine, ['name', 'snapshot.currentSnapshot']):
+        if props['name'] == name and props.get('snapshot.currentSnapshot'):
+            return the_vm, props['snapshot.currentSnapshot']
+    return None, None
+
+
+def snapshot(the_vm):
+    """Take the snapshot that linked clones are made from
+
+    :Returns: None
+
+    :param the_vm: The newly imported template
+    :type the_vm: vim.VirtualMachine
+    """
+    task = the_vm.CreateSnapshot_Task(name=SNAPSHOT_NAME,
+                                      description='Linked clones of the jumpbox are made from this snapshot',
+                                      memory=False,
+                                      quiesce=False)
+    consume_task(task)
+
+
+def clone(template, base_snapshot, folder, machine_name, network, resource_pool=None, datastore=None):
+    """Create a new VM that's a linked clone of a template
+
+    :Returns: vim.VirtualMachine
+
+    :param template: The VM to clone
+    :type template: vim.VirtualMachine
+
+    :param base_snapshot: The snapshot of the template that the clone is based on
+    :type base_snapshot: vim.vm.Snapshot
+
+    :param folder: Where to put the new VM
+    :type folder: vim.Folder
+
+    :param machine_name: What to name the new VM
+    :type machine_name: String
+
+    :param network: The network to connect the new VM to
+    :type network: vim.Network
+
+    :param resource_pool: Where the new VM runs. Defaults to the template's resource pool
+    :type resource_pool: vim.ResourcePool
+
+    :param datastore: Where the new VM's delta disk goes. Defaults to the template's datastore
+    :type datastore: vim.Datastore
+    """
+    relocate = vim.vm.RelocateSpec(diskMoveType='createNewChildDiskBacking',
+                                   pool=resource_pool,
+                                   datastore=datastore)
+    config = vim.vm.ConfigSpec(deviceChange=[_nic_change(template, network)])
+    spec = vim.vm.CloneSpec(location=relocate,
+                            snapshot=base_snapshot,
+                            config=config,
+                            powerOn=True,
+                            template=False)
+    logger.debug('Linked cloning {} into {}'.format(machine_name, folder))
+    task = template.CloneVM_Task(folder=folder, name=machine_name, spec=spec)
+    return consume_task(task)
+
+
+def _nic_change(template, network):
+    """Build the spec that connects the clone's NIC to the user's network
+
+    :Returns: vim.vm.device.VirtualDeviceSpec
+
+    :param template: The VM being cloned
+    :type template: vim.VirtualMachine
+
+    :param network: The network to connect the NIC to
+    :type network: vim.Network
+    """
+    for device in template.config.hardware.device:
+        if isinstance(device, vim.vm.device.VirtualEthernetCard):
+            nic = device
+            break
+    else:
+        raise RuntimeError('Template {} has no network adapter'.format(template.name))
+    if isinstance(network, vim.dvs.DistributedVirtualPortgroup):
+        port = vim.dvs.PortConnection(portgroupKey=network.key,
+                                      switchUuid=network.config.distributedVirtualSwitch.uuid)
+        nic.backing = vim.vm.device.VirtualEthernetCard.DistributedVirtualPortBackingInfo(port=port)
+    else:
+        nic.backing = vim.vm.device.VirtualEthernetCard.NetworkBackingInfo(network=network,
+                                                                           deviceName=network.name)
+    nic.connectable = vim.vm.device.VirtualDevice.ConnectInfo(startConnected=True, connected=True)
+    return vim.vm.device.VirtualDeviceSpec(operation=vim.vm.device.VirtualDeviceSpec.Operation.edit,
+                                           device=nic)
@@ -0,0 +1,182 @@
+# -*- coding: UTF-8 -*-
+"""
+Upload the disks of an OVA to the URLs of an import lease.
+
+``Ova.deploy`` POSTs one disk at a time through ``urlopen``, which reads the
+whole disk through a single connection, in whatever size chunks ``http.client``
+picks. The uploader sends every disk of a deploy at the same time, each over
+its own connection, and streams each one in fixed size chunks:
+
+- Readers that have ``readinto`` (like the members of a tarfile) are read into
+  one reused buffer per connection, so memory stays at ``chunk_size`` per disk.
+- Other readers (like the memory mapped disks in ``images``) hand out views of
+  the data, which are sent without copying.
+
+A stream-optimized VMDK has to be sent in order, so one disk is never split
+into ranges across connections.
+"""
+import time
+import threading
+import http.client
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+from celery.utils.log import get_task_logger
+
+from vlab_jumpbox_api.lib import const
+
+
+logger = get_task_logger(__name__)
+logger.setLevel(const.VLAB_JUMPBOX_LOG_LEVEL.upper())
+
+CONTENT_TYPE = 'application/x-vnd.vmware-streamVmdk'
+
+
+class DiskUploader(object):
+    """Uploads disks concurrently, in bounded memory
+
+    :param connections: The most disks to upload at the same time
+    :type connections: Integer
+
+    :param chunk_size: How many bytes to send at a time
+    :type chunk_size: Integer
+
+    :param timeout: How many seconds a connection can be idle before giving up
+    :type timeout: Integer
+
+    :param context: The TLS settings for HTTPS URLs
+    :type context: ssl.SSLContext
+    """
+    def __init__(self, connections=4, chunk_size=1048576, timeout=300, context=None):
+        self.connections = connections
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.context = context
+        self._lock = threading.Lock()
+        self._sent = 0
+        self._total = 0
+        self._started = None
+
+    @property
+    def stats(self):
+        """How many bytes have been sent, and how fast
+
+        :Returns: Dictionary
+        """
+        with self._lock:
+            sent, total, started = self._sent, self._total, self._started
+        elapsed = time.time() - started if started else 0
+        return {'sent': sent,
+                'total': total,
+                'percent': min(int(100.0 * sent / total), 100) if total else 0,
+                'bytes_per_second': sent / elapsed if elapsed else 0.0}
+
+    def upload(self, disks, host=None, callback=None):
+        """Send every disk to its URL, and wait for them all to finish
+
+        :Returns: None
+
+        :Raises: RuntimeError if any upload fails
+
+        :param disks: The (url, reader, size) of every disk to upload
+        :type disks: List of Tuples
+
+        :param host: Replaces a ``*`` in the URLs, which ESXi uses to mean "whatever host you connected to"
+        :type host: String
+
+        :param callback: Called with the ``stats`` after every chunk is sent
+        :type callback: Function
+        """
+        with self._lock:
+            self._sent = 0
+            self._total = sum(x[2] for x in disks)
+            self._started = time.time()
+        workers = max(1, min(self.connections, len(disks)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self._upload_disk, url.replace('*', host) if host else url, reader, size, callback)
+                       for url, reader, size in disks]
+            errors = [x.exception() for x in futures if x.exception()]
+        if errors:
+            raise RuntimeError('Failed to upload disk: {}'.format(errors[0]))
+        stats = self.stats
+        logger.info('Uploaded {} bytes at {:.1f} MB/s'.format(stats['sent'], stats['bytes_per_second'] / 1048576))
+
+    def _upload_disk(self, url, reader, size, callback):
+        """POST one disk, a chunk at a time
+
+        :Returns: None
+
+        :Raises: RuntimeError if the server rejects the upload
+
+        :param url: Where to upload the disk
+        :type url: String
+
+        :param reader: The disk's data
+        :type reader: File-like object
+
+        :param size: How many bytes the disk is
+        :type size: Integer
+
+        :param callback: Called with the ``stats`` after every chunk is sent
+        :type callback: Function
+        """
+        parts = urlsplit(url)
+        if parts.scheme == 'https':
+            conn = http.client.HTTPSConnection(parts.hostname, parts.port, timeout=self.timeout, context=self.context)
+        else:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=self.timeout)
+        try:
+            path = parts.path + ('?' + parts.query if parts.query else '')
+            conn.putrequest('POST', path)
+            conn.putheader('Content-Length', str(size))
+            conn.putheader('Content-Type', CONTENT_TYPE)
+            conn.endheaders()
+            for chunk in _chunks(reader, size, self.chunk_size):
+                conn.send(chunk)
+                with self._lock:
+                    self._sent += len(chunk)
+                if callback:
+                    callback(self.stats)
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status >= 300:
+                raise RuntimeError('Upload to {} failed: {} {}'.format(url, resp.status, resp.reason))
+        finally:
+            conn.close()
+
+
+def _chunks(reader, size, chunk_size):
+    """Read a disk a chunk at a time, reusing one buffer when the reader allows it
+
+    The chunk is only valid until the next one is read.
+
+    :Returns: Generator of bytes-like objects
+
+    :param reader: The disk's data
+    :type reader: File-like object
+
+    :param size: How many bytes to read
+    :type size: Integer
+
+    :param chunk_size: The most bytes in any one chunk
+    :type chunk_size: Integer
+    """
+    remaining = size
+    if hasattr(reader, 'readinto'):
+        buf = bytearray(chunk_size)
+        view = memoryview(buf)
+        while remaining > 0:
+            count = reader.readinto(view[:min(chunk_size, remaining)])
+            if not count:
+                break
+            remaining -= count
+            yield view[:count]
+    else:
+        while remaining > 0:
+            chunk = reader.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    if remaining:
+        raise RuntimeError('Disk ended {} bytes early'.format(remaining))
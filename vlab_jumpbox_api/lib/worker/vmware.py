@@ -1,17 +1,30 @@
 # -*- coding: UTF-8 -*-
 """Business logic for backend worker tasks"""
 import time
-import os.path
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from celery.utils.log import get_task_logger
-from vlab_inf_common.vmware import vCenter, Ova, vim, virtual_machine, consume_task
+from vlab_inf_common.vmware import vim, virtual_machine, consume_task
 
-from vlab_jumpbox_api.lib import const
+from vlab_jumpbox_api.lib import const, metrics, placement, cache
+from vlab_jumpbox_api.lib.worker import sessions, inventory, warm_pool, templates, provision, scheduler, images, networks
 
 
 logger = get_task_logger(__name__)
 logger.setLevel(const.VLAB_JUMPBOX_LOG_LEVEL.upper())
 
 COMPONENT_NAME = 'jumpBox'
+DEFAULT_IMAGE = 'jumpBox-Ubuntu18.04.ova'
+# How often (in seconds) to report how far along uploading the OVA is
+DEPLOY_PROGRESS_INTERVAL = 5
+# Uploading the OVA is most of the work; it's reported as 0-70% of a create
+DEPLOY_SHARE = 70
+# The snapshot of a freshly provisioned jumpbox, that a reset reverts to
+RESET_SNAPSHOT = 'clean'
+# What's read about every jumpbox to decide if it's idle
+IDLE_PROPERTIES = ['runtime.powerState', 'summary.quickStats.overallCpuUsage',
+                   'summary.quickStats.guestMemoryUsage', 'guest.toolsRunningStatus']
 
 
 def show_jumpbox(username):
@@ -23,37 +36,111 @@ def show_jumpbox(username):
     :type username: String
     """
     info = {}
-    with vCenter(host=const.INF_VCENTER_SERVER, user=const.INF_VCENTER_USER, \
-                 password=const.INF_VCENTER_PASSWORD) as vcenter:
-        folder = vcenter.get_by_name(name=username, vimtype=vim.Folder)
-        for vm in folder.childEntity:
-            if vm.name == COMPONENT_NAME:
+    shard = placement.ring.lookup(username, search=has_jumpbox)
+    with metrics.task('show'), sessions.get_pool(shard).session() as vcenter:
+        with metrics.timed('find'):
+            vms = inventory.get_user_vms(vcenter, username, COMPONENT_NAME)
+        for vm in vms:
+            with metrics.timed('get_info'):
                 info = virtual_machine.get_info(vcenter, vm)
-                break
+            break
     return info
 
 
-def delete_jumpbox(username):
+def has_jumpbox(shard, username):
+    """Check a vCenter for the user's jumpbox, when there's no record of where it is
+
+    :Returns: Boolean
+
+    :param shard: Where to look
+    :type shard: vlab_jumpbox_api.lib.placement.Shard
+
+    :param username: The user who owns the jumpbox
+    :type username: String
+    """
+    with metrics.timed('search'), sessions.get_pool(shard).session() as vcenter:
+        return bool(inventory.get_user_vms(vcenter, username, COMPONENT_NAME))
+
+
+def delete_jumpbox(username, wait=True):
     """Unregister and destroy the user's jumpbox
 
-    :Returns: None
+    Every matching VM is hard powered off at the same time, then every one is
+    destroyed at the same time, so a user with several VMs waits about as long
+    as a user with one.
+
+    :Returns: None, or a List of the destroy task ids when ``wait`` is False
 
     :param username: The user who wants to delete their jumpbox
     :type username: String
+
+    :param wait: Set to False to return once vCenter has accepted the destroy
+    :type wait: Boolean
     """
-    with vCenter(host=const.INF_VCENTER_SERVER, user=const.INF_VCENTER_USER, \
-                 password=const.INF_VCENTER_PASSWORD) as vcenter:
-        folder = vcenter.get_by_name(name=username, vimtype=vim.Folder)
-        for entity in folder.childEntity:
-            if entity.name == COMPONENT_NAME:
-                logger.debug('powering off VM')
-                virtual_machine.power(entity, state='off')
-                delete_task = entity.Destroy_Task()
-                logger.debug('blocking while VM is being destroyed')
-                consume_task(delete_task)
+    shard = placement.ring.lookup(username, search=has_jumpbox)
+    with metrics.task('delete'), sessions.get_pool(shard).session() as vcenter:
+        with metrics.timed('find'):
+            vms = inventory.get_user_vms(vcenter, username, COMPONENT_NAME)
+        with metrics.timed('power_off'):
+            logger.debug('powering off VMs')
+            _consume_tasks([x.PowerOffVM_Task() for x in vms if x.runtime.powerState != 'poweredOff'])
+        with metrics.timed('destroy'):
+            delete_tasks = [x.Destroy_Task() for x in vms]
+            if not wait:
+                return [x._moId for x in delete_tasks]
+            logger.debug('blocking while VMs are being destroyed')
+            _consume_tasks(delete_tasks)
+    if vms:
+        placement.ring.release(username)
+
+
+def confirm_delete(username, task_ids):
+    """Wait for destroy tasks started by ``delete_jumpbox(wait=False)`` to finish
 
+    :Returns: None
+
+    :Raises: RuntimeError if any of the tasks failed
+
+    :param username: The user whose jumpbox is being destroyed
+    :type username: String
 
-def create_jumpbox(username, network, image_name='jumpBox-Ubuntu18.04.ova'):
+    :param task_ids: The ids of the vSphere destroy tasks
+    :type task_ids: List
+    """
+    shard = placement.ring.lookup(username, search=has_jumpbox)
+    with metrics.task('confirm_delete'), sessions.get_pool(shard).session() as vcenter:
+        _consume_tasks([vim.Task(x, vcenter.content._stub) for x in task_ids])
+    placement.ring.release(username)
+
+
+def _consume_tasks(the_tasks, timeout=600):
+    """Wait for several vSphere tasks that are all running at the same time
+
+    :Returns: List of the vim.TaskInfo.result of each task
+
+    :Raises: RuntimeError with the first error, after every task has finished
+
+    :param the_tasks: The pyVmomi tasks to wait on
+    :type the_tasks: List
+
+    :param timeout: How many seconds to wait for each task to complete
+    :type timeout: Integer
+    """
+    results = []
+    errors = []
+    for the_task in the_tasks:
+        # The tasks run concurrently in vCenter, so by the time the slowest
+        # one is done waiting, the rest are (nearly) done too.
+        try:
+            results.append(consume_task(the_task, timeout=timeout))
+        except RuntimeError as doh:
+            errors.append(doh)
+    if errors:
+        raise errors[0]
+    return results
+
+
+def create_jumpbox(username, network, image_name=DEFAULT_IMAGE, progress=None):
     """Make a new jumpbox so a user can connect to their lab
 
     :Returns: Dictionary
@@ -63,29 +150,709 @@ def create_jumpbox(username, network, image_name='jumpBox-Ubuntu18.04.ova'):
 
     :param network: The name of the network the jumpbox connects to
     :type network: string
+
+    :param progress: Called with the stage, an estimated percent done, and any details
+                     (like ``bytes_per_second``), as the create moves along
+    :type progress: Function
     """
-    with vCenter(host=const.INF_VCENTER_SERVER, user=const.INF_VCENTER_USER, \
-                 password=const.INF_VCENTER_PASSWORD) as vcenter:
-        ova = Ova(os.path.join(const.VLAB_JUMPBOX_IMAGES_DIR, image_name))
-        try:
-            network_map = vim.OvfManager.NetworkMapping()
-            network_map.name = ova.networks[0]
+    progress = progress or _no_progress
+    shard = placement.ring.place(username, search=has_jumpbox)
+    with metrics.task('create'), sessions.get_pool(shard).session() as vcenter:
+        the_vm = _new_jumpbox(vcenter, shard, username, network, image_name, progress)
+        progress('deployed', DEPLOY_SHARE)
+        _setup_jumpbox(vcenter, the_vm, username, progress=progress)
+        # VMTools will be ready long before the full network stack is up.
+        # Wait for an IP so we can return it
+        with metrics.timed('wait_for_ip'):
+            has_ip = _wait_for_ip(the_vm)
+        if has_ip:
+            if const.VLAB_JUMPBOX_RESET_SNAPSHOT:
+                with metrics.timed('snapshot'):
+                    _take_reset_snapshot(the_vm)
+            progress('ip acquired', 100)
+        else:
+            logger.warning('No IP for {} jumpbox after {} seconds'.format(username, const.VLAB_JUMPBOX_IP_TIMEOUT))
+        with metrics.timed('get_info'):
+            return virtual_machine.get_info(vcenter, the_vm)
+
+
+def reset_jumpbox(username):
+    """Put the user's jumpbox back the way it was right after it was created
+
+    Reverting to the snapshot taken at the end of ``create_jumpbox`` takes
+    seconds, instead of the minutes of a delete and create.
+
+    :Returns: Dictionary
+
+    :Raises: ValueError if the user has no jumpbox, or it has no snapshot to revert to
+
+    :param username: The user who wants a clean jumpbox
+    :type username: String
+    """
+    shard = placement.ring.lookup(username, search=has_jumpbox)
+    with metrics.task('reset'), sessions.get_pool(shard).session() as vcenter:
+        with metrics.timed('find'):
+            vms = inventory.get_user_vms(vcenter, username, COMPONENT_NAME)
+        if not vms:
+            raise ValueError('No jumpbox to reset')
+        the_vm = vms[0]
+        clean = _find_snapshot(the_vm, RESET_SNAPSHOT)
+        if clean is None:
+            raise ValueError('Jumpbox was created without a snapshot to reset to; delete and create it instead')
+        with metrics.timed('revert'):
+            consume_task(clean.RevertToSnapshot_Task())
+        if the_vm.runtime.powerState != 'poweredOn':
+            # Only a snapshot without memory leaves the VM off
+            with metrics.timed('power_on'):
+                consume_task(the_vm.PowerOnVM_Task())
+            with metrics.timed('wait_for_ip'):
+                _wait_for_ip(the_vm)
+        with metrics.timed('get_info'):
+            return virtual_machine.get_info(vcenter, the_vm)
+
+
+def resume_jumpbox(username):
+    """Power on the user's jumpbox if it was suspended, so they can connect to it
+
+    :Returns: Dictionary
+
+    :Raises: ValueError if the user has no jumpbox
+
+    :param username: The user who wants to connect to their jumpbox
+    :type username: String
+    """
+    shard = placement.ring.lookup(username, search=has_jumpbox)
+    with metrics.task('resume'), sessions.get_pool(shard).session() as vcenter:
+        with metrics.timed('find'):
+            vms = inventory.get_user_vms(vcenter, username, COMPONENT_NAME)
+        if not vms:
+            raise ValueError('No jumpbox to connect to')
+        the_vm = vms[0]
+        if the_vm.runtime.powerState != 'poweredOn':
+            # Resuming restores the guest's memory, so it's back on the network in seconds
+            with metrics.timed('power_on'):
+                consume_task(the_vm.PowerOnVM_Task())
+            with metrics.timed('wait_for_ip'):
+                _wait_for_ip(the_vm)
+        with metrics.timed('get_info'):
+            return virtual_machine.get_info(vcenter, the_vm)
+
+
+def suspend_idle():
+    """Suspend every jumpbox that's been idle for longer than its owner allows
+
+    A jumpbox is idle while its CPU use stays at or below ``VLAB_JUMPBOX_IDLE_CPU_MHZ``
+    and the memory its guest is actively using stays at or below ``VLAB_JUMPBOX_IDLE_MEMORY_MB``.
+    How long it can be idle is the owner's idle policy, or ``VLAB_JUMPBOX_IDLE_TIMEOUT``
+    if they haven't chosen one. A jumpbox another worker is changing is left alone.
+
+    :Returns: List - the users whose jumpboxes were suspended
+    """
+    now = time.time()
+    suspended = []
+    for shard in placement.ring.servers():
+        with metrics.task('suspend_idle'), sessions.get_pool(shard).session() as vcenter:
+            with metrics.timed('find'):
+                jumpboxes = inventory.get_jumpboxes(vcenter, COMPONENT_NAME, IDLE_PROPERTIES)
+            idle = [(username, vm) for username, vm, props in jumpboxes if _is_idle(username, props, now)]
+            with metrics.timed('suspend'):
+                # Every suspend runs at the same time; one failing shouldn't stop the rest
+                the_tasks = []
+                for username, vm in idle:
+                    token = cache.try_user_lock(username)
+                    if token is None:
+                        # It's being created, reset or deleted; check again next time
+                        continue
+                    the_tasks.append((username, token, vm.SuspendVM_Task()))
+                for username, token, the_task in the_tasks:
+                    try:
+                        consume_task(the_task)
+                    except RuntimeError as doh:
+                        logger.error('Unable to suspend jumpbox of {}: {}'.format(username, doh))
+                    else:
+                        cache.clear_idle(username)
+                        suspended.append(username)
+                    finally:
+                        cache.release_user_lock(username, token)
+    logger.info('Suspended {} idle jumpboxes'.format(len(suspended)))
+    return sorted(suspended)
+
+
+def _is_idle(username, props, now):
+    """Decide if a jumpbox has been idle for longer than its owner allows
+
+    :Returns: Boolean
+
+    :param username: The user who owns the jumpbox
+    :type username: String
+
+    :param props: The ``IDLE_PROPERTIES`` of the jumpbox
+    :type props: Dictionary
+
+    :param now: The current time, in seconds since the epoch
+    :type now: Float
+    """
+    if props.get('runtime.powerState') != 'poweredOn':
+        # Once it's running again, the idle clock has to start over
+        cache.clear_idle(username)
+        return False
+    if props.get('guest.toolsRunningStatus') == 'guestToolsExecutingScripts':
+        # Still booting, so nobody's had a chance to log in yet
+        cache.clear_idle(username)
+        return False
+    if (props.get('summary.quickStats.overallCpuUsage') or 0) > const.VLAB_JUMPBOX_IDLE_CPU_MHZ:
+        cache.clear_idle(username)
+        return False
+    if (props.get('summary.quickStats.guestMemoryUsage') or 0) > const.VLAB_JUMPBOX_IDLE_MEMORY_MB:
+        # A logged in desktop keeps touching memory, even while the CPU is quiet
+        cache.clear_idle(username)
+        return False
+    timeout = cache.get_idle_policy(username)
+    if timeout is None:
+        timeout = const.VLAB_JUMPBOX_IDLE_TIMEOUT
+    if not timeout:
+        return False
+    return now - cache.mark_idle(username, now) >= timeout
+
+
+def _take_reset_snapshot(the_vm):
+    """Snapshot a freshly provisioned jumpbox, memory and all, so a reset doesn't have to boot it
+
+    :Returns: None
+
+    :param the_vm: The new jumpbox
+    :type the_vm: vim.VirtualMachine
+    """
+    task = the_vm.CreateSnapshot_Task(name=RESET_SNAPSHOT,
+                                      description='Resetting the jumpbox reverts to this snapshot',
+                                      memory=True,
+                                      quiesce=False)
+    consume_task(task)
+
+
+def _find_snapshot(the_vm, name):
+    """Look up one of a VM's snapshots by name
+
+    :Returns: vim.vm.Snapshot, or None if there's no such snapshot
+
+    :param the_vm: The VM with the snapshot
+    :type the_vm: vim.VirtualMachine
+
+    :param name: The name of the snapshot
+    :type name: String
+    """
+    if the_vm.snapshot is None:
+        return None
+    pending = list(the_vm.snapshot.rootSnapshotList)
+    while pending:
+        tree = pending.pop()
+        if tree.name == name:
+            return tree.snapshot
+        pending.extend(tree.childSnapshotList)
+    return None
+
+
+def _new_jumpbox(vcenter, shard, username, network, image_name, progress):
+    """Claim a jumpbox from the warm pool, or deploy a new one
+
+    :Returns: vim.VirtualMachine
+
+    :param vcenter: The instantiated connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param shard: Where the jumpbox is placed
+    :type shard: vlab_jumpbox_api.lib.placement.Shard
+
+    :param username: The user the jumpbox is for
+    :type username: String
+
+    :param network: The name of the network the jumpbox connects to
+    :type network: string
+
+    :param image_name: The name of the OVA file to deploy
+    :type image_name: String
+
+    :param progress: Called with the stage, and an estimated percent done
+    :type progress: Function
+    """
+    try:
+        # The warm pool is only kept on the primary shard
+        if warm_pool.enabled(network) and image_name == DEFAULT_IMAGE and shard is placement.ring.primary:
+            with metrics.timed('claim_warm'):
+                the_vm = warm_pool.claim(vcenter, username, network, COMPONENT_NAME)
+            if the_vm is not None:
+                return the_vm
+        progress('deploying', 0)
+        return _deploy_jumpbox(vcenter, username, network, image_name, COMPONENT_NAME,
+                               progress=progress, shard=shard)
+    except scheduler.Busy:
+        # The task retries, and still needs the shard it was placed on
+        raise
+    except Exception:
+        # No jumpbox was made, so don't count one against the shard
+        placement.ring.release(username)
+        raise
+
+
+def bulk_create(jumpboxes, image_name=DEFAULT_IMAGE, concurrency=const.VLAB_JUMPBOX_BULK_CONCURRENCY, callback=None):
+    """Create jumpboxes for many users at once
+
+    Deployments run concurrently, and share the worker's pool of vCenter sessions.
+
+    :Returns: Dictionary
+
+    :param jumpboxes: The ``username`` and ``network`` of every jumpbox to make
+    :type jumpboxes: List of Dictionaries
+
+    :param image_name: The name of the OVA file to deploy
+    :type image_name: String
+
+    :param concurrency: The most jumpboxes to create at the same time
+    :type concurrency: Integer
+
+    :param callback: Called with the username and result as each jumpbox finishes
+    :type callback: Function
+    """
+    work = {x['username']: (_locked(create_jumpbox), [x['username'], x['network'], image_name]) for x in jumpboxes}
+    return _run_bulk(work, concurrency, callback)
+
+
+def bulk_delete(usernames, concurrency=const.VLAB_JUMPBOX_BULK_CONCURRENCY, callback=None):
+    """Destroy the jumpboxes of many users at once
+
+    :Returns: Dictionary
+
+    :param usernames: The users whose jumpboxes should be destroyed
+    :type usernames: List
+
+    :param concurrency: The most jumpboxes to delete at the same time
+    :type concurrency: Integer
+
+    :param callback: Called with the username and result as each jumpbox is deleted
+    :type callback: Function
+    """
+    work = {x: (_locked(delete_jumpbox), [x]) for x in usernames}
+    return _run_bulk(work, concurrency, callback)
+
+
+def _locked(func):
+    """Make a per-user function hold that user's lock, like the single user tasks do
+
+    Busy deploy slots are waited out in the thread; the bulk task holds its
+    worker for the whole batch anyway.
+
+    :Returns: Function
+
+    :param func: Takes the username as its first argument
+    :type func: Function
+    """
+    def locked(username, *args, **kwargs):
+        with cache.user_lock(username):
+            return scheduler.wait(func, username, *args, **kwargs)
+    return locked
+
+
+def _run_bulk(work, concurrency, callback):
+    """Call a function for many users, with limited concurrency
+
+    :Returns: Dictionary
+
+    :param work: A mapping of username to the (function, args) to call for that user
+    :type work: Dictionary
+
+    :param concurrency: The most function calls to run at the same time
+    :type concurrency: Integer
+
+    :param callback: Called with the username and result as each call finishes
+    :type callback: Function
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(func, *args): username for username, (func, args) in work.items()}
+        for future in as_completed(futures):
+            username = futures[future]
             try:
-                network_map.network = vcenter.networks[network]
-            except KeyError:
-                raise ValueError('No such network named {}'.format(network))
-            the_vm = virtual_machine.deploy_from_ova(vcenter, ova, [network_map],
-                                                     username, 'jumpBox', logger)
+                results[username] = {'content': future.result(), 'error': None}
+            except (ValueError, RuntimeError) as doh:
+                logger.error('Failed for user {}: {}'.format(username, doh))
+                results[username] = {'content': {}, 'error': '{}'.format(doh)}
+            if callback:
+                callback(username, results[username])
+    return results
+
+
+def refill_warm_pool(networks=warm_pool.NETWORKS, size=const.VLAB_JUMPBOX_WARM_POOL_SIZE,
+                     rate=const.VLAB_JUMPBOX_WARM_POOL_REFILL_RATE):
+    """Deploy jumpboxes until every network has enough warm ones waiting
+
+    :Returns: Dictionary
+
+    :param networks: The networks to keep warm jumpboxes for
+    :type networks: List
+
+    :param size: How many warm jumpboxes to keep per network
+    :type size: Integer
+
+    :param rate: The most jumpboxes to deploy in one call
+    :type rate: Integer
+    """
+    counts = {}
+    with metrics.task('refill_warm_pool'), sessions.get_pool(placement.ring.primary).session() as vcenter:
+        pool = warm_pool.available(vcenter)
+        if not pool:
+            # Make sure the staging folder exists
+            path = '{}/{}'.format(const.INF_VCENTER_TOP_LVL_DIR, const.VLAB_JUMPBOX_WARM_POOL_FOLDER)
+            vcenter.create_vm_folder(path)
+        for network in networks:
+            counts[network] = len(pool.get(network, []))
+            while counts[network] < size and rate > 0:
+                try:
+                    # Never stand in line ahead of users' creates
+                    the_vm = _deploy_jumpbox(vcenter, const.VLAB_JUMPBOX_WARM_POOL_FOLDER,
+                                             network, DEFAULT_IMAGE, warm_pool.new_name(), queue=False)
+                except scheduler.Busy:
+                    # Users' creates come first; the next refill picks up where this one stopped
+                    logger.info('Deploy slots are busy, refilling the warm pool later')
+                    return {'pool': counts, 'stats': warm_pool.stats()}
+                # Only hand out jumpboxes that are completely booted
+                _wait_for_ip(the_vm)
+                warm_pool.mark(the_vm, network)
+                counts[network] += 1
+                rate -= 1
+    return {'pool': counts, 'stats': warm_pool.stats()}
+
+
+def refresh_networks():
+    """Reindex the networks in every vCenter that jumpboxes are placed on
+
+    :Returns: List of the network names
+    """
+    names = set()
+    with metrics.task('refresh_networks'):
+        for shard in placement.ring.servers():
+            with sessions.get_pool(shard).session() as vcenter:
+                names.update(networks.get_index(shard).refresh(vcenter))
+    return sorted(names)
+
+
+def check_vcenters():
+    """Make sure a session to every vCenter works, and time how long it takes
+
+    :Returns: Dictionary - the ``ok``, ``error`` and ``latency_ms`` of each vCenter server
+    """
+    results = {}
+    for shard in placement.ring.servers():
+        start = time.time()
+        result = {'ok': True, 'error': None}
+        try:
+            with sessions.get_pool(shard).session() as vcenter:
+                if vcenter.content.sessionManager.currentSession is None:
+                    raise RuntimeError('Session to {} is not logged in'.format(shard.server))
+        except Exception as doh:
+            # Whatever the login raises, it means vCenter is unusable
+            result['ok'] = False
+            result['error'] = '{}'.format(doh) or doh.__class__.__name__
+        result['latency_ms'] = round((time.time() - start) * 1000, 1)
+        results[shard.server] = result
+    return results
+
+
+def import_template(network, image_name=DEFAULT_IMAGE):
+    """Import an OVA once, so jumpboxes can be deployed as linked clones of it
+
+    :Returns: Dictionary
+
+    :param network: The name of any network the template can connect to
+    :type network: String
+
+    :param image_name: The name of the OVA file to import
+    :type image_name: String
+    """
+    with metrics.task('import_template'), sessions.get_pool(placement.ring.primary).session() as vcenter:
+        template, base_snapshot = templates.find(vcenter, image_name)
+        if template is None:
+            path = '{}/{}'.format(const.INF_VCENTER_TOP_LVL_DIR, const.VLAB_JUMPBOX_TEMPLATE_FOLDER)
+            vcenter.create_vm_folder(path)
+            template = _deploy_from_ova(vcenter, const.VLAB_JUMPBOX_TEMPLATE_FOLDER, network,
+                                        image_name, templates.template_name(image_name),
+                                        power_on=False)
+            templates.snapshot(template)
+        return {'template': templates.template_name(image_name), 'moid': template._moId}
+
+
+def _no_progress(stage, percent, **details):
+    """The progress callback used when the caller doesn't want progress"""
+    pass
+
+
+def _deploy_jumpbox(vcenter, folder_name, network, image_name, machine_name, progress=None, shard=None,
+                    queue=True):
+    """Create a new jumpbox VM, as a linked clone when possible
+
+    :Returns: vim.VirtualMachine
+
+    :param vcenter: The instantiated connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param folder_name: The name of the folder to create the VM in
+    :type folder_name: String
+
+    :param network: The name of the network the jumpbox connects to
+    :type network: string
+
+    :param image_name: The name of the OVA file to deploy
+    :type image_name: String
+
+    :param machine_name: What to name the new VM
+    :type machine_name: String
+
+    :param progress: Called with how far along uploading the OVA is
+    :type progress: Function
+
+    :param shard: Where to deploy the VM. Defaults to the primary shard
+    :type shard: vlab_jumpbox_api.lib.placement.Shard
+
+    :param queue: Set to False to give up on busy deploy slots, instead of waiting in line for them
+    :type queue: Boolean
+    """
+    shard = shard or placement.ring.primary
+    if templates.enabled():
+        template, base_snapshot = templates.find(vcenter, image_name)
+        if template is not None:
+            folder = inventory.get_user_folder(vcenter, folder_name)
+            with scheduler.scheduler.slot(folder_name, machine_name, shard.datastore, uses_images=False, queue=queue):
+                resource_pool, datastore = _locate(vcenter, shard)
+                with metrics.timed('linked_clone'):
+                    return templates.clone(template, base_snapshot, folder, machine_name,
+                                           _get_network(vcenter, network, shard),
+                                           resource_pool=resource_pool, datastore=datastore)
+        logger.warning('No template for {}, falling back to OVA import'.format(image_name))
+    with scheduler.scheduler.slot(folder_name, machine_name, shard.datastore, queue=queue):
+        return _deploy_from_ova(vcenter, folder_name, network, image_name, machine_name,
+                                progress=progress, shard=shard)
+
+
+def _deploy_from_ova(vcenter, folder_name, network, image_name, machine_name, power_on=True, progress=None,
+                     shard=None):
+    """Create a new jumpbox VM by uploading the OVA
+
+    :Returns: vim.VirtualMachine
+
+    :param vcenter: The instantiated connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param folder_name: The name of the folder to create the VM in
+    :type folder_name: String
+
+    :param network: The name of the network the jumpbox connects to
+    :type network: string
+
+    :param image_name: The name of the OVA file to deploy
+    :type image_name: String
+
+    :param machine_name: What to name the new VM
+    :type machine_name: String
+
+    :param power_on: Set to False to leave the new VM powered off
+    :type power_on: Boolean
+
+    :param progress: Called with how far along uploading the OVA is
+    :type progress: Function
+
+    :param shard: Where to deploy the VM. Defaults to the primary shard
+    :type shard: vlab_jumpbox_api.lib.placement.Shard
+    """
+    shard = shard or placement.ring.primary
+    with metrics.timed('open_ova'):
+        ova = images.catalog.open(image_name)
+    try:
+        network_map = vim.OvfManager.NetworkMapping()
+        network_map.name = ova.networks[0]
+        with metrics.timed('get_network'):
+            network_map.network = _get_network(vcenter, network, shard)
+        done = threading.Event()
+        if progress:
+            threading.Thread(target=_watch_deploy, args=(ova, progress, done), daemon=True).start()
+        try:
+            with metrics.timed('deploy_from_ova'):
+                the_vm = _import_ova(vcenter, ova, [network_map], folder_name, machine_name,
+                                     shard, power_on=power_on)
         finally:
-            ova.close()
-        _setup_jumpbox(vcenter, the_vm, username)
-        # VMTools will be ready long before the full network stack is up.
-        # Pause for a moment here so we can return an IP
-        time.sleep(70)
-        return virtual_machine.get_info(vcenter, the_vm)
+            done.set()
+    finally:
+        ova.close()
+    return the_vm
+
+
+def _import_ova(vcenter, ova, network_map, folder_name, machine_name, shard, power_on=True):
+    """Upload an OVA to the resource pool and datastore of a shard
+
+    Like ``virtual_machine.deploy_from_ova``, which always uses the resource
+    pool and datastore set in the environment. The new VM is read from the
+    import lease, instead of searching the folder for it.
+
+    :Returns: vim.VirtualMachine
+
+    :param vcenter: The instantiated connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param ova: The OVA to upload
+    :type ova: vlab_inf_common.vmware.Ova
+
+    :param network_map: Which vCenter network each network in the OVA connects to
+    :type network_map: List of vim.OvfManager.NetworkMapping
+
+    :param folder_name: The name of the folder to create the VM in
+    :type folder_name: String
+
+    :param machine_name: What to name the new VM
+    :type machine_name: String
+
+    :param shard: Where to deploy the VM
+    :type shard: vlab_jumpbox_api.lib.placement.Shard
+
+    :param power_on: Set to False to leave the new VM powered off
+    :type power_on: Boolean
+    """
+    folder = vcenter.get_by_name(name=folder_name, vimtype=vim.Folder)
+    resource_pool, datastore = _locate(vcenter, shard)
+    hosts = [x.key for x in datastore.host if x.mountInfo.accessible and not x.key.runtime.inMaintenanceMode]
+    if not hosts:
+        raise RuntimeError('No host can reach datastore {}'.format(datastore.name))
+    spec_params = vim.OvfManager.CreateImportSpecParams(entityName=machine_name,
+                                                        diskProvisioning='thin',
+                                                        networkMapping=network_map)
+    spec = vcenter.ovf_manager.CreateImportSpec(ovfDescriptor=ova.ovf,
+                                                resourcePool=resource_pool,
+                                                datastore=datastore,
+                                                cisp=spec_params)
+    # Spread the uploads over the hosts, so no one host's network is saturated
+    with scheduler.scheduler.host(folder_name, machine_name, hosts) as host:
+        lease = virtual_machine._get_lease(resource_pool, spec.importSpec, folder, host)
+        the_vm = lease.info.entity
+        logger.debug('Uploading OVA to {} via {}'.format(shard, host.name))
+        ova.deploy(spec, lease, host.name)
+    if power_on:
+        virtual_machine.power(the_vm, state='on')
+    return the_vm
+
+
+def _locate(vcenter, shard):
+    """Find the resource pool and datastore of a shard
+
+    :Returns: Tuple of (vim.ResourcePool, vim.Datastore)
+
+    :Raises: ValueError if either doesn't exist
+
+    :param vcenter: The instantiated connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param shard: Where the jumpbox is placed
+    :type shard: vlab_jumpbox_api.lib.placement.Shard
+    """
+    try:
+        resource_pool = vcenter.resource_pools[shard.resource_pool]
+        datastore = vcenter.datastores[shard.datastore]
+    except KeyError as doh:
+        raise ValueError('Shard {} has no resource pool or datastore named {}'.format(shard.name, doh))
+    if isinstance(datastore, vim.StoragePod):
+        datastore = random.choice(datastore.childEntity)
+    return resource_pool, datastore
+
+
+def _watch_deploy(ova, progress, done):
+    """Report how far along uploading an OVA is, until the upload is done
+
+    :Returns: None
+
+    :param ova: The OVA being deployed
+    :type ova: vlab_inf_common.vmware.Ova
+
+    :param progress: Called with the stage, and an estimated percent done
+    :type progress: Function
 
+    :param done: Set once the deploy is over
+    :type done: threading.Event
+    """
+    while not done.wait(DEPLOY_PROGRESS_INTERVAL):
+        if ova.deploy_progress is not None:
+            details = {}
+            if getattr(ova, 'bytes_per_second', None) is not None:
+                details['bytes_per_second'] = int(ova.bytes_per_second)
+            progress('deploying', int(ova.deploy_progress * DEPLOY_SHARE / 100), **details)
+
+
+def _get_network(vcenter, network, shard=None):
+    """Look up a network by name
+
+    :Returns: vim.Network
+
+    :Raises: ValueError if there's no such network
+
+    :param vcenter: The instantiated connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param network: The name of the network
+    :type network: String
+
+    :param shard: The shard the vCenter belongs to. Defaults to the primary shard
+    :type shard: vlab_jumpbox_api.lib.placement.Shard
+    """
+    return networks.get_index(shard or placement.ring.primary).get(vcenter, network)
+
+
+def _wait_for_ip(the_vm, timeout=const.VLAB_JUMPBOX_IP_TIMEOUT,
+                 interval=const.VLAB_JUMPBOX_IP_POLL_INTERVAL,
+                 max_interval=const.VLAB_JUMPBOX_IP_POLL_MAX_INTERVAL):
+    """Block until the VM has a usable IP, or the timeout is exceeded.
+
+    Polls the guest network state, backing off exponentially between checks
+    so that a slow boot doesn't hammer vCenter.
+
+    :Returns: Boolean
 
-def _setup_jumpbox(vcenter, the_vm, username):
+    :param the_vm: The new jumpbox
+    :type the_vm: vim.VirtualMachine
+
+    :param timeout: The most seconds to wait for an IP
+    :type timeout: Integer
+
+    :param interval: How many seconds to wait after the first check
+    :type interval: Float
+
+    :param max_interval: The longest to ever wait between checks
+    :type max_interval: Float
+    """
+    deadline = time.time() + timeout
+    delay = interval
+    while True:
+        if _has_ip(the_vm):
+            return True
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return False
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_interval)
+
+
+def _has_ip(the_vm):
+    """Determine if any connected NIC of the VM has a non link-local IP
+
+    :Returns: Boolean
+
+    :param the_vm: The VM to inspect
+    :type the_vm: vim.VirtualMachine
+    """
+    for nic in the_vm.guest.net:
+        if not nic.connected:
+            continue
+        for ip in nic.ipAddress:
+            if not ip.startswith('fe80::'):
+                return True
+    return False
+
+
+def _setup_jumpbox(vcenter, the_vm, username, progress=None):
     """Configure the Jumpbox for the end user
 
     :Returns: None
@@ -95,37 +862,20 @@ def _setup_jumpbox(vcenter, the_vm, username):
 
     :param the_vm: The new gateway
     :type the_vm: vim.VirtualMachine
+
+    :param progress: Called with the stage, and an estimated percent done
+    :type progress: Function
     """
-    # Add the note about the type & version of Jumpbox being used
+    # Add the note about the type & version of Jumpbox being used.
+    # The reconfigure doesn't depend on the guest, so let it run while the
+    # guest is being provisioned.
     spec = vim.vm.ConfigSpec()
     spec.annotation = 'ubuntu=18.04'
+    progress = progress or _no_progress
     task = the_vm.ReconfigVM_Task(spec)
-    consume_task(task)
-    # Create an admin user with the same username as the end-user
-    cmd = '/usr/bin/sudo'
-    # SHA 512 version of the letter 'a' (plus the $6$ to denote SHA 512)
-    pw = '$6$qM5mj4O0$x8l6R4T4sH1HJgYt9dw3n2pYO8E0Rs/sqlCfts5/p8o8ZK8aBjfHRlh37xnxIfPZBp.ErfBgnSJcauzP2mxBx.'
-    args = "/usr/sbin/useradd --shell /bin/bash --password '{1}' --create-home --groups sudo --home-dir /home/{0} {0} ".format(username, pw)
-    result = virtual_machine.run_command(vcenter,
-                                         the_vm,
-                                         cmd,
-                                         user='administrator',
-                                         password='a',
-                                         arguments=args)
-    if result.exitCode:
-        error = 'Failed to create user {} in newly deployed jumpbox'.format(username)
-        raise RuntimeError(error)
-
-    # Make the Ubuntu GNOME desktop the default used by xRDP
-    # https://www.hiroom2.com/2018/04/29/ubuntu-1804-xrdp-gnome-en/
-    cmd2 = '/usr/bin/sudo'
-    args2 = '/bin/cp /etc/xrdp/xsessionrc /home/{}/.xsessionrc'.format(username)
-    result2 = virtual_machine.run_command(vcenter,
-                                          the_vm,
-                                          cmd2,
-                                          user='administrator',
-                                          password='a',
-                                          arguments=args2)
-    if result2.exitCode:
-        error = 'Failed to create .xsessionrc file in {} homedir'.format(username)
-        raise RuntimeError(error)
+    with metrics.timed('provision'):
+        provision.run(vcenter, the_vm, username, user='administrator', password='a')
+    progress('user created', 85)
+    with metrics.timed('reconfigure'):
+        consume_task(task)
+    progress('reconfigured', 90)
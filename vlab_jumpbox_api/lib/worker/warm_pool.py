@@ -0,0 +1,172 @@
+# -*- coding: UTF-8 -*-
+"""
+Bookkeeping for a pool of pre-deployed, already booted jumpboxes.
+
+Deploying a jumpbox from the OVA takes minutes. When the warm pool is enabled,
+a periodic task keeps ``VLAB_JUMPBOX_WARM_POOL_SIZE`` powered on jumpboxes per
+network in a staging folder, and ``jumpbox.create`` claims one of those instead
+of deploying a new VM. Each warm jumpbox records the network it's connected to
+in its annotation, so the pool can be inventoried in one batched call.
+
+Only one worker may claim a warm jumpbox, which is enforced in the cache, so
+the warm pool needs a shared cache (``VLAB_JUMPBOX_CACHE_URL``).
+"""
+import uuid
+import threading
+
+import ujson
+from celery.utils.log import get_task_logger
+from vlab_inf_common.vmware import vim, consume_task
+
+from vlab_jumpbox_api.lib import const, cache
+from vlab_jumpbox_api.lib.worker import inventory
+
+
+logger = get_task_logger(__name__)
+logger.setLevel(const.VLAB_JUMPBOX_LOG_LEVEL.upper())
+
+NETWORKS = [x.strip() for x in const.VLAB_JUMPBOX_WARM_POOL_NETWORKS.split(',') if x.strip()]
+CLAIM_TTL = 600
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'deployed': 0}
+
+
+def enabled(network):
+    """Determine if new jumpboxes on a network should come from the warm pool
+
+    :Returns: Boolean
+
+    :param network: The name of the network the jumpbox connects to
+    :type network: String
+    """
+    # A private cache can't stop two workers from claiming the same jumpbox
+    return const.VLAB_JUMPBOX_WARM_POOL_SIZE > 0 and network in NETWORKS and cache.shared()
+
+
+def stats():
+    """Counters about how often creates were served from the warm pool
+
+    :Returns: Dictionary
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _count(name):
+    """Increment one of the warm pool counters"""
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def new_name():
+    """Generate a unique name for a new warm jumpbox
+
+    :Returns: String
+    """
+    return 'jumpBox-warm-{}'.format(uuid.uuid4().hex[:8])
+
+
+def available(vcenter):
+    """Find every warm jumpbox, grouped by the network it's connected to
+
+    :Returns: Dictionary
+
+    :param vcenter: The instantiated connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+    """
+    try:
+        folder = inventory.get_user_folder(vcenter, const.VLAB_JUMPBOX_WARM_POOL_FOLDER)
+    except ValueError:
+        return {}
+    pool = {}
+    for the_vm, props in inventory.retrieve(vcenter, folder, vim.VirtualMachine, ['config.annotation']):
+        try:
+            network = ujson.loads(props.get('config.annotation', ''))['warm_pool']
+        except (ValueError, KeyError, TypeError):
+            # Not done being deployed, or not a warm jumpbox
+            continue
+        pool.setdefault(network, []).append(the_vm)
+    return pool
+
+
+def mark(the_vm, network):
+    """Flag a freshly deployed jumpbox as ready to be claimed
+
+    :Returns: None
+
+    :param the_vm: The new warm jumpbox
+    :type the_vm: vim.VirtualMachine
+
+    :param network: The name of the network the jumpbox connects to
+    :type network: String
+    """
+    spec = vim.vm.ConfigSpec()
+    spec.annotation = ujson.dumps({'warm_pool': network})
+    consume_task(the_vm.ReconfigVM_Task(spec))
+    _count('deployed')
+
+
+def claim(vcenter, username, network, machine_name):
+    """Take a warm jumpbox out of the pool and give it to a user
+
+    :Returns: vim.VirtualMachine, or None if the pool is empty
+
+    :param vcenter: The instantiated connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param username: The user who's getting the jumpbox
+    :type username: String
+
+    :param network: The name of the network the jumpbox connects to
+    :type network: String
+
+    :param machine_name: What to rename the jumpbox to
+    :type machine_name: String
+    """
+    for the_vm in available(vcenter).get(network, []):
+        # Other workers could be claiming from the pool at the same time
+        key = 'jumpbox:warm_pool:claim:{}'.format(the_vm._moId)
+        if not cache.backend.add(key, username, CLAIM_TTL):
+            continue
+        try:
+            _hand_over(vcenter, the_vm, username, machine_name)
+        except Exception as doh:
+            # Let the next claim (or refill) have another go at this one
+            logger.error('Failed to claim warm jumpbox {} for {}: {}'.format(the_vm._moId, username, doh))
+            cache.backend.delete(key)
+            continue
+        logger.info('Claimed warm jumpbox {} for {}'.format(the_vm._moId, username))
+        _count('hits')
+        return the_vm
+    logger.info('Warm pool for network {} is empty'.format(network))
+    _count('misses')
+    return None
+
+
+def _hand_over(vcenter, the_vm, username, machine_name):
+    """Move a warm jumpbox into a user's folder and rename it, or put it back in the pool
+
+    :Returns: None
+
+    :param vcenter: The instantiated connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param the_vm: The warm jumpbox being claimed
+    :type the_vm: vim.VirtualMachine
+
+    :param username: The user who's getting the jumpbox
+    :type username: String
+
+    :param machine_name: What to rename the jumpbox to
+    :type machine_name: String
+    """
+    folder = inventory.get_user_folder(vcenter, username)
+    consume_task(folder.MoveIntoFolder_Task([the_vm]))
+    try:
+        consume_task(the_vm.Rename_Task(machine_name))
+    except Exception:
+        # Don't leave a half claimed jumpbox in the user's folder
+        pool = inventory.get_user_folder(vcenter, const.VLAB_JUMPBOX_WARM_POOL_FOLDER)
+        consume_task(pool.MoveIntoFolder_Task([the_vm]))
+        raise